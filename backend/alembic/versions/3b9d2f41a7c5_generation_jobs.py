@@ -0,0 +1,47 @@
+"""generation_jobs
+
+Revision ID: 3b9d2f41a7c5
+Revises: 57020216c680
+Create Date: 2026-10-17 10:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.features.common.db import GUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9d2f41a7c5'
+down_revision: Union[str, None] = '57020216c680'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('generation_jobs',
+    sa.Column('id', GUID(), nullable=False),
+    sa.Column('owner_user_id', GUID(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('params', sa.JSON(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['owner_user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_generation_jobs_status_created', 'generation_jobs', ['status', 'created_at'], unique=False)
+    op.create_index('ix_generation_jobs_owner_created', 'generation_jobs', ['owner_user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generation_jobs_owner_created', table_name='generation_jobs')
+    op.drop_index('ix_generation_jobs_status_created', table_name='generation_jobs')
+    op.drop_table('generation_jobs')
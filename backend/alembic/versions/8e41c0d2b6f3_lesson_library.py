@@ -0,0 +1,45 @@
+"""lesson_library
+
+Revision ID: 8e41c0d2b6f3
+Revises: 3b9d2f41a7c5
+Create Date: 2026-10-17 11:40:02.507331
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from app.features.common.db import GUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e41c0d2b6f3'
+down_revision: Union[str, None] = '3b9d2f41a7c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('lesson_library_entries',
+    sa.Column('id', GUID(), nullable=False),
+    sa.Column('fingerprint', sa.String(), nullable=False),
+    sa.Column('content_hash', sa.String(), nullable=False),
+    sa.Column('topic', sa.String(), nullable=False),
+    sa.Column('target_language', sa.String(), nullable=False),
+    sa.Column('native_language', sa.String(), nullable=False),
+    sa.Column('level', sa.String(), nullable=False),
+    sa.Column('generation_mode', sa.String(), nullable=True),
+    sa.Column('quality_status', sa.String(), nullable=True),
+    sa.Column('lesson_json', sa.JSON(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('last_hit_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('fingerprint', 'content_hash', name='uq_lesson_library_fingerprint_content')
+    )
+    op.create_index('ix_lesson_library_fingerprint', 'lesson_library_entries', ['fingerprint'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_lesson_library_fingerprint', table_name='lesson_library_entries')
+    op.drop_table('lesson_library_entries')
@@ -0,0 +1,40 @@
+"""llm_cache_maintenance
+
+Revision ID: c4a7e19f5d20
+Revises: 8e41c0d2b6f3
+Create Date: 2026-10-17 14:05:41.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a7e19f5d20'
+down_revision: Union[str, None] = '8e41c0d2b6f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('llm_cache_entries', sa.Column('prompt_gz', sa.LargeBinary(), nullable=True))
+    op.add_column('llm_cache_entries', sa.Column('response_gz', sa.LargeBinary(), nullable=True))
+    op.add_column('llm_cache_entries', sa.Column('size_bytes', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('llm_cache_entries', sa.Column('hit_count', sa.Integer(), server_default=sa.text('0'), nullable=False))
+    op.add_column('llm_cache_entries', sa.Column('last_hit_at', sa.DateTime(timezone=True), nullable=True))
+    op.alter_column('llm_cache_entries', 'response_json', existing_type=sa.JSON(), nullable=True)
+    op.create_index('ix_llm_cache_last_hit_created', 'llm_cache_entries', ['last_hit_at', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    # Compressed-only rows cannot satisfy NOT NULL on response_json; drop them first.
+    op.execute("DELETE FROM llm_cache_entries WHERE response_json IS NULL")
+    op.drop_index('ix_llm_cache_last_hit_created', table_name='llm_cache_entries')
+    op.alter_column('llm_cache_entries', 'response_json', existing_type=sa.JSON(), nullable=False)
+    op.drop_column('llm_cache_entries', 'last_hit_at')
+    op.drop_column('llm_cache_entries', 'hit_count')
+    op.drop_column('llm_cache_entries', 'size_bytes')
+    op.drop_column('llm_cache_entries', 'response_gz')
+    op.drop_column('llm_cache_entries', 'prompt_gz')
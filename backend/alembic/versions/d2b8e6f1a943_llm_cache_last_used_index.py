@@ -0,0 +1,34 @@
+"""llm_cache_last_used_index
+
+Revision ID: d2b8e6f1a943
+Revises: c4a7e19f5d20
+Create Date: 2026-10-17 18:22:10.604512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2b8e6f1a943'
+down_revision: Union[str, None] = 'c4a7e19f5d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Eviction orders by coalesce(last_hit_at, created_at); a plain composite index cannot serve it.
+    op.drop_index('ix_llm_cache_last_hit_created', table_name='llm_cache_entries')
+    op.create_index(
+        'ix_llm_cache_last_used',
+        'llm_cache_entries',
+        [sa.text('coalesce(last_hit_at, created_at)')],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_llm_cache_last_used', table_name='llm_cache_entries')
+    op.create_index('ix_llm_cache_last_hit_created', 'llm_cache_entries', ['last_hit_at', 'created_at'], unique=False)
@@ -7,6 +7,7 @@ from app.core import security
 from app.core.config import settings
 from app.core.exceptions import NeuroGlossException
 from app.core.database import get_db
+from app.core.ai.scheduler import llm_priority_ctx, llm_tier_rank_ctx, tier_rank_for_features
 from app.features.subscriptions.service import SubscriptionService
 from app.features.users.models import User
 from app.features.users.schemas import TokenData
@@ -37,6 +38,20 @@ def subscription_features_for_tier(tier: str) -> dict[str, bool]:
     }
 
 
+def ai_priority(priority: int):
+    """Ставит приоритет и тариф пользователя для очереди запросов к модели на время запроса."""
+
+    async def _dep(
+        current_user: User = Depends(get_current_user),
+        db: AsyncSession = Depends(get_db),
+    ) -> None:
+        tier, _, _ = await SubscriptionService(db).get_subscription_status(user_id=current_user.id)
+        llm_priority_ctx.set(int(priority))
+        llm_tier_rank_ctx.set(tier_rank_for_features(subscription_features_for_tier(tier)))
+
+    return _dep
+
+
 def require_subscription_feature(feature: str):
     async def _dep(
         current_user: User = Depends(get_current_user),
@@ -0,0 +1,31 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.api import deps
+from app.features.users.models import User
+from app.features.ai.cache_maintenance import cache_size_report, evict_llm_cache, llm_cache_hits
+from app.features.ai.schemas import LLMCacheEvictionResult, LLMCacheReport
+
+
+router = APIRouter()
+
+
+@router.get("/admin/cache", response_model=LLMCacheReport)
+async def llm_cache_report(
+    current_user: User = Depends(deps.require_admin),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await cache_size_report(db)
+
+
+@router.post("/admin/cache/evict", response_model=LLMCacheEvictionResult)
+async def llm_cache_evict(
+    current_user: User = Depends(deps.require_admin),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    # Each chunk commits on its own, so sessions come from the request's engine rather than `db` itself.
+    sessions = async_sessionmaker(bind=db.bind, class_=AsyncSession, expire_on_commit=False)
+    await llm_cache_hits.flush(sessions)
+    return await evict_llm_cache(sessions)
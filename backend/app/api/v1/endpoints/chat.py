@@ -1,14 +1,25 @@
+import json
+import logging
 from typing import Any
 
 from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
 from app.api import deps
+from app.core.ai.scheduler import PRIORITY_INTERACTIVE
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.disconnect import run_until_disconnect, stream_until_disconnect
+from app.core.exceptions import NeuroGlossException
 from app.core.rate_limit import limiter
 from app.features.users.models import User
-from app.features.chat.schemas import ChatSessionCreate, ChatSessionOut, ChatSessionDetail, ChatTurnCreate, ChatTurnResponse
+from app.features.chat.schemas import ChatSessionCreate, ChatSessionOut, ChatSessionDetail, ChatTurnCreate, ChatTurnOut, ChatTurnResponse
 from app.features.chat.service import ChatService
+from app.features.memory.schemas import MemoryOut
+
+logger = logging.getLogger(__name__)
 
 
 router = APIRouter()
@@ -57,12 +68,86 @@ async def create_turn(
     body: ChatTurnCreate,
     current_user: User = Depends(deps.get_current_user),
     db: AsyncSession = Depends(deps.get_db),
+    _priority: None = Depends(deps.ai_priority(PRIORITY_INTERACTIVE)),
 ) -> Any:
     svc = ChatService(db)
-    result = await svc.generate_turn(owner_user_id=current_user.id, session_id=session_id, user_message=body.content)
+    # If the client goes away the model call, its retries and the partial turn are abandoned.
+    result = await run_until_disconnect(
+        request,
+        svc.generate_turn(owner_user_id=current_user.id, session_id=session_id, user_message=body.content),
+        operation="chat_turn",
+    )
     return {
         "session": result["session"],
         "user_turn": result["user_turn"],
         "assistant_turns": result["assistant_turns"],
         "memory_used": result["memory_used"],
     }
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _turn_payload(turn) -> dict[str, Any]:
+    return ChatTurnOut.model_validate(turn).model_dump(mode="json")
+
+
+@router.post("/sessions/{session_id}/turn/stream")
+@limiter.limit("30/minute")
+async def create_turn_stream(
+    request: Request,
+    session_id: UUID,
+    body: ChatTurnCreate,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+    _priority: None = Depends(deps.ai_priority(PRIORITY_INTERACTIVE)),
+) -> Any:
+    """Ход чата с потоковой выдачей ответа (Server-Sent Events).
+
+    События: `user_turn`, `delta` (`{"kind": "action"|"dialogue", "text": ...}`),
+    `done` (как ответ `/turn`), `error`.
+    """
+    owner_user_id = current_user.id
+    await ChatService(db).ensure_session_owner(session_id=session_id, owner_user_id=owner_user_id)
+    request_id = getattr(request.state, "request_id", None)
+
+    async def _events():
+        # The stream outlives the request-scoped session, so it owns a separate one.
+        async with AsyncSessionLocal() as stream_db:
+            try:
+                async for event, payload in ChatService(stream_db).stream_turn(
+                    owner_user_id=owner_user_id,
+                    session_id=session_id,
+                    user_message=body.content,
+                ):
+                    if event == "user_turn":
+                        yield _sse(event, _turn_payload(payload))
+                    elif event == "done":
+                        yield _sse(
+                            event,
+                            {
+                                "session": ChatSessionOut.model_validate(payload["session"]).model_dump(mode="json"),
+                                "user_turn": _turn_payload(payload["user_turn"]),
+                                "assistant_turns": [_turn_payload(t) for t in payload["assistant_turns"]],
+                                "memory_used": [
+                                    MemoryOut.model_validate(m).model_dump(mode="json") for m in (payload["memory_used"] or [])
+                                ],
+                            },
+                        )
+                    else:
+                        yield _sse(event, payload)
+            except NeuroGlossException as e:
+                message = e.detail
+                if settings.ENV == "production" and e.status_code >= 500:
+                    message = "Internal Server Error"
+                yield _sse("error", {"code": e.code, "message": message, "request_id": request_id})
+            except Exception:
+                logger.exception("Chat stream failed (session_id=%s)", str(session_id))
+                yield _sse("error", {"code": "internal_error", "message": "Internal Server Error", "request_id": request_id})
+
+    return StreamingResponse(
+        stream_until_disconnect(request, _events(), operation="chat_turn_stream"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,74 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+
+from app.api import deps
+from app.features.users.models import User
+from app.features.jobs.service import GenerationJobService
+from app.features.jobs.schemas import (
+    ChatLearningLessonJobCreate,
+    CoursePathJobCreate,
+    GenerationJobOut,
+    GenerationJobResultOut,
+    LessonJobCreate,
+)
+
+
+router = APIRouter()
+
+
+@router.post("/lesson", response_model=GenerationJobOut, status_code=202)
+async def submit_lesson_job(
+    body: LessonJobCreate,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await GenerationJobService(db).submit_lesson(owner_user_id=current_user.id, body=body)
+
+
+@router.post("/course-path", response_model=GenerationJobOut, status_code=202)
+async def submit_course_path_job(
+    body: CoursePathJobCreate,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await GenerationJobService(db).submit_course_path(owner_user_id=current_user.id, body=body)
+
+
+@router.post("/chat-learning-lesson", response_model=GenerationJobOut, status_code=202)
+async def submit_chat_learning_lesson_job(
+    body: ChatLearningLessonJobCreate,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await GenerationJobService(db).submit_chat_learning_lesson(owner_user_id=current_user.id, body=body)
+
+
+@router.get("/me", response_model=list[GenerationJobOut])
+async def list_jobs(
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+) -> Any:
+    return await GenerationJobService(db).list_for_owner(owner_user_id=current_user.id, skip=skip, limit=limit)
+
+
+@router.get("/{job_id}", response_model=GenerationJobOut)
+async def get_job(
+    job_id: UUID,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await GenerationJobService(db).get_for_owner(job_id=job_id, owner_user_id=current_user.id)
+
+
+@router.get("/{job_id}/result", response_model=GenerationJobResultOut)
+async def get_job_result(
+    job_id: UUID,
+    current_user: User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db),
+) -> Any:
+    return await GenerationJobService(db).get_for_owner(job_id=job_id, owner_user_id=current_user.id)
@@ -6,6 +6,8 @@ from app.api.v1.endpoints import posts
 from app.api.v1.endpoints import themes
 from app.api.v1.endpoints import subscriptions
 from app.api.v1.endpoints import achievements
+from app.api.v1.endpoints import jobs
+from app.api.v1.endpoints import ai
 
 api_router = APIRouter()
 
@@ -22,3 +24,5 @@ api_router.include_router(posts.router, prefix="/posts", tags=["posts"])
 api_router.include_router(themes.router, prefix="/themes", tags=["themes"])
 api_router.include_router(subscriptions.router, prefix="/subscriptions", tags=["subscriptions"])
 api_router.include_router(achievements.router, prefix="/achievements", tags=["achievements"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(ai.router, prefix="/ai", tags=["ai"])
@@ -0,0 +1,265 @@
+"""Ночная предгенерация уроков в библиотеку.
+
+    python -m app.cli.pregenerate --spec path.json --target-language English \\
+        --native-language Russian --level A1 --concurrency 4 --progress data/pregenerate.jsonl
+
+`--spec` — ответ `generate_course_path` (`sections[].units[].topic`), список тем
+или список объектов `{"topic", "target_language", "native_language", "level"}`;
+темы можно добавить и через `--topic`. Уроки пишутся в библиотеку уроков
+(и попутно в `llm_cache_entries`), каждая строка прогресса — JSON.
+Повторный запуск с тем же `--progress` пропускает уже готовые элементы;
+уроки, не попавшие в библиотеку (`needs_review`, `not_stored`), пробуются снова.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable
+
+from app.core.ai.circuit_state import circuit_state
+from app.core.ai.registry import provider_registry
+from app.core.ai.scheduler import PRIORITY_BACKGROUND, llm_priority
+from app.core.exceptions import NeuroGlossException
+from app.features.ai.cache_maintenance import llm_cache_hits
+from app.features.ai.telemetry import ai_event_buffer
+from app.features.common.db import begin_if_needed
+from app.features.lesson_library.service import LessonLibraryService, lesson_fingerprint
+
+
+@dataclass(frozen=True)
+class PregenItem:
+    topic: str
+    target_language: str
+    native_language: str
+    level: str
+    generation_mode: str = "balanced"
+
+    @property
+    def key(self) -> str:
+        fp = lesson_fingerprint(
+            topic=self.topic,
+            target_language=self.target_language,
+            native_language=self.native_language,
+            level=self.level,
+        )
+        return f"{fp}:{self.generation_mode}"
+
+
+def items_from_spec(
+    spec: Any,
+    *,
+    target_language: str | None,
+    native_language: str | None,
+    level: str | None,
+    generation_mode: str,
+) -> list[PregenItem]:
+    raw: list[Any] = []
+    if isinstance(spec, dict) and isinstance(spec.get("sections"), list):
+        for section in spec["sections"]:
+            for unit in (section.get("units") or []) if isinstance(section, dict) else []:
+                if isinstance(unit, dict) and unit.get("topic"):
+                    raw.append(str(unit["topic"]))
+    elif isinstance(spec, list):
+        raw = list(spec)
+    elif spec is not None:
+        raise ValueError("Spec must be a course path ({'sections': [...]}) or a list of topics")
+
+    out: list[PregenItem] = []
+    for entry in raw:
+        fields = entry if isinstance(entry, dict) else {"topic": entry}
+        item = PregenItem(
+            topic=str(fields.get("topic") or "").strip(),
+            target_language=str(fields.get("target_language") or target_language or "").strip(),
+            native_language=str(fields.get("native_language") or native_language or "").strip(),
+            level=str(fields.get("level") or level or "").strip(),
+            generation_mode=str(fields.get("generation_mode") or generation_mode),
+        )
+        if not (item.topic and item.target_language and item.native_language and item.level):
+            raise ValueError(f"Incomplete spec entry: {entry!r}")
+        out.append(item)
+    return out
+
+
+def dedupe(items: Iterable[PregenItem]) -> list[PregenItem]:
+    seen: set[str] = set()
+    out: list[PregenItem] = []
+    for item in items:
+        if item.key not in seen:
+            seen.add(item.key)
+            out.append(item)
+    return out
+
+
+def load_done_keys(progress_path: Path) -> set[str]:
+    done: set[str] = set()
+    if not progress_path.exists():
+        return done
+    with progress_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                # A crash can leave a torn last line.
+                continue
+            if isinstance(row, dict) and row.get("status") == "done" and row.get("key"):
+                done.add(str(row["key"]))
+    return done
+
+
+class _ProgressLog:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = asyncio.Lock()
+
+    async def write(self, row: dict) -> None:
+        line = json.dumps({"ts": datetime.utcnow().isoformat() + "Z", **row}, ensure_ascii=False)
+        async with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+async def run_pregeneration(
+    items: list[PregenItem],
+    *,
+    concurrency: int,
+    progress_path: Path,
+    session_factory=None,
+) -> dict[str, int]:
+    if session_factory is None:
+        from app.core.database import AsyncSessionLocal
+
+        session_factory = AsyncSessionLocal
+
+    progress_path.parent.mkdir(parents=True, exist_ok=True)
+    done = load_done_keys(progress_path)
+    unique = dedupe(items)
+    todo = [it for it in unique if it.key not in done]
+    log = _ProgressLog(progress_path)
+    summary = {
+        "total": len(unique),
+        "skipped": len(unique) - len(todo),
+        "done": 0,
+        "needs_review": 0,
+        "not_stored": 0,
+        "failed": 0,
+    }
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _one(item: PregenItem) -> None:
+        async with sem:
+            started = time.monotonic()
+            base = {
+                "key": item.key,
+                "topic": item.topic,
+                "target_language": item.target_language,
+                "native_language": item.native_language,
+                "level": item.level,
+                "generation_mode": item.generation_mode,
+            }
+            try:
+                async with session_factory() as db:
+                    # Interactive traffic keeps priority over the bulk run in the shared scheduler.
+                    # Commit explicitly: library rows and llm_cache_entries are otherwise rolled back on close.
+                    with llm_priority(PRIORITY_BACKGROUND):
+                        async with begin_if_needed(db):
+                            lesson = await LessonLibraryService(db).get_or_generate(
+                                topic=item.topic,
+                                target_language=item.target_language,
+                                native_language=item.native_language,
+                                level=item.level,
+                                generation_mode=item.generation_mode,
+                            )
+            except Exception as e:
+                summary["failed"] += 1
+                detail = e.detail if isinstance(e, NeuroGlossException) else f"{type(e).__name__}: {e}"
+                await log.write(
+                    {**base, "status": "failed", "error": str(detail)[:500], "latency_ms": int((time.monotonic() - started) * 1000)}
+                )
+                return
+
+            meta = lesson.get("_meta") if isinstance(lesson, dict) and isinstance(lesson.get("_meta"), dict) else {}
+            library = meta.get("library") if isinstance(meta.get("library"), dict) else {}
+            if library.get("hit") or library.get("stored"):
+                status = "done"
+            elif meta.get("quality_status") != "ok":
+                status = "needs_review"
+            else:
+                # Library disabled or the lesson was not kept: a resumed run retries it.
+                status = "not_stored"
+            summary[status] += 1
+            await log.write(
+                {
+                    **base,
+                    "status": status,
+                    "source": "library" if library.get("hit") else "generated",
+                    "stored": bool(library.get("stored")),
+                    "quality_status": meta.get("quality_status"),
+                    "latency_ms": int((time.monotonic() - started) * 1000),
+                }
+            )
+
+    try:
+        await asyncio.gather(*(_one(it) for it in todo))
+    finally:
+        # Cache hits and generation events are buffered in memory; a CLI run has no lifespan to flush them.
+        await llm_cache_hits.flush(session_factory)
+        await ai_event_buffer.flush(session_factory)
+    return summary
+
+
+async def _run_and_close(items: list[PregenItem], **kwargs) -> dict[str, int]:
+    try:
+        return await run_pregeneration(items, **kwargs)
+    finally:
+        await provider_registry.aclose()
+        await circuit_state.aclose()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m app.cli.pregenerate", description="Bulk lesson pre-generation")
+    p.add_argument("--spec", type=Path, help="JSON: course path output or a list of topics/items")
+    p.add_argument("--topic", action="append", default=[], help="Extra topic (repeatable)")
+    p.add_argument("--target-language")
+    p.add_argument("--native-language")
+    p.add_argument("--level")
+    p.add_argument("--mode", choices=["fast", "balanced", "strict"], default="balanced")
+    p.add_argument("--concurrency", type=int, default=4)
+    p.add_argument("--progress", type=Path, default=Path("./data/pregenerate.jsonl"))
+    return p
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    spec = json.loads(args.spec.read_text(encoding="utf-8")) if args.spec else None
+    common = {
+        "target_language": args.target_language,
+        "native_language": args.native_language,
+        "level": args.level,
+        "generation_mode": args.mode,
+    }
+    try:
+        items = items_from_spec(spec, **common) + items_from_spec(list(args.topic), **common)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    if not items:
+        print("Nothing to generate: pass --spec and/or --topic", file=sys.stderr)
+        return 2
+
+    summary = asyncio.run(_run_and_close(items, concurrency=args.concurrency, progress_path=args.progress))
+    print(json.dumps(summary, ensure_ascii=False))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
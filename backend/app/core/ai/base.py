@@ -1,5 +1,6 @@
+import json
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator
 
 class LLMProvider(ABC):
     @abstractmethod
@@ -16,3 +17,11 @@ class LLMProvider(ABC):
     async def generate_chat(self, messages: List[Dict[str, str]], *, temperature: float | None = None) -> str:
         """Генерация чатового ответа от LLM на основе истории сообщений"""
         pass
+
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        """Потоковая генерация JSON: отдаёт сырые фрагменты текста ответа.
+
+        Провайдеры без поддержки стриминга отдают весь ответ одним фрагментом.
+        """
+        data = await self.generate_json(prompt, temperature=temperature)
+        yield json.dumps(data, ensure_ascii=False)
@@ -0,0 +1,86 @@
+"""Кэш ответов модели в памяти процесса.
+
+Первый уровень перед таблицей `llm_cache_entries`: ключ — тот же хэш промпта,
+вытеснение по размеру (LRU) и по времени жизни (TTL).
+"""
+
+from __future__ import annotations
+
+import copy
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.core.config import settings
+
+
+class LRUTTLCache:
+    def __init__(self, *, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any | None:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        stored_at, value = item
+        if self.ttl_seconds > 0 and (time.monotonic() - stored_at) > self.ttl_seconds:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._data[key] = (time.monotonic(), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class PromptResponseCache(LRUTTLCache):
+    """Хранит джейсон‑ответы; наружу всегда отдаёт копию.
+
+    Валидаторы уроков нормализуют ответ на месте, поэтому общий объект
+    из кэша отдавать нельзя.
+    """
+
+    def get(self, key: str) -> dict | None:
+        value = super().get(key)
+        return copy.deepcopy(value) if value is not None else None
+
+    def set(self, key: str, value: dict) -> None:
+        super().set(key, copy.deepcopy(value))
+
+
+prompt_cache = PromptResponseCache(
+    max_entries=int(getattr(settings, "AI_PROMPT_CACHE_MAX_ENTRIES", 2048) or 0),
+    ttl_seconds=float(getattr(settings, "AI_PROMPT_CACHE_TTL_SECONDS", 3600) or 0),
+)
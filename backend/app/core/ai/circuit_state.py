@@ -0,0 +1,225 @@
+"""Общее состояние предохранителя (circuit breaker) и пауз провайдера.
+
+Состояние хранится вне процесса, чтобы все воркеры uvicorn одновременно
+переставали и снова начинали ходить в модель:
+- `memory` — словарь в процессе (тесты, один воркер)
+- `sqlite` — файл на машине (несколько воркеров локально)
+- `redis` — любой Redis‑совместимый сервер (прод), нужен пакет `redis`
+
+Время — настенное (`time.time()`), потому что его сравнивают разные процессы.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+from app.core.config import settings
+
+
+@dataclass
+class CircuitState:
+    fail_count: int = 0
+    opened_until: float = 0.0
+    backoff_until: float = 0.0
+
+    def blocked_until(self) -> float:
+        return max(self.opened_until, self.backoff_until)
+
+
+class CircuitStateBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> CircuitState | None:
+        pass
+
+    @abstractmethod
+    async def record_failure(self, key: str, *, threshold: int, open_seconds: float) -> CircuitState:
+        pass
+
+    @abstractmethod
+    async def record_success(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    async def set_backoff(self, key: str, until: float) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        return None
+
+
+class MemoryCircuitStateBackend(CircuitStateBackend):
+    def __init__(self) -> None:
+        self._data: dict[str, CircuitState] = {}
+
+    async def get(self, key: str) -> CircuitState | None:
+        return self._data.get(key)
+
+    async def record_failure(self, key: str, *, threshold: int, open_seconds: float) -> CircuitState:
+        st = self._data.setdefault(key, CircuitState())
+        st.fail_count += 1
+        if st.fail_count >= threshold:
+            st.opened_until = time.time() + float(open_seconds)
+        return st
+
+    async def record_success(self, key: str) -> None:
+        st = self._data.get(key)
+        if st is not None:
+            st.fail_count = 0
+            st.opened_until = 0.0
+
+    async def set_backoff(self, key: str, until: float) -> None:
+        st = self._data.setdefault(key, CircuitState())
+        st.backoff_until = max(st.backoff_until, float(until))
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class SqliteCircuitStateBackend(CircuitStateBackend):
+    _DDL = (
+        "CREATE TABLE IF NOT EXISTS ai_circuit_state ("
+        "key TEXT PRIMARY KEY, fail_count INTEGER NOT NULL DEFAULT 0, "
+        "opened_until REAL NOT NULL DEFAULT 0, backoff_until REAL NOT NULL DEFAULT 0)"
+    )
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    async def _connect(self):
+        import aiosqlite
+
+        conn = await aiosqlite.connect(self.path, timeout=5.0)
+        if not self._ready:
+            await conn.execute("PRAGMA journal_mode=WAL")
+            await conn.execute(self._DDL)
+            await conn.commit()
+            self._ready = True
+        return conn
+
+    async def get(self, key: str) -> CircuitState | None:
+        conn = await self._connect()
+        try:
+            cur = await conn.execute(
+                "SELECT fail_count, opened_until, backoff_until FROM ai_circuit_state WHERE key = ?",
+                (key,),
+            )
+            row = await cur.fetchone()
+        finally:
+            await conn.close()
+        if row is None:
+            return None
+        return CircuitState(fail_count=int(row[0]), opened_until=float(row[1]), backoff_until=float(row[2]))
+
+    async def record_failure(self, key: str, *, threshold: int, open_seconds: float) -> CircuitState:
+        opened_until = time.time() + float(open_seconds)
+        conn = await self._connect()
+        try:
+            # Single upsert so concurrent workers never lose an increment.
+            await conn.execute(
+                "INSERT INTO ai_circuit_state (key, fail_count, opened_until) "
+                "VALUES (?, 1, CASE WHEN 1 >= ? THEN ? ELSE 0 END) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "fail_count = fail_count + 1, "
+                "opened_until = CASE WHEN fail_count + 1 >= ? THEN ? ELSE opened_until END",
+                (key, threshold, opened_until, threshold, opened_until),
+            )
+            await conn.commit()
+            cur = await conn.execute(
+                "SELECT fail_count, opened_until, backoff_until FROM ai_circuit_state WHERE key = ?",
+                (key,),
+            )
+            row = await cur.fetchone()
+        finally:
+            await conn.close()
+        return CircuitState(fail_count=int(row[0]), opened_until=float(row[1]), backoff_until=float(row[2]))
+
+    async def record_success(self, key: str) -> None:
+        conn = await self._connect()
+        try:
+            await conn.execute(
+                "UPDATE ai_circuit_state SET fail_count = 0, opened_until = 0 WHERE key = ?",
+                (key,),
+            )
+            await conn.commit()
+        finally:
+            await conn.close()
+
+    async def set_backoff(self, key: str, until: float) -> None:
+        conn = await self._connect()
+        try:
+            await conn.execute(
+                "INSERT INTO ai_circuit_state (key, backoff_until) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET backoff_until = MAX(backoff_until, excluded.backoff_until)",
+                (key, float(until)),
+            )
+            await conn.commit()
+        finally:
+            await conn.close()
+
+
+class RedisCircuitStateBackend(CircuitStateBackend):
+    def __init__(self, url: str, *, prefix: str = "neurogloss:ai:circuit:"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("AI_CIRCUIT_STATE_BACKEND=redis requires the 'redis' package") from e
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def get(self, key: str) -> CircuitState | None:
+        raw = await self._redis.hgetall(self._key(key))
+        if not raw:
+            return None
+        return CircuitState(
+            fail_count=int(raw.get("fail_count") or 0),
+            opened_until=float(raw.get("opened_until") or 0.0),
+            backoff_until=float(raw.get("backoff_until") or 0.0),
+        )
+
+    async def record_failure(self, key: str, *, threshold: int, open_seconds: float) -> CircuitState:
+        k = self._key(key)
+        fail_count = int(await self._redis.hincrby(k, "fail_count", 1))
+        if fail_count >= threshold:
+            await self._redis.hset(k, "opened_until", time.time() + float(open_seconds))
+        # Stale keys go away on their own once nobody is failing.
+        await self._redis.expire(k, max(3600, int(open_seconds) * 10))
+        return await self.get(key) or CircuitState(fail_count=fail_count)
+
+    async def record_success(self, key: str) -> None:
+        await self._redis.hset(self._key(key), mapping={"fail_count": 0, "opened_until": 0})
+
+    async def set_backoff(self, key: str, until: float) -> None:
+        k = self._key(key)
+        current = float(await self._redis.hget(k, "backoff_until") or 0.0)
+        if float(until) > current:
+            await self._redis.hset(k, "backoff_until", float(until))
+        await self._redis.expire(k, max(3600, int(float(until) - time.time()) + 60))
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
+
+
+def build_circuit_state_backend() -> CircuitStateBackend:
+    kind = str(getattr(settings, "AI_CIRCUIT_STATE_BACKEND", "memory") or "memory").strip().lower()
+    if kind == "sqlite":
+        path = str(getattr(settings, "AI_CIRCUIT_STATE_SQLITE_PATH", "./data/ai_circuit_state.sqlite3"))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return SqliteCircuitStateBackend(path)
+    if kind == "redis":
+        url = getattr(settings, "AI_CIRCUIT_STATE_REDIS_URL", None)
+        if not url:
+            raise RuntimeError("AI_CIRCUIT_STATE_REDIS_URL is not set")
+        return RedisCircuitStateBackend(str(url))
+    return MemoryCircuitStateBackend()
+
+
+circuit_state = build_circuit_state_backend()
@@ -0,0 +1,144 @@
+"""Обёртка провайдера, которая подмешивает сбои по сценарию.
+
+Нужна для стендов и нагрузочных прогонов: проверить, как цикл повторов,
+разбор `retry after` и предохранитель ведут себя при реальной смеси ошибок.
+Сбои имитируют то, что приходит от «Грока», текстом сообщения — именно по
+нему `AIService` решает, повторять ли вызов.
+
+Сценарий — строка:
+- по шагам, по кругу: `ok*5,429:2*2,timeout,503*3,malformed,slow:1500`
+- случайно с долями: `random:429=0.05,503=0.02,timeout=0.01,malformed=0.01,slow=0.05`
+
+Аргумент после двоеточия: для `429` — секунды в «try again in», для `timeout`
+и `slow` — миллисекунды ожидания.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.ai.base import LLMProvider
+
+FAULT_KINDS = ("ok", "429", "timeout", "503", "malformed", "slow")
+
+_DEFAULT_ARG = {"429": 1.0, "timeout": 0.0, "slow": 1000.0}
+
+
+@dataclass(frozen=True)
+class Fault:
+    kind: str = "ok"
+    arg: float | None = None
+
+    @property
+    def value(self) -> float:
+        return float(self.arg if self.arg is not None else _DEFAULT_ARG.get(self.kind, 0.0))
+
+
+def _parse_fault(token: str) -> Fault:
+    kind, _, arg = token.strip().partition(":")
+    kind = kind.strip().lower()
+    if kind not in FAULT_KINDS:
+        raise ValueError(f"Unknown fault kind: {kind!r} (expected one of {', '.join(FAULT_KINDS)})")
+    return Fault(kind, float(arg) if arg else None)
+
+
+class FaultSchedule:
+    def __init__(self, steps: list[Fault] | None = None, *, weights: list[tuple[Fault, float]] | None = None, seed: int = 0):
+        self.steps = list(steps or [])
+        self.weights = list(weights or [])
+        self._rng = random.Random(seed)
+        self._i = 0
+
+    @classmethod
+    def parse(cls, spec: str, *, seed: int = 0) -> "FaultSchedule":
+        spec = str(spec or "").strip()
+        if spec.lower().startswith("random:"):
+            weights = []
+            for part in spec[len("random:"):].split(","):
+                if not part.strip():
+                    continue
+                token, _, share = part.partition("=")
+                weights.append((_parse_fault(token), float(share)))
+            if sum(w for _, w in weights) > 1.0:
+                raise ValueError("Fault shares add up to more than 1")
+            return cls(weights=weights, seed=seed)
+        steps: list[Fault] = []
+        for part in spec.split(","):
+            if not part.strip():
+                continue
+            token, _, times = part.partition("*")
+            steps.extend([_parse_fault(token)] * int(times or 1))
+        return cls(steps or [Fault()], seed=seed)
+
+    def next(self) -> Fault:
+        if self.weights:
+            roll = self._rng.random()
+            for fault, share in self.weights:
+                if roll < share:
+                    return fault
+                roll -= share
+            return Fault()
+        fault = self.steps[self._i % len(self.steps)]
+        self._i += 1
+        return fault
+
+
+class FaultInjectingProvider(LLMProvider):
+    def __init__(self, inner: LLMProvider, schedule: FaultSchedule | str, *, seed: int = 0):
+        self.inner = inner
+        self.model = getattr(inner, "model", None)
+        self.schedule = schedule if isinstance(schedule, FaultSchedule) else FaultSchedule.parse(schedule, seed=seed)
+        self.injected: dict[str, int] = {k: 0 for k in FAULT_KINDS}
+
+    async def _before(self) -> Fault:
+        """Выбирает сбой для вызова и выполняет ту его часть, что идёт до ответа."""
+        fault = self.schedule.next()
+        self.injected[fault.kind] += 1
+        if fault.kind == "429":
+            raise RuntimeError(
+                "Error code: 429 - {'error': {'message': 'Rate limit reached (injected). "
+                f"Please try again in {fault.value:g}s.', 'type': 'tokens', 'code': 'rate_limit_exceeded'}}}}"
+            )
+        if fault.kind == "503":
+            raise RuntimeError("Error code: 503 - service unavailable (injected)")
+        if fault.kind == "timeout":
+            if fault.value > 0:
+                await asyncio.sleep(fault.value / 1000.0)
+            raise asyncio.TimeoutError("Request timed out (injected)")
+        if fault.kind == "slow":
+            await asyncio.sleep(fault.value / 1000.0)
+        return fault
+
+    async def generate_json(self, prompt: str, *, temperature: float | None = None) -> Dict[str, Any]:
+        fault = await self._before()
+        result = await self.inner.generate_json(prompt, temperature=temperature)
+        if fault.kind == "malformed":
+            raw = json.dumps(result, ensure_ascii=False)
+            # Same error the real provider raises when the model cuts its JSON short.
+            json.loads(raw[: max(1, len(raw) // 2)])
+        return result
+
+    async def generate_text(self, prompt: str, *, temperature: float | None = None) -> str:
+        await self._before()
+        return await self.inner.generate_text(prompt, temperature=temperature)
+
+    async def generate_chat(self, messages: List[Dict[str, str]], *, temperature: float | None = None) -> str:
+        await self._before()
+        return await self.inner.generate_chat(messages, temperature=temperature)
+
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        fault = await self._before()
+        if fault.kind == "malformed":
+            data = await self.inner.generate_json(prompt, temperature=temperature)
+            raw = json.dumps(data, ensure_ascii=False)
+            yield raw[: max(1, len(raw) // 2)]
+            return
+        async for chunk in self.inner.stream_json(prompt, temperature=temperature):
+            yield chunk
+
+    def stats(self) -> dict[str, int]:
+        return dict(self.injected)
@@ -3,28 +3,98 @@
 Отвечает за:
 - вызовы чат‑завершений
 - получение ответа в формате джейсон (в т.ч. запасной режим при ошибке строгого режима)
+- потоковую выдачу джейсон‑ответа фрагментами
+- ограничения активного профиля генерации (`max_tokens`, таймаут попытки, общий срок)
 """
 
 import json
 import asyncio
-from groq import AsyncGroq
+import httpx
+from groq import APIStatusError, AsyncGroq
 from app.core.config import settings
 from app.core.ai.base import LLMProvider
-from typing import List, Dict, Any
+from app.core.ai.profiles import current_profile
+from app.core.ai.prompt_packer import estimate_tokens
+from app.core.ai.rate_budget import rate_budget
+from app.core.ai.scheduler import llm_scheduler
+from typing import List, Dict, Any, AsyncIterator, Callable
 import logging
 
 logger = logging.getLogger(__name__)
 
 class GroqProvider(LLMProvider):
-    def __init__(self, model: str = "llama-3.3-70b-versatile"):
+    def __init__(
+        self,
+        model: str = "llama-3.3-70b-versatile",
+        *,
+        http_client: httpx.AsyncClient | None = None,
+        http_client_factory: Callable[[], httpx.AsyncClient] | None = None,
+    ):
         self.api_key = settings.GROQ_API_KEY
         if not self.api_key:
             logger.warning("GROQ_API_KEY is not set.")
-        self.client = AsyncGroq(api_key=self.api_key or "DUMMY")
-        
+        self._http_client = http_client
+        # With a factory the provider follows the shared pool: a pool closed on shutdown is rebuilt on next use.
+        self._http_client_factory = http_client_factory
+        self._client: AsyncGroq | None = None
+        self._bound_http_client: httpx.AsyncClient | None = None
+
         self.model = model
         logger.debug("Selected Groq model: %s", self.model)
 
+    @property
+    def client(self) -> AsyncGroq:
+        http_client = self._http_client_factory() if self._http_client_factory else self._http_client
+        if self._client is None or http_client is not self._bound_http_client:
+            self._client = AsyncGroq(api_key=self.api_key or "DUMMY", http_client=http_client)
+            self._bound_http_client = http_client
+        return self._client
+
+    def _estimate_request_tokens(self, kwargs: dict) -> int:
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in (kwargs.get("messages") or []))
+        output_tokens = int(
+            kwargs.get("max_tokens") or getattr(settings, "AI_RATE_BUDGET_OUTPUT_TOKENS", 1024) or 1024
+        )
+        return prompt_tokens + output_tokens
+
+    @staticmethod
+    def _limits() -> tuple[float, float, dict]:
+        """(таймаут ответа/открытия потока, таймаут всей попытки, доп. параметры запроса) по активному профилю."""
+        timeout = float(getattr(settings, "AI_REQUEST_TIMEOUT_SECONDS", 30) or 30)
+        total_timeout = max(timeout, timeout * 4.0)
+        active = current_profile()
+        if active is None:
+            return timeout, total_timeout, {}
+        total_timeout = active.attempt_timeout(total_timeout)
+        if total_timeout <= 0:
+            raise asyncio.TimeoutError(f"Generation deadline exceeded (operation={active.profile.operation})")
+        extra = {"max_tokens": int(active.profile.max_tokens)} if active.profile.max_tokens else {}
+        return min(timeout, total_timeout), total_timeout, extra
+
+    async def _wait_for_budget(self, kwargs: dict) -> None:
+        # Checked before taking a scheduler slot: a request sleeping on the budget must not hold
+        # a slot that higher-priority callers of the same model are queued for.
+        await rate_budget.wait(self.model, self._estimate_request_tokens(kwargs))
+
+    async def _send(self, *, timeout: float, **kwargs):
+        """Запрос внутри слота планировщика; заголовки ответа обновляют бюджет модели."""
+        rate_budget.reserve(self.model, self._estimate_request_tokens(kwargs))
+        try:
+            raw = await asyncio.wait_for(
+                self.client.chat.completions.with_raw_response.create(model=self.model, **kwargs),
+                timeout=timeout,
+            )
+        except APIStatusError as e:
+            rate_budget.observe(self.model, e.response.headers)
+            raise
+        rate_budget.observe(self.model, raw.headers)
+        return await raw.parse()
+
+    async def _create(self, *, timeout: float, **kwargs):
+        await self._wait_for_budget(kwargs)
+        async with llm_scheduler.slot(self.model):
+            return await self._send(timeout=timeout, **kwargs)
+
     async def _ensure_client(self):
         if not self.api_key:
             raise ValueError("GROQ_API_KEY is not set")
@@ -47,25 +117,20 @@ class GroqProvider(LLMProvider):
                 raise ValueError("No JSON object found in response")
             return text[start : end + 1]
 
-        timeout = float(getattr(settings, "AI_REQUEST_TIMEOUT_SECONDS", 30) or 30)
-                                                                                                          
-                                                                                     
-        total_timeout = max(timeout, timeout * 4.0)
+        _, total_timeout, extra = self._limits()
         max_chars = int(getattr(settings, "AI_MAX_RESPONSE_CHARS", 200000) or 200000)
 
         try:
-            chat_completion = await asyncio.wait_for(
-                self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt,
-                        }
-                    ],
-                    model=self.model,
-                    response_format={"type": "json_object"},
-                    **({"temperature": float(temperature)} if temperature is not None else {}),
-                ),
+            chat_completion = await self._create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                response_format={"type": "json_object"},
+                **({"temperature": float(temperature)} if temperature is not None else {}),
+                **extra,
                 timeout=total_timeout,
             )
             content = chat_completion.choices[0].message.content
@@ -87,17 +152,17 @@ class GroqProvider(LLMProvider):
                 raise
 
             logger.warning("Groq strict JSON mode failed, retrying without response_format")
-            chat_completion = await asyncio.wait_for(
-                self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt + "\n\nIMPORTANT: Output ONLY valid JSON.",
-                        }
-                    ],
-                    model=self.model,
-                    **({"temperature": float(temperature)} if temperature is not None else {}),
-                ),
+            # The retry gets whatever is left of the profile deadline, not a fresh attempt timeout.
+            _, total_timeout, extra = self._limits()
+            chat_completion = await self._create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt + "\n\nIMPORTANT: Output ONLY valid JSON.",
+                    }
+                ],
+                **({"temperature": float(temperature)} if temperature is not None else {}),
+                **extra,
                 timeout=total_timeout,
             )
             content = chat_completion.choices[0].message.content
@@ -106,23 +171,75 @@ class GroqProvider(LLMProvider):
             extracted = _extract_json_object(content)
             return json.loads(extracted)
 
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        await self._ensure_client()
+        prompt = prompt + "\n\nIMPORTANT: Output ONLY valid JSON."
+
+        timeout, total_timeout, extra = self._limits()
+        max_chars = int(getattr(settings, "AI_MAX_RESPONSE_CHARS", 200000) or 200000)
+
+        request = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            "stream": True,
+            **({"temperature": float(temperature)} if temperature is not None else {}),
+            **extra,
+        }
+        await self._wait_for_budget(request)
+        # The connection stays busy for the whole stream, so the slot is held until it ends.
+        async with llm_scheduler.slot(self.model):
+            try:
+                stream = await self._send(**request, timeout=timeout)
+            except Exception:
+                logger.exception("Groq API JSON Stream Error")
+                raise
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + total_timeout
+            received = 0
+            iterator = stream.__aiter__()
+            try:
+                while True:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError("Groq stream timed out")
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), timeout=remaining)
+                    except StopAsyncIteration:
+                        break
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content or ""
+                    if not delta:
+                        continue
+                    received += len(delta)
+                    if received > max_chars:
+                        raise ValueError("Groq response too large")
+                    yield delta
+            finally:
+                try:
+                    await stream.close()
+                except Exception:
+                    pass
+
     async def generate_text(self, prompt: str, *, temperature: float | None = None) -> str:
         await self._ensure_client()
-        timeout = float(getattr(settings, "AI_REQUEST_TIMEOUT_SECONDS", 30) or 30)
-        total_timeout = max(timeout, timeout * 4.0)
+        _, total_timeout, extra = self._limits()
         max_chars = int(getattr(settings, "AI_MAX_RESPONSE_CHARS", 200000) or 200000)
         try:
-            chat_completion = await asyncio.wait_for(
-                self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt,
-                        }
-                    ],
-                    model=self.model,
-                    **({"temperature": float(temperature)} if temperature is not None else {}),
-                ),
+            chat_completion = await self._create(
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ],
+                **({"temperature": float(temperature)} if temperature is not None else {}),
+                **extra,
                 timeout=total_timeout,
             )
             content = chat_completion.choices[0].message.content
@@ -135,16 +252,13 @@ class GroqProvider(LLMProvider):
 
     async def generate_chat(self, messages: List[Dict[str, str]], *, temperature: float | None = None) -> str:
         await self._ensure_client()
-        timeout = float(getattr(settings, "AI_REQUEST_TIMEOUT_SECONDS", 30) or 30)
-        total_timeout = max(timeout, timeout * 4.0)
+        _, total_timeout, extra = self._limits()
         max_chars = int(getattr(settings, "AI_MAX_RESPONSE_CHARS", 200000) or 200000)
         try:
-            chat_completion = await asyncio.wait_for(
-                self.client.chat.completions.create(
-                    messages=messages,
-                    model=self.model,
-                    **({"temperature": float(temperature)} if temperature is not None else {}),
-                ),
+            chat_completion = await self._create(
+                messages=messages,
+                **({"temperature": float(temperature)} if temperature is not None else {}),
+                **extra,
                 timeout=total_timeout,
             )
             content = chat_completion.choices[0].message.content
@@ -0,0 +1,121 @@
+"""Хеджирование запросов к модели (включается по операциям).
+
+Если основная модель не ответила за заданный перцентиль задержки операции,
+тот же промпт отправляется следующему кандидату из `GROQ_FALLBACK_MODELS`.
+Побеждает первый успешный ответ, проигравший запрос отменяется.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from app.core.config import settings
+
+
+class LatencyTracker:
+    def __init__(self, *, window: int = 256):
+        self.window = max(1, int(window))
+        self._samples: dict[str, deque[float]] = {}
+
+    def observe(self, operation: str, seconds: float) -> None:
+        samples = self._samples.get(operation)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[operation] = samples
+        samples.append(max(0.0, float(seconds)))
+
+    def count(self, operation: str) -> int:
+        return len(self._samples.get(operation) or ())
+
+    def percentile(self, operation: str, q: float) -> float | None:
+        samples = self._samples.get(operation)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        q = min(1.0, max(0.0, float(q)))
+        idx = max(0, math.ceil(q * len(ordered)) - 1)
+        return ordered[idx]
+
+    def clear(self) -> None:
+        self._samples.clear()
+
+
+class HedgePolicy:
+    def __init__(self, tracker: LatencyTracker | None = None):
+        self.tracker = tracker or LatencyTracker()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @staticmethod
+    def enabled_operations() -> set[str]:
+        return {str(op).strip() for op in (getattr(settings, "AI_HEDGE_OPERATIONS", None) or []) if str(op).strip()}
+
+    def observe(self, operation: str | None, seconds: float) -> None:
+        if operation:
+            self.tracker.observe(operation, seconds)
+
+    def delay_for(self, operation: str | None) -> float | None:
+        """Через сколько секунд запускать запасной запрос; `None` — хеджирование выключено."""
+        if not operation or operation not in self.enabled_operations():
+            return None
+
+        min_delay = float(getattr(settings, "AI_HEDGE_MIN_DELAY_SECONDS", 0.5) or 0.0)
+        max_delay = float(getattr(settings, "AI_HEDGE_MAX_DELAY_SECONDS", 8.0) or 0.0)
+        min_samples = int(getattr(settings, "AI_HEDGE_MIN_SAMPLES", 20) or 0)
+        q = float(getattr(settings, "AI_HEDGE_PERCENTILE", 0.95) or 0.95)
+
+        # Until there is enough history, hedge only requests that are clearly slow.
+        if self.tracker.count(operation) < min_samples:
+            return max_delay
+        observed = self.tracker.percentile(operation, q)
+        if observed is None:
+            return max_delay
+        return min(max_delay, max(min_delay, observed))
+
+    async def race(
+        self,
+        primary: Callable[[], Awaitable[Any]],
+        secondary: Callable[[], Awaitable[Any]],
+        *,
+        delay: float,
+    ) -> tuple[Any, bool]:
+        """Возвращает `(result, hedge_won)`; если оба запроса упали — последнюю ошибку."""
+        tasks: list[asyncio.Future] = [asyncio.ensure_future(primary())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=max(0.0, float(delay)))
+            if done and tasks[0].exception() is None:
+                return tasks[0].result(), False
+
+            # Primary is slow or has already failed: the backup candidate goes now.
+            tasks.append(asyncio.ensure_future(secondary()))
+            self.hedged += 1
+
+            last_exc: BaseException | None = tasks[0].exception() if tasks[0].done() else None
+            pending = {t for t in tasks if not t.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in tasks:
+                    if t not in done:
+                        continue
+                    if t.exception() is None:
+                        won = t is tasks[1]
+                        if won:
+                            self.hedge_wins += 1
+                        return t.result(), won
+                    last_exc = t.exception()
+            raise last_exc or RuntimeError("hedged request failed")
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+                elif not t.cancelled():
+                    t.exception()
+
+    def stats(self) -> dict[str, int]:
+        return {"hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+hedge_policy = HedgePolicy()
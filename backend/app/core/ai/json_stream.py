@@ -0,0 +1,395 @@
+"""Разбор джейсон‑ответа модели по мере поступления токенов.
+
+Используется потоковыми эндпойнтами: позволяет отдавать клиенту текст
+строковых полей верхнего уровня (например `dialogue`/`action`) до того,
+как модель закончит весь объект.
+
+`JsonShapeValidator` проверяет синтаксис и форму объекта (обязательные
+ключи, типы значений) прямо по потоку и бросает `StreamSchemaError`, как
+только ответ уже не может подойти, — поток можно оборвать и повторить
+запрос, не дожидаясь и не оплачивая остаток ответа.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+
+
+_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+class JsonFieldStreamer:
+    """Достаёт приращения строковых значений заданных ключей верхнего уровня.
+
+    Парсер не строит объект целиком и не валидирует джейсон: он только
+    отслеживает вложенность и строки, чтобы понять, какой ключ сейчас пишется.
+    Итоговый объект нужно разбирать `loads_json_object` по полному тексту.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self._fields = set(fields)
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unicode: str | None = None
+        self._high_surrogate: int | None = None
+        self._expect_key = True
+        self._role: str | None = None
+        self._key_buf: list[str] = []
+        self._key: str | None = None
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        out: list[tuple[str, str]] = []
+
+        def _emit(ch: str) -> None:
+            if self._role == "key":
+                self._key_buf.append(ch)
+                return
+            if self._role == "value" and self._key in self._fields:
+                if out and out[-1][0] == self._key:
+                    out[-1] = (self._key, out[-1][1] + ch)
+                else:
+                    out.append((self._key, ch))
+
+        for ch in chunk or "":
+            if self._in_string:
+                if self._unicode is not None:
+                    self._unicode += ch
+                    if len(self._unicode) < 4:
+                        continue
+                    try:
+                        code = int(self._unicode, 16)
+                    except ValueError:
+                        code = 0xFFFD
+                    self._unicode = None
+                    if 0xD800 <= code <= 0xDBFF:
+                        self._high_surrogate = code
+                        continue
+                    if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+                        code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+                    elif 0xDC00 <= code <= 0xDFFF:
+                        code = 0xFFFD
+                    self._high_surrogate = None
+                    _emit(chr(code))
+                elif self._escape:
+                    self._escape = False
+                    if ch == "u":
+                        self._unicode = ""
+                    else:
+                        _emit(_ESCAPES.get(ch, ch))
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._role == "key":
+                        self._key = "".join(self._key_buf)
+                        self._key_buf = []
+                    elif self._role == "value":
+                        self._key = None
+                    self._role = None
+                else:
+                    _emit(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._role = "key" if self._expect_key else "value"
+                else:
+                    self._role = None
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._expect_key = False
+            elif self._depth == 1 and ch == ",":
+                self._expect_key = True
+                self._key = None
+
+        return out
+
+
+class StreamSchemaError(ValueError):
+    """Ответ модели не подходит под ожидаемую форму; `reason` — короткий код для метрик."""
+
+    def __init__(self, reason: str, message: str):
+        self.reason = reason
+        super().__init__(message)
+
+
+_NUMBER_RE = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+_LITERALS = ("true", "false", "null")
+_LITERAL_KINDS = {"t": "boolean", "f": "boolean", "n": "null", "-": "number", **{d: "number" for d in "0123456789"}}
+
+
+def _json_type(value: Any) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, (int, float)):
+        return "number"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    return "object"
+
+
+@dataclass(frozen=True)
+class JsonShape:
+    """Ожидаемая форма объекта верхнего уровня.
+
+    `fields` — допустимые джейсон‑типы значений по ключам; `required` — ключи,
+    которые должны быть (строки — непустыми); `any_of` — хотя бы один из ключей
+    должен быть непустым. Лишние ключи допускаются, если `extra` истинно.
+    """
+
+    fields: dict[str, tuple[str, ...]] = field(default_factory=dict)
+    required: tuple[str, ...] = ()
+    any_of: tuple[str, ...] = ()
+    extra: bool = True
+
+    def check_key(self, key: str) -> None:
+        if not self.extra and key not in self.fields:
+            raise StreamSchemaError("extra_key", f"Unexpected key {key!r}")
+
+    def check_type(self, key: str, kind: str) -> None:
+        allowed = self.fields.get(key)
+        if allowed and kind not in allowed:
+            raise StreamSchemaError("type", f"Key {key!r} must be {'/'.join(allowed)}, got {kind}")
+
+    def check_complete(self, filled: dict[str, bool]) -> None:
+        missing = [k for k in self.required if not filled.get(k)]
+        if missing:
+            raise StreamSchemaError("missing", f"Missing or empty required keys: {', '.join(missing)}")
+        if self.any_of and not any(filled.get(k) for k in self.any_of):
+            raise StreamSchemaError("missing", f"Expected at least one of: {', '.join(self.any_of)}")
+
+    def validate(self, data: Any) -> None:
+        """Та же проверка для уже разобранного объекта (нестриминговые пути)."""
+        if not isinstance(data, dict):
+            raise StreamSchemaError("not_object", "JSON response is not an object")
+        filled: dict[str, bool] = {}
+        for key, value in data.items():
+            self.check_key(key)
+            self.check_type(key, _json_type(value))
+            filled[key] = bool(value) if isinstance(value, str) else value is not None
+        self.check_complete(filled)
+
+
+class JsonShapeValidator:
+    """Потоковая проверка джейсон‑объекта по `JsonShape`.
+
+    Полноценный токенизатор: ловит синтаксические ошибки на первом неверном
+    символе, тип значения — на его первом символе, пустую обязательную
+    строку — на закрывающей кавычке. Перед `{` допускается короткая
+    преамбула (например, «```json»). После закрытия объекта `complete`
+    истинно, остаток потока можно не читать.
+    """
+
+    def __init__(self, shape: JsonShape, *, max_preamble: int = 64):
+        self.shape = shape
+        self.max_preamble = max_preamble
+        self.complete = False
+        self.consumed = 0
+        self._preamble = 0
+        self._started = False
+        # Open containers ("{" / "["); the top-level object is stack[0].
+        self._stack: list[str] = []
+        # What the next significant character must be.
+        self._expect = "value"
+        self._in_string = False
+        self._escape = False
+        self._unicode = -1
+        self._string_role: str | None = None
+        self._string_len = 0
+        self._key_buf: list[str] = []
+        self._key: str | None = None
+        self._literal: list[str] = []
+        self._filled: dict[str, bool] = {}
+
+    def _fail(self, ch: str) -> None:
+        raise StreamSchemaError("syntax", f"Unexpected {ch!r} at offset {self.consumed}")
+
+    def _top_level(self) -> bool:
+        return len(self._stack) == 1
+
+    def _start_value(self, kind: str) -> None:
+        if self._top_level() and self._key is not None:
+            self.shape.check_type(self._key, kind)
+            if kind != "string":
+                self._filled[self._key] = kind != "null"
+
+    def _end_value(self) -> None:
+        self._expect = "comma_or_end"
+
+    def _finish_literal(self) -> None:
+        token = "".join(self._literal)
+        self._literal = []
+        if token not in _LITERALS and not _NUMBER_RE.fullmatch(token):
+            raise StreamSchemaError("syntax", f"Invalid literal {token!r}")
+        self._end_value()
+
+    def _close(self, ch: str) -> None:
+        opened = self._stack.pop()
+        if (opened, ch) not in (("{", "}"), ("[", "]")):
+            self._fail(ch)
+        if not self._stack:
+            self.shape.check_complete(self._filled)
+            self.complete = True
+            return
+        self._end_value()
+
+    def _feed_string(self, ch: str) -> None:
+        if self._unicode >= 0:
+            if ch not in "0123456789abcdefABCDEF":
+                raise StreamSchemaError("syntax", "Invalid \\u escape")
+            self._unicode += 1
+            if self._unicode == 4:
+                self._unicode = -1
+                self._string_char("?")
+            return
+        if self._escape:
+            self._escape = False
+            if ch == "u":
+                self._unicode = 0
+            elif ch in _ESCAPES:
+                self._string_char(_ESCAPES[ch])
+            else:
+                raise StreamSchemaError("syntax", f"Invalid escape \\{ch}")
+            return
+        if ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            self._end_string()
+        elif ch < " ":
+            raise StreamSchemaError("syntax", "Control character in string")
+        else:
+            self._string_char(ch)
+
+    def _string_char(self, ch: str) -> None:
+        self._string_len += 1
+        if self._string_role == "key":
+            self._key_buf.append(ch)
+
+    def _end_string(self) -> None:
+        if self._string_role == "key":
+            if self._top_level():
+                self._key = "".join(self._key_buf)
+                self.shape.check_key(self._key)
+            self._key_buf = []
+            self._expect = "colon"
+            return
+        if self._string_role == "value" and self._top_level() and self._key is not None:
+            self._filled[self._key] = self._string_len > 0
+            if self._key in self.shape.required and not self._string_len:
+                raise StreamSchemaError("missing", f"Required key {self._key!r} is empty")
+        self._end_value()
+
+    def end(self) -> None:
+        """Поток закончился: объект должен быть закрыт."""
+        if not self.complete:
+            raise StreamSchemaError("truncated", "Response ended before the JSON object was closed")
+
+    def feed(self, chunk: str) -> None:
+        for ch in chunk or "":
+            if self.complete:
+                return
+            self.consumed += 1
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                    self._expect = "key_or_end"
+                    continue
+                self._preamble += 1
+                if self._preamble > self.max_preamble:
+                    raise StreamSchemaError("not_object", "Response does not start with a JSON object")
+                continue
+
+            if self._in_string:
+                self._feed_string(ch)
+                continue
+
+            if self._literal:
+                if ch.isalnum() or ch in "+-.":
+                    self._literal.append(ch)
+                    token = "".join(self._literal)
+                    if token[0].isalpha() and not any(lit.startswith(token) for lit in _LITERALS):
+                        raise StreamSchemaError("syntax", f"Invalid literal {token!r}")
+                    continue
+                self._finish_literal()
+
+            if ch in " \t\r\n":
+                continue
+
+            expect = self._expect
+            if expect in ("key", "key_or_end"):
+                if ch == '"':
+                    self._in_string, self._string_role, self._string_len = True, "key", 0
+                elif ch == "}" and expect == "key_or_end":
+                    self._close(ch)
+                else:
+                    self._fail(ch)
+            elif expect == "colon":
+                if ch != ":":
+                    self._fail(ch)
+                self._expect = "value"
+            elif expect in ("value", "value_or_end"):
+                if ch == "]" and expect == "value_or_end":
+                    self._close(ch)
+                elif ch == '"':
+                    self._start_value("string")
+                    self._in_string, self._string_role, self._string_len = True, "value", 0
+                elif ch == "{":
+                    self._start_value("object")
+                    self._stack.append("{")
+                    self._expect = "key_or_end"
+                elif ch == "[":
+                    self._start_value("array")
+                    self._stack.append("[")
+                    self._expect = "value_or_end"
+                elif ch in _LITERAL_KINDS:
+                    self._start_value(_LITERAL_KINDS[ch])
+                    self._literal.append(ch)
+                else:
+                    self._fail(ch)
+            elif expect == "comma_or_end":
+                if ch == ",":
+                    self._expect = "key" if self._stack[-1] == "{" else "value"
+                    if self._top_level():
+                        self._key = None
+                elif ch in "}]":
+                    self._close(ch)
+                else:
+                    self._fail(ch)
+
+
+def loads_json_object(text: str) -> dict[str, Any]:
+    """Разбор полного ответа: сначала как есть, затем по срезу `{...}`."""
+    try:
+        data = json.loads(text)
+    except Exception:
+        start = (text or "").find("{")
+        end = (text or "").rfind("}")
+        if start == -1 or end == -1 or end <= start:
+            raise ValueError("No JSON object found in response")
+        data = json.loads(text[start : end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("JSON response is not an object")
+    return data
@@ -0,0 +1,67 @@
+"""Маленький DAG этапов генерации.
+
+Этап ждёт только свои зависимости, поэтому независимые этапы (например,
+упражнения по словарю и по тексту) идут параллельно. Время каждого этапа
+пишется в `StageTimings` и попадает в `_meta.stage_timings_ms`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator
+
+
+class StageTimings(dict):
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self[name] = int(self.get(name, 0)) + int((time.monotonic() - started) * 1000)
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[[dict[str, Any]], Awaitable[Any]]
+    deps: tuple[str, ...] = ()
+    optional: bool = False
+
+
+async def run_stages(stages: list[Stage], timings: StageTimings) -> dict[str, Any]:
+    """Запускает этапы (в порядке, где зависимости идут раньше) и возвращает их результаты.
+
+    `fn` получает словарь результатов своих зависимостей. Ошибка обязательного
+    этапа отменяет остальные; у необязательного результат становится `None`.
+    """
+    tasks: dict[str, asyncio.Future] = {}
+
+    async def _run(stage: Stage) -> Any:
+        inputs = {dep: await tasks[dep] for dep in stage.deps}
+        with timings.stage(stage.name):
+            try:
+                return await stage.fn(inputs)
+            except Exception:
+                if stage.optional:
+                    return None
+                raise
+
+    for stage in stages:
+        unknown = [dep for dep in stage.deps if dep not in tasks]
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown/later stages: {unknown}")
+        tasks[stage.name] = asyncio.ensure_future(_run(stage))
+
+    try:
+        results = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+    return dict(zip(tasks.keys(), results))
@@ -0,0 +1,138 @@
+"""Профили генерации по операциям.
+
+Профиль задаёт для операции (ход чата, основа урока, упражнения, починка,
+сводка, план курса…) потолок `max_tokens`, температуру по умолчанию,
+таймаут одной попытки, общий срок на все повторы и фоллбэки и
+предпочтительные модели. Короткие операции перестают платить за
+«разогнавшийся» ответ и не ждут хвостов по общему таймауту.
+
+Активный профиль живёт в контексте (contextvars), как и приоритет
+планировщика: `AIService` открывает его через `generation_profile(...)`,
+а `GroqProvider` читает `current_profile()` при каждом запросе.
+Значения по умолчанию переопределяются настройкой `AI_GENERATION_PROFILES`.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import dataclasses
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+from app.core.config import settings
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    operation: str
+    max_tokens: int | None = None
+    # Used only when the caller does not pass its own temperature.
+    temperature: float | None = None
+    attempt_timeout_seconds: float | None = None
+    deadline_seconds: float | None = None
+    # Tried first, before the primary model and GROQ_FALLBACK_MODELS.
+    models: tuple[str, ...] = ()
+
+
+DEFAULT_PROFILES: dict[str, GenerationProfile] = {
+    p.operation: p
+    for p in (
+        GenerationProfile("chat_turn", max_tokens=600, attempt_timeout_seconds=20, deadline_seconds=45),
+        GenerationProfile("chat_turn_json", max_tokens=700, attempt_timeout_seconds=20, deadline_seconds=45),
+        GenerationProfile("room_turn", max_tokens=400, attempt_timeout_seconds=15, deadline_seconds=40),
+        GenerationProfile("roleplay", max_tokens=500, attempt_timeout_seconds=20, deadline_seconds=45),
+        GenerationProfile("summary", max_tokens=700, temperature=0.3, attempt_timeout_seconds=30, deadline_seconds=60),
+        GenerationProfile("chat_lesson", max_tokens=3000, attempt_timeout_seconds=60, deadline_seconds=150),
+        GenerationProfile("lesson_plan", max_tokens=1024, attempt_timeout_seconds=30, deadline_seconds=90),
+        GenerationProfile("lesson_core", max_tokens=3000, attempt_timeout_seconds=60, deadline_seconds=180),
+        GenerationProfile("vocab_extraction", max_tokens=1500, attempt_timeout_seconds=40, deadline_seconds=120),
+        GenerationProfile("exercises", max_tokens=4096, attempt_timeout_seconds=90, deadline_seconds=240),
+        GenerationProfile("review", max_tokens=1500, temperature=0.1, attempt_timeout_seconds=40, deadline_seconds=90),
+        GenerationProfile("repair", max_tokens=2048, temperature=0.1, attempt_timeout_seconds=30, deadline_seconds=90),
+        GenerationProfile("course_path", max_tokens=3000, attempt_timeout_seconds=60, deadline_seconds=180),
+    )
+}
+
+_FIELDS = {f.name for f in dataclasses.fields(GenerationProfile)} - {"operation"}
+
+
+@dataclass
+class ActiveProfile:
+    """Профиль одной генерации с её общим сроком (по `time.monotonic()`)."""
+
+    profile: GenerationProfile
+    deadline_at: float | None = None
+
+    def remaining(self) -> float | None:
+        if self.deadline_at is None:
+            return None
+        return self.deadline_at - time.monotonic()
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def attempt_timeout(self, default: float) -> float:
+        """Таймаут очередного вызова: таймаут попытки, но не дальше общего срока."""
+        timeout = float(self.profile.attempt_timeout_seconds or default)
+        remaining = self.remaining()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        return timeout
+
+
+class ProfileRegistry:
+    def __init__(self, defaults: dict[str, GenerationProfile] | None = None):
+        self.defaults = dict(DEFAULT_PROFILES if defaults is None else defaults)
+
+    def _fallback(self, operation: str) -> GenerationProfile:
+        # Unknown operations keep the old behaviour: no cap, the global timeout for the whole call.
+        timeout = float(getattr(settings, "AI_REQUEST_TIMEOUT_SECONDS", 30) or 30)
+        return GenerationProfile(operation, attempt_timeout_seconds=max(timeout, timeout * 4.0))
+
+    def get(self, operation: str | None) -> GenerationProfile:
+        operation = str(operation or "default")
+        profile = self.defaults.get(operation) or self._fallback(operation)
+        overrides = (getattr(settings, "AI_GENERATION_PROFILES", None) or {}).get(operation) or {}
+        changes: dict[str, Any] = {k: v for k, v in overrides.items() if k in _FIELDS}
+        if "models" in changes:
+            changes["models"] = tuple(str(m) for m in (changes["models"] or ()))
+        return dataclasses.replace(profile, **changes) if changes else profile
+
+    def start(self, operation: str | None) -> ActiveProfile:
+        profile = self.get(operation)
+        deadline = profile.deadline_seconds
+        return ActiveProfile(profile, time.monotonic() + float(deadline) if deadline else None)
+
+    def stats(self) -> dict[str, dict[str, Any]]:
+        names = set(self.defaults) | set((getattr(settings, "AI_GENERATION_PROFILES", None) or {}))
+        return {name: dataclasses.asdict(self.get(name)) for name in sorted(names)}
+
+
+generation_profiles = ProfileRegistry()
+
+active_profile_ctx: contextvars.ContextVar[ActiveProfile | None] = contextvars.ContextVar(
+    "llm_generation_profile", default=None
+)
+
+
+def current_profile() -> ActiveProfile | None:
+    return active_profile_ctx.get()
+
+
+@contextmanager
+def generation_profile(operation: str | ActiveProfile | None) -> Iterator[ActiveProfile]:
+    """Делает профиль операции активным; повторный вход в ту же операцию сохраняет её срок."""
+    if isinstance(operation, ActiveProfile):
+        active = operation
+    else:
+        current = active_profile_ctx.get()
+        name = str(operation or "default")
+        active = current if current is not None and current.profile.operation == name else generation_profiles.start(name)
+    token = active_profile_ctx.set(active)
+    try:
+        yield active
+    finally:
+        active_profile_ctx.reset(token)
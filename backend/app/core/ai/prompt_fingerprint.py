@@ -0,0 +1,241 @@
+"""Кэш «почти одинаковых» промптов.
+
+Точный кэш (`_compute_prompt_hash`) промахивается из‑за лишнего пробела,
+другого порядка интересов или чуть иного списка `used_words`. Здесь промпт
+описывается отпечатком: неизменные поля (языки, уровень, тема) должны
+совпасть после нормализации, а изменчивые (интересы, списки слов, текст)
+сравниваются по MinHash. Ответ отдаётся, если оценка сходства не ниже
+`AI_SEMANTIC_CACHE_THRESHOLD`, и только для операций из
+`AI_SEMANTIC_CACHE_OPERATIONS`. Каждое такое попадание пишется в журнал аудита.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def normalize_text(value: Any) -> str:
+    text = unicodedata.normalize("NFKC", str(value if value is not None else "")).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def canonical_value(value: Any) -> str:
+    """Списки — без повторов и в отсортированном виде, словари — по ключам, строки — нормализованы."""
+    if isinstance(value, (list, tuple, set)):
+        items = sorted({normalize_text(v) for v in value} - {""})
+        return " ; ".join(items)
+    if isinstance(value, dict):
+        return " ; ".join(f"{normalize_text(k)}={canonical_value(v)}" for k, v in sorted(value.items()))
+    return normalize_text(value)
+
+
+@dataclass(frozen=True)
+class PromptFingerprint:
+    operation: str
+    exact: dict[str, Any] = field(default_factory=dict)
+    fuzzy: dict[str, Any] = field(default_factory=dict)
+
+    def scope_key(self, *, provider: str | None, model: str | None) -> str:
+        exact = {k: canonical_value(v) for k, v in sorted(self.exact.items())}
+        raw = json.dumps([self.operation, provider or "", model or "", exact], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def fuzzy_text(self) -> str:
+        return "\n".join(f"{k}: {canonical_value(v)}" for k, v in sorted(self.fuzzy.items()))
+
+
+def shingles(text: str) -> set[str]:
+    words = text.split()
+    # Short inputs (a theme, a couple of interests) compare word by word.
+    size = 3 if len(words) >= 12 else 1
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = int(num_perm)
+        self._params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(self.num_perm)
+        ]
+
+    def signature(self, items: set[str]) -> tuple[int, ...]:
+        if not items:
+            return tuple([_MAX_HASH] * self.num_perm)
+        base = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in items]
+        return tuple(min(((a * x + b) % _MERSENNE_PRIME) & _MAX_HASH for x in base) for a, b in self._params)
+
+
+def estimate_similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    if not a or len(a) != len(b):
+        return 0.0
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+@dataclass
+class _Entry:
+    scope: str
+    signature: tuple[int, ...]
+    fuzzy_text: str
+    response: dict
+    stored_at: float
+
+
+class SemanticPromptCache:
+    def __init__(self, *, max_entries: int, ttl_seconds: float, num_perm: int = 64, bands: int = 16):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.bands = int(bands)
+        self.rows = max(1, int(num_perm) // self.bands)
+        self.hasher = MinHasher(num_perm=self.rows * self.bands)
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._buckets: dict[tuple, set[int]] = {}
+        self._ids = 0
+        self.hits = 0
+        self.misses = 0
+        self.audit: deque[dict] = deque(maxlen=200)
+
+    @staticmethod
+    def enabled_for(operation: str | None) -> bool:
+        ops = getattr(settings, "AI_SEMANTIC_CACHE_OPERATIONS", None) or []
+        return bool(operation) and operation in ops
+
+    def _band_keys(self, scope: str, signature: tuple[int, ...]):
+        for band in range(self.bands):
+            yield (scope, band, signature[band * self.rows : (band + 1) * self.rows])
+
+    def _drop(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry.scope, entry.signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def get(
+        self,
+        fingerprint: PromptFingerprint,
+        *,
+        provider: str | None,
+        model: str | None,
+        threshold: float | None = None,
+    ) -> dict | None:
+        if threshold is None:
+            threshold = float(getattr(settings, "AI_SEMANTIC_CACHE_THRESHOLD", 0.9) or 0.9)
+        scope = fingerprint.scope_key(provider=provider, model=model)
+        text = fingerprint.fuzzy_text()
+        signature = self.hasher.signature(shingles(text))
+        now = time.monotonic()
+
+        best_id, best_sim = None, -1.0
+        candidates: set[int] = set()
+        for key in self._band_keys(scope, signature):
+            candidates |= self._buckets.get(key, set())
+        for entry_id in candidates:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                continue
+            if self.ttl_seconds > 0 and (now - entry.stored_at) > self.ttl_seconds:
+                self._drop(entry_id)
+                continue
+            sim = 1.0 if entry.fuzzy_text == text else estimate_similarity(signature, entry.signature)
+            if sim > best_sim:
+                best_id, best_sim = entry_id, sim
+
+        if best_id is None or best_sim < threshold:
+            self.misses += 1
+            return None
+
+        entry = self._entries[best_id]
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        self._audit(
+            {
+                "operation": fingerprint.operation,
+                "provider": provider,
+                "model": model,
+                "similarity": round(best_sim, 4),
+                "threshold": threshold,
+                "exact_match": entry.fuzzy_text == text,
+                "query": text[:500],
+                "matched": entry.fuzzy_text[:500],
+            }
+        )
+        return copy.deepcopy(entry.response)
+
+    def set(self, fingerprint: PromptFingerprint, *, provider: str | None, model: str | None, response: dict) -> None:
+        if self.max_entries <= 0 or not isinstance(response, dict):
+            return
+        scope = fingerprint.scope_key(provider=provider, model=model)
+        text = fingerprint.fuzzy_text()
+        signature = self.hasher.signature(shingles(text))
+        for key in list(self._band_keys(scope, signature)):
+            for entry_id in list(self._buckets.get(key, ())):
+                if self._entries[entry_id].fuzzy_text == text:
+                    self._drop(entry_id)
+        self._ids += 1
+        entry_id = self._ids
+        self._entries[entry_id] = _Entry(
+            scope=scope, signature=signature, fuzzy_text=text, response=copy.deepcopy(response), stored_at=time.monotonic()
+        )
+        for key in self._band_keys(scope, signature):
+            self._buckets.setdefault(key, set()).add(entry_id)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def _audit(self, record: dict) -> None:
+        record = {"ts": time.time(), **record}
+        self.audit.append(record)
+        logger.info(
+            "Semantic cache hit op=%s similarity=%.3f threshold=%.2f",
+            record["operation"],
+            record["similarity"],
+            record["threshold"],
+        )
+        path = getattr(settings, "AI_SEMANTIC_CACHE_AUDIT_PATH", None)
+        if path:
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.warning("Failed to write semantic cache audit record", exc_info=True)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets.clear()
+        self.audit.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._entries), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+semantic_cache = SemanticPromptCache(
+    max_entries=int(getattr(settings, "AI_SEMANTIC_CACHE_MAX_ENTRIES", 1024) or 0),
+    ttl_seconds=float(getattr(settings, "AI_SEMANTIC_CACHE_TTL_SECONDS", 3600) or 0),
+)
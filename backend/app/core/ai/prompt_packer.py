@@ -0,0 +1,93 @@
+"""Упаковка контекста в бюджет токенов.
+
+Оценка токенов — быстрая и локальная (по байтам UTF‑8, без токенизатора).
+Секции заполняются по приоритету, каждая в пределах своей квоты; элементы
+внутри секции идут от самых новых к старым.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+from app.core.config import settings
+
+# Per-message framing overhead (role, separators) in the chat transcript.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str | None) -> int:
+    """Грубая оценка сверху: ~4 байта UTF‑8 на токен (кириллица выходит дороже латиницы)."""
+    if not text:
+        return 0
+    return (len(text.encode("utf-8", errors="ignore")) + 3) // 4
+
+
+def context_budget_for_model(model: str | None) -> int:
+    per_model = getattr(settings, "AI_CHAT_CONTEXT_MODEL_TOKENS", None) or {}
+    if model and model in per_model:
+        return int(per_model[model])
+    return int(getattr(settings, "AI_CHAT_CONTEXT_MAX_TOKENS", 6000) or 6000)
+
+
+@dataclass
+class PromptSection:
+    name: str
+    items: list[str]
+    priority: int
+    quota: float | None = None
+    required: bool = False
+    contiguous: bool = False
+
+
+@dataclass
+class PackedPrompt:
+    sections: dict[str, list[int]] = field(default_factory=dict)
+    used_tokens: int = 0
+    budget_tokens: int = 0
+    dropped: dict[str, int] = field(default_factory=dict)
+
+    def kept(self, name: str) -> list[int]:
+        return self.sections.get(name, [])
+
+
+class PromptPacker:
+    def __init__(self, budget_tokens: int):
+        self.budget_tokens = max(0, int(budget_tokens))
+
+    def pack(self, sections: list[PromptSection]) -> PackedPrompt:
+        """Возвращает индексы оставленных элементов каждой секции (в исходном порядке).
+
+        `items` передаются от самого важного/нового к старому. Обязательные секции
+        берутся целиком и занимают бюджет первыми. `contiguous` — остановиться на первом
+        не влезшем элементе (для реплик, чтобы не было дыр в истории).
+        """
+        out = PackedPrompt(budget_tokens=self.budget_tokens)
+        remaining = self.budget_tokens
+
+        for section in sections:
+            if section.required:
+                cost = sum(estimate_tokens(x) + MESSAGE_OVERHEAD_TOKENS for x in section.items)
+                out.sections[section.name] = list(range(len(section.items)))
+                remaining -= cost
+                out.used_tokens += cost
+
+        for section in sorted((s for s in sections if not s.required), key=lambda s: s.priority):
+            cap = remaining
+            if section.quota is not None:
+                cap = min(cap, int(self.budget_tokens * float(section.quota)))
+            kept: list[int] = []
+            spent = 0
+            for i, item in enumerate(section.items):
+                cost = estimate_tokens(item) + MESSAGE_OVERHEAD_TOKENS
+                if spent + cost > cap:
+                    if section.contiguous:
+                        break
+                    continue
+                kept.append(i)
+                spent += cost
+            out.sections[section.name] = sorted(kept)
+            out.dropped[section.name] = len(section.items) - len(kept)
+            remaining -= spent
+            out.used_tokens += spent
+
+        return out
@@ -0,0 +1,168 @@
+"""Учёт лимитов провайдера по заголовкам ответов.
+
+Каждый ответ «Грок» приносит `x-ratelimit-remaining-*` / `x-ratelimit-reset-*`.
+По ним для каждой модели ведётся «ведро» запросов и токенов, которое
+равномерно наполняется до сброса. Перед отправкой запрос списывает оценку
+своих токенов; если их не хватает — ждёт немного или уходит на другую модель,
+не дожидаясь ошибки 429.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Mapping
+
+from app.core.config import settings
+
+
+class RateBudgetExhausted(Exception):
+    def __init__(self, model: str, retry_after: float):
+        self.model = model
+        self.retry_after = float(retry_after)
+        super().__init__(f"Local rate budget exhausted for model={model}; retry after {self.retry_after:.1f}s")
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset_seconds(value: str | None) -> float | None:
+    """`"2m59.56s"`, `"7.66s"`, `"450ms"`, `"12"` → секунды."""
+    if value is None:
+        return None
+    text = str(value).strip().lower()
+    if not text:
+        return None
+    try:
+        return max(0.0, float(text))
+    except ValueError:
+        pass
+    total = 0.0
+    matched = False
+    for amount, unit in _DURATION_PART.findall(text):
+        matched = True
+        n = float(amount)
+        total += {"ms": n / 1000.0, "s": n, "m": n * 60.0, "h": n * 3600.0}[unit]
+    return total if matched else None
+
+
+@dataclass
+class _Bucket:
+    limit: float
+    remaining: float
+    refill_per_second: float
+    updated_at: float
+
+    def available(self, now: float) -> float:
+        return min(self.limit, self.remaining + self.refill_per_second * max(0.0, now - self.updated_at))
+
+    def take(self, amount: float, now: float) -> None:
+        self.remaining = self.available(now) - amount
+        self.updated_at = now
+
+    def seconds_until(self, amount: float, now: float) -> float:
+        missing = amount - self.available(now)
+        if missing <= 0:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return missing / self.refill_per_second
+
+
+def _bucket_from_headers(headers: Mapping[str, str], kind: str, now: float) -> _Bucket | None:
+    remaining_raw = headers.get(f"x-ratelimit-remaining-{kind}")
+    if remaining_raw is None:
+        return None
+    try:
+        remaining = float(remaining_raw)
+    except ValueError:
+        return None
+    try:
+        limit = float(headers.get(f"x-ratelimit-limit-{kind}") or remaining)
+    except ValueError:
+        limit = remaining
+    limit = max(limit, remaining)
+    reset = parse_reset_seconds(headers.get(f"x-ratelimit-reset-{kind}"))
+    # Without a reset hint assume the usual one-minute window.
+    refill = (limit - remaining) / reset if reset and reset > 0 else limit / 60.0
+    return _Bucket(limit=limit, remaining=remaining, refill_per_second=refill, updated_at=now)
+
+
+class RateBudget:
+    def __init__(self) -> None:
+        self._requests: dict[str, _Bucket] = {}
+        self._tokens: dict[str, _Bucket] = {}
+        self._blocked_until: dict[str, float] = {}
+        self.waits = 0
+        self.rejections = 0
+
+    def observe(self, model: str, headers: Mapping[str, str] | None) -> None:
+        if not headers:
+            return
+        now = time.monotonic()
+        req = _bucket_from_headers(headers, "requests", now)
+        if req is not None:
+            self._requests[model] = req
+        tok = _bucket_from_headers(headers, "tokens", now)
+        if tok is not None:
+            self._tokens[model] = tok
+        retry_after = parse_reset_seconds(headers.get("retry-after"))
+        if retry_after:
+            self._blocked_until[model] = max(self._blocked_until.get(model, 0.0), now + retry_after)
+
+    def delay_for(self, model: str, tokens: int) -> float:
+        """Сколько секунд подождать, чтобы запрос на `tokens` уложился в лимит (0 — можно сразу)."""
+        now = time.monotonic()
+        delay = max(0.0, self._blocked_until.get(model, 0.0) - now)
+        req = self._requests.get(model)
+        if req is not None:
+            delay = max(delay, req.seconds_until(1.0, now))
+        tok = self._tokens.get(model)
+        if tok is not None:
+            # A single request larger than the whole window can never fit; let the provider decide.
+            delay = max(delay, tok.seconds_until(min(float(tokens), tok.limit), now))
+        return delay
+
+    def reserve(self, model: str, tokens: int) -> None:
+        now = time.monotonic()
+        req = self._requests.get(model)
+        if req is not None:
+            req.take(1.0, now)
+        tok = self._tokens.get(model)
+        if tok is not None:
+            tok.take(min(float(tokens), tok.limit), now)
+
+    async def wait(self, model: str, tokens: int) -> None:
+        """Ждёт короткую паузу до появления бюджета или бросает `RateBudgetExhausted`; ничего не списывает."""
+        max_wait = float(getattr(settings, "AI_RATE_BUDGET_MAX_WAIT_SECONDS", 5.0) or 0.0)
+        delay = self.delay_for(model, tokens)
+        if delay > max_wait:
+            self.rejections += 1
+            raise RateBudgetExhausted(model, delay)
+        if delay > 0:
+            self.waits += 1
+            await asyncio.sleep(delay)
+
+    def clear(self) -> None:
+        self._requests.clear()
+        self._tokens.clear()
+        self._blocked_until.clear()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "waits": self.waits,
+            "rejections": self.rejections,
+            "models": {
+                model: {
+                    "requests_available": round(self._requests[model].available(now), 2) if model in self._requests else None,
+                    "tokens_available": round(self._tokens[model].available(now), 2) if model in self._tokens else None,
+                }
+                for model in sorted(set(self._requests) | set(self._tokens))
+            },
+        }
+
+
+rate_budget = RateBudget()
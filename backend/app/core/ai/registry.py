@@ -0,0 +1,79 @@
+"""Реестр провайдеров модели на весь процесс.
+
+Один долгоживущий `GroqProvider` на модель; все они ходят через общий пул
+HTTP‑соединений (keep-alive, лимиты, HTTP/2 если установлен `h2`).
+Пул закрывается при остановке приложения; провайдеры остаются прежними
+и при следующем вызове переходят на новый пул.
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import logging
+
+import httpx
+from groq import DefaultAsyncHttpxClient
+
+from app.core.config import settings
+from app.core.ai.base import LLMProvider
+from app.core.ai.groq_provider import GroqProvider
+from app.core.ai.replay import RecordingProvider, ReplayProvider
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class ProviderRegistry:
+    def __init__(self) -> None:
+        self._http_client: httpx.AsyncClient | None = None
+        self._groq: dict[str, GroqProvider] = {}
+        self._recording: dict[str, RecordingProvider] = {}
+        self._replay: ReplayProvider | None = None
+
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None or self._http_client.is_closed:
+            limits = httpx.Limits(
+                max_connections=int(getattr(settings, "AI_HTTP_MAX_CONNECTIONS", 100) or 100),
+                max_keepalive_connections=int(getattr(settings, "AI_HTTP_MAX_KEEPALIVE_CONNECTIONS", 20) or 20),
+                keepalive_expiry=float(getattr(settings, "AI_HTTP_KEEPALIVE_EXPIRY_SECONDS", 30) or 30),
+            )
+            http2 = bool(getattr(settings, "AI_HTTP2", True)) and _http2_available()
+            self._http_client = DefaultAsyncHttpxClient(limits=limits, http2=http2)
+            logger.debug("AI HTTP pool created http2=%s", http2)
+        return self._http_client
+
+    def groq(self, model: str) -> GroqProvider:
+        provider = self._groq.get(model)
+        if provider is None:
+            provider = GroqProvider(model=model, http_client_factory=self.http_client)
+            self._groq[model] = provider
+        return provider
+
+    def recording(self, inner: LLMProvider) -> RecordingProvider:
+        key = str(getattr(inner, "model", None) or type(inner).__name__)
+        provider = self._recording.get(key)
+        if provider is None:
+            provider = RecordingProvider(inner, str(getattr(settings, "AI_CASSETTE_PATH", "./data/llm_cassette.jsonl")))
+            self._recording[key] = provider
+        return provider
+
+    def replay(self) -> ReplayProvider:
+        if self._replay is None:
+            self._replay = ReplayProvider(
+                str(getattr(settings, "AI_CASSETTE_PATH", "./data/llm_cassette.jsonl")),
+                latency_scale=float(getattr(settings, "AI_REPLAY_LATENCY_SCALE", 1.0)),
+            )
+        return self._replay
+
+    async def aclose(self) -> None:
+        # Providers are kept: AIService singletons hold them and rebind to a fresh pool lazily.
+        client = self._http_client
+        self._http_client = None
+        if client is not None and not client.is_closed:
+            await client.aclose()
+
+
+provider_registry = ProviderRegistry()
@@ -0,0 +1,178 @@
+"""Запись и воспроизведение ответов модели («кассеты»).
+
+`RecordingProvider` оборачивает настоящий провайдер и дописывает в JSONL‑файл
+каждый вызов: ключ (хэш вида вызова и промпта), ответ или ошибку и
+наблюдавшуюся задержку. `ReplayProvider` отдаёт ответы из файла без сети,
+выдерживая записанную задержку, умноженную на `latency_scale` (0 — мгновенно).
+Если один и тот же промпт записан несколько раз, ответы выдаются по кругу
+в порядке записи — прогон повторяется один в один.
+
+Режим выбирается настройкой `AI_PROVIDER_MODE` (`live` | `record` | `replay`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.ai.base import LLMProvider
+
+
+class CassetteMiss(LookupError):
+    def __init__(self, kind: str, key: str):
+        self.kind = kind
+        self.key = key
+        super().__init__(f"No recorded {kind} response for key={key[:12]}")
+
+
+class ReplayedProviderError(RuntimeError):
+    """Ошибка, которую вернул провайдер во время записи; текст сохранён как был."""
+
+
+def cassette_key(kind: str, payload: Any) -> str:
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(f"{kind}|{payload}".encode("utf-8", errors="ignore")).hexdigest()
+
+
+class RecordingProvider(LLMProvider):
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.model = getattr(inner, "model", None)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _write(self, record: dict) -> None:
+        record["model"] = self.model
+        with open(self.path, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def _record(self, kind: str, payload: Any, call) -> Any:
+        started = time.monotonic()
+        try:
+            result = await call()
+        except Exception as e:
+            self._write(
+                {
+                    "key": cassette_key(kind, payload),
+                    "kind": kind,
+                    "latency_ms": int((time.monotonic() - started) * 1000),
+                    "error": str(e),
+                }
+            )
+            raise
+        self._write(
+            {
+                "key": cassette_key(kind, payload),
+                "kind": kind,
+                "latency_ms": int((time.monotonic() - started) * 1000),
+                "response": result,
+            }
+        )
+        return result
+
+    async def generate_json(self, prompt: str, *, temperature: float | None = None) -> Dict[str, Any]:
+        return await self._record("json", prompt, lambda: self.inner.generate_json(prompt, temperature=temperature))
+
+    async def generate_text(self, prompt: str, *, temperature: float | None = None) -> str:
+        return await self._record("text", prompt, lambda: self.inner.generate_text(prompt, temperature=temperature))
+
+    async def generate_chat(self, messages: List[Dict[str, str]], *, temperature: float | None = None) -> str:
+        return await self._record("chat", messages, lambda: self.inner.generate_chat(messages, temperature=temperature))
+
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        started = time.monotonic()
+        last = started
+        chunks: list[list] = []
+        try:
+            async for chunk in self.inner.stream_json(prompt, temperature=temperature):
+                now = time.monotonic()
+                chunks.append([int((now - last) * 1000), chunk])
+                last = now
+                yield chunk
+        except Exception as e:
+            self._write({"key": cassette_key("stream", prompt), "kind": "stream", "chunks": chunks, "error": str(e)})
+            raise
+        self._write(
+            {
+                "key": cassette_key("stream", prompt),
+                "kind": "stream",
+                "latency_ms": int((time.monotonic() - started) * 1000),
+                "chunks": chunks,
+            }
+        )
+
+
+class ReplayProvider(LLMProvider):
+    def __init__(self, path: str, *, latency_scale: float = 1.0, model: str | None = None):
+        self.path = path
+        self.latency_scale = max(0.0, float(latency_scale))
+        self._records: dict[str, list[dict]] = {}
+        self._cursor: dict[str, int] = {}
+        models: list[str] = []
+        with open(path, "r", encoding="utf-8") as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                self._records.setdefault(rec["key"], []).append(rec)
+                if rec.get("model") and rec["model"] not in models:
+                    models.append(rec["model"])
+        # Report the recorded model so cache keys and metrics look like the original run.
+        self.model = model or (models[0] if models else "replay")
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._records.values())
+
+    def _next(self, kind: str, payload: Any) -> dict:
+        key = cassette_key(kind, payload)
+        records = self._records.get(key)
+        if not records:
+            self.misses += 1
+            raise CassetteMiss(kind, key)
+        self.hits += 1
+        i = self._cursor.get(key, 0)
+        self._cursor[key] = i + 1
+        return records[i % len(records)]
+
+    async def _sleep_ms(self, ms: int | float | None) -> None:
+        delay = float(ms or 0) / 1000.0 * self.latency_scale
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _replay(self, kind: str, payload: Any) -> Any:
+        rec = self._next(kind, payload)
+        await self._sleep_ms(rec.get("latency_ms"))
+        if "error" in rec:
+            raise ReplayedProviderError(rec["error"])
+        return copy.deepcopy(rec.get("response"))
+
+    async def generate_json(self, prompt: str, *, temperature: float | None = None) -> Dict[str, Any]:
+        return await self._replay("json", prompt)
+
+    async def generate_text(self, prompt: str, *, temperature: float | None = None) -> str:
+        return await self._replay("text", prompt)
+
+    async def generate_chat(self, messages: List[Dict[str, str]], *, temperature: float | None = None) -> str:
+        return await self._replay("chat", messages)
+
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        rec = self._next("stream", prompt)
+        for delay_ms, chunk in rec.get("chunks") or []:
+            await self._sleep_ms(delay_ms)
+            yield chunk
+        if "error" in rec:
+            raise ReplayedProviderError(rec["error"])
+
+    def stats(self) -> dict:
+        return {"records": len(self), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,177 @@
+"""Планировщик исходящих запросов к модели.
+
+На каждую модель — свой лимит одновременных запросов. Когда слотов нет,
+запросы ждут в очереди по приоритету: сначала интерактивный чат, потом
+генерация уроков, в конце сводки и исправления. При равном приоритете
+раньше идёт более высокий тариф подписки, дальше — порядок прихода.
+
+Приоритет и тариф берутся из контекста запроса (contextvars), поэтому
+вызывающему коду достаточно один раз обернуть работу в `llm_priority(...)`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator
+
+from app.core.config import settings
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_LESSON = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_LESSON: "lesson",
+    PRIORITY_BACKGROUND: "background",
+}
+
+llm_priority_ctx: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_LESSON)
+llm_tier_rank_ctx: contextvars.ContextVar[int] = contextvars.ContextVar("llm_tier_rank", default=2)
+
+
+def tier_rank_for_features(features: dict[str, bool] | None) -> int:
+    """0 — pro, 1 — plus, 2 — free (по набору возможностей из `subscription_features_for_tier`)."""
+    features = features or {}
+    if features.get("ai_unlimited"):
+        return 0
+    if features.get("srs_priority"):
+        return 1
+    return 2
+
+
+@contextmanager
+def llm_priority(priority: int) -> Iterator[None]:
+    token = llm_priority_ctx.set(int(priority))
+    try:
+        yield
+    finally:
+        llm_priority_ctx.reset(token)
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    tier_rank: int
+    seq: int
+    enqueued_at: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class _ClassStats:
+    acquired: int = 0
+    waited: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+
+class _ModelQueue:
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.active = 0
+        self.heap: list[_Waiter] = []
+
+
+class LLMScheduler:
+    def __init__(self) -> None:
+        self._queues: dict[str, _ModelQueue] = {}
+        self._seq = itertools.count()
+        self._stats: dict[int, _ClassStats] = {p: _ClassStats() for p in PRIORITY_NAMES}
+
+    @staticmethod
+    def limit_for_model(model: str) -> int:
+        per_model = getattr(settings, "AI_MODEL_CONCURRENCY", None) or {}
+        if model in per_model:
+            return int(per_model[model])
+        return int(getattr(settings, "AI_DEFAULT_MODEL_CONCURRENCY", 8) or 8)
+
+    def _queue(self, model: str) -> _ModelQueue:
+        q = self._queues.get(model)
+        if q is None:
+            q = _ModelQueue(self.limit_for_model(model))
+            self._queues[model] = q
+        return q
+
+    def _record(self, priority: int, waited_seconds: float | None) -> None:
+        st = self._stats.setdefault(priority, _ClassStats())
+        st.acquired += 1
+        if waited_seconds is not None:
+            st.waited += 1
+            st.wait_seconds_total += waited_seconds
+            st.wait_seconds_max = max(st.wait_seconds_max, waited_seconds)
+
+    async def acquire(self, model: str, *, priority: int | None = None, tier_rank: int | None = None) -> None:
+        q = self._queue(model)
+        prio = llm_priority_ctx.get() if priority is None else int(priority)
+        rank = llm_tier_rank_ctx.get() if tier_rank is None else int(tier_rank)
+
+        if q.active < q.limit and not q.heap:
+            q.active += 1
+            self._record(prio, None)
+            return
+
+        waiter = _Waiter(
+            priority=prio,
+            tier_rank=rank,
+            seq=next(self._seq),
+            enqueued_at=time.monotonic(),
+            future=asyncio.get_running_loop().create_future(),
+        )
+        heapq.heappush(q.heap, waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # The slot was handed over just as we were cancelled: pass it on.
+                self.release(model)
+            elif waiter in q.heap:
+                q.heap.remove(waiter)
+                heapq.heapify(q.heap)
+            raise
+        self._record(prio, time.monotonic() - waiter.enqueued_at)
+
+    def release(self, model: str) -> None:
+        q = self._queue(model)
+        while q.heap:
+            waiter = heapq.heappop(q.heap)
+            if not waiter.future.done():
+                # Hand the slot straight to the next waiter; `active` stays the same.
+                waiter.future.set_result(None)
+                return
+        q.active = max(0, q.active - 1)
+
+    @asynccontextmanager
+    async def slot(self, model: str, *, priority: int | None = None) -> AsyncIterator[None]:
+        await self.acquire(model, priority=priority)
+        try:
+            yield
+        finally:
+            self.release(model)
+
+    def stats(self) -> dict:
+        return {
+            "models": {
+                model: {"limit": q.limit, "active": q.active, "queue_depth": len(q.heap)}
+                for model, q in self._queues.items()
+            },
+            "priorities": {
+                PRIORITY_NAMES.get(p, str(p)): {
+                    "acquired": st.acquired,
+                    "waited": st.waited,
+                    "wait_seconds_total": round(st.wait_seconds_total, 6),
+                    "wait_seconds_max": round(st.wait_seconds_max, 6),
+                }
+                for p, st in self._stats.items()
+            },
+        }
+
+
+llm_scheduler = LLMScheduler()
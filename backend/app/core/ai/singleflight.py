@@ -0,0 +1,72 @@
+"""Склейка одинаковых одновременных запросов к модели (single-flight).
+
+Первый вызов с ключом запускает генерацию отдельной задачей, остальные ждут
+её результат. Отмена одного ожидающего (например, клиент ушёл) не отменяет
+генерацию для остальных; задача отменяется, только когда ждать её некому.
+Сохранять результат (строка кэша в БД и т. п.) должен первый ожидающий,
+получивший его, — не обязательно тот, кто запустил генерацию.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable
+
+
+@dataclass
+class _Call:
+    task: asyncio.Task
+    waiters: int = 0
+    claimed: bool = False
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Возвращает `(result, shared)`; `shared=False` получает ровно один ожидающий — он и сохраняет результат."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(task=asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            # The task runs in its own context copy; shield keeps a cancelled waiter from cancelling it.
+            result = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters <= 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+                self.abandoned += 1
+        # Ownership goes to the first waiter still here, so a cancelled leader does not take the write with it.
+        shared, call.claimed = call.claimed, True
+        return result, shared
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "in_flight": self.in_flight(),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+
+llm_single_flight = SingleFlight()
@@ -1,5 +1,5 @@
 import json
-from typing import List
+from typing import Any, Dict, List
 
 from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -12,6 +12,8 @@ class Settings(BaseSettings):
     ENV: str = "development"                                      
     DEBUG: bool = False
     LOG_LEVEL: str = "INFO"
+    METRICS_ENABLED: bool = False
+    METRICS_TOKEN: str | None = None  # bearer token required by GET /metrics when set
 
     RATE_LIMIT_TRUST_PROXY: bool = False
     
@@ -34,8 +36,14 @@ class Settings(BaseSettings):
     AI_ENABLED: bool = True
     GROQ_API_KEY: str | None = None
     GROQ_FALLBACK_MODELS: List[str] = ["llama-3.1-8b-instant", "llama-3.3-70b-versatile"]
+    AI_PROVIDER_MODE: str = "live"  # live | record | replay
+    AI_CASSETTE_PATH: str = "./data/llm_cassette.jsonl"
+    AI_REPLAY_LATENCY_SCALE: float = 1.0
     AI_CIRCUIT_BREAKER_FAIL_THRESHOLD: int = 3
     AI_CIRCUIT_BREAKER_OPEN_SECONDS: int = 60
+    AI_CIRCUIT_STATE_BACKEND: str = "memory"  # memory | sqlite | redis
+    AI_CIRCUIT_STATE_SQLITE_PATH: str = "./data/ai_circuit_state.sqlite3"
+    AI_CIRCUIT_STATE_REDIS_URL: str | None = None
 
     AI_REQUEST_TIMEOUT_SECONDS: int = 30
     AI_MAX_PROMPT_CHARS: int = 20000
@@ -45,6 +53,64 @@ class Settings(BaseSettings):
     AI_TEMPERATURE_JSON: float = 0.2
     AI_TEMPERATURE_REPAIR: float = 0.1
 
+    AI_PROMPT_CACHE_MAX_ENTRIES: int = 2048
+    AI_PROMPT_CACHE_TTL_SECONDS: int = 3600
+
+    AI_LLM_CACHE_COMPRESS: bool = True
+    AI_LLM_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    AI_LLM_CACHE_MAX_ROWS: int = 200000
+    AI_LLM_CACHE_EVICT_CHUNK: int = 500
+    AI_LLM_CACHE_EVICT_MAX_CHUNKS: int = 20
+    AI_LLM_CACHE_EVICT_INTERVAL_SECONDS: int = 3600
+    AI_LLM_CACHE_HIT_FLUSH_SECONDS: float = 30.0
+
+    AI_TELEMETRY_BUFFER_MAX: int = 10000
+    AI_TELEMETRY_BATCH_SIZE: int = 200
+    AI_TELEMETRY_FLUSH_SECONDS: float = 2.0
+
+    AI_SEMANTIC_CACHE_OPERATIONS: List[str] = ["course_path", "vocab_extraction", "lesson_plan"]
+    AI_SEMANTIC_CACHE_THRESHOLD: float = 0.9
+    AI_SEMANTIC_CACHE_MAX_ENTRIES: int = 1024
+    AI_SEMANTIC_CACHE_TTL_SECONDS: int = 3600
+    AI_SEMANTIC_CACHE_AUDIT_PATH: str | None = None
+
+    AI_HEDGE_OPERATIONS: List[str] = []  # chat_turn | lesson_core | exercises
+    AI_HEDGE_PERCENTILE: float = 0.95
+    AI_HEDGE_MIN_DELAY_SECONDS: float = 0.5
+    AI_HEDGE_MAX_DELAY_SECONDS: float = 8.0
+    AI_HEDGE_MIN_SAMPLES: int = 20
+
+    # Per-operation overrides of app/core/ai/profiles.py, e.g.
+    # {"room_turn": {"max_tokens": 300, "deadline_seconds": 30, "models": ["llama-3.1-8b-instant"]}}
+    AI_GENERATION_PROFILES: Dict[str, Dict[str, Any]] = {}
+
+    AI_TURN_SCHEMA_STREAMING: bool = True
+    AI_TURN_SCHEMA_MAX_ATTEMPTS: int = 2
+
+    AI_HTTP_MAX_CONNECTIONS: int = 100
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    AI_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    AI_HTTP2: bool = True
+
+    AI_DEFAULT_MODEL_CONCURRENCY: int = 8
+    AI_MODEL_CONCURRENCY: Dict[str, int] = {}
+
+    AI_RATE_BUDGET_MAX_WAIT_SECONDS: float = 5.0
+    AI_RATE_BUDGET_OUTPUT_TOKENS: int = 1024
+
+    AI_CHAT_CONTEXT_MAX_TOKENS: int = 6000
+    AI_CHAT_CONTEXT_MODEL_TOKENS: Dict[str, int] = {}
+
+    AI_JOB_WORKERS: int = 2
+    AI_JOB_POLL_SECONDS: float = 5.0
+    AI_JOB_LEASE_SECONDS: int = 120
+    AI_JOB_MAX_ATTEMPTS: int = 3
+    AI_JOB_TIMEOUT_SECONDS: int = 900
+
+    AI_LESSON_LIBRARY_ENABLED: bool = True
+    AI_LESSON_LIBRARY_VARIANTS: int = 3
+    AI_LESSON_LIBRARY_MAX_KNOWN_RATIO: float = 0.5
+
           
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:5173", "http://localhost:3000"]
 
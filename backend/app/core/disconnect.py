@@ -0,0 +1,114 @@
+"""Отмена работы запроса, когда клиент отключился.
+
+Сервер по умолчанию дожидается вызова модели, повторов и починок до конца,
+даже если ответ уже некому отдать. Здесь работа запроса запускается
+отдельной задачей рядом с наблюдателем за `http.disconnect`: как только
+клиент ушёл, задача отменяется — `CancelledError` прерывает HTTP‑вызов
+провайдера, паузу перед повтором и ожидание слота планировщика, а сервисы
+сами убирают частично записанные данные.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, Awaitable, TypeVar
+
+from starlette.requests import Request
+
+from app.core.exceptions import ClientDisconnectedException
+from app.core.metrics import client_disconnect_aborts
+
+T = TypeVar("T")
+
+_END = object()
+
+
+async def wait_for_disconnect(request: Request) -> None:
+    """Ждёт `http.disconnect`; тело запроса к этому моменту уже прочитано эндпойнтом."""
+    while True:
+        message = await request.receive()
+        if message.get("type") == "http.disconnect":
+            return
+
+
+async def _cancel(task: asyncio.Task) -> None:
+    if task.done():
+        return
+    task.cancel()
+    # Let the task unwind (cleanup handlers run here) without re-raising its CancelledError.
+    await asyncio.wait({task})
+
+
+def _disconnected(watcher: asyncio.Task) -> bool:
+    # A watcher that failed (odd receive channel) is not a disconnect; the work just runs on.
+    return watcher.done() and not watcher.cancelled() and watcher.exception() is None
+
+
+async def run_until_disconnect(request: Request, work: Awaitable[T], *, operation: str) -> T:
+    """Выполняет `work`; если клиент отключился раньше — отменяет её и бросает `ClientDisconnectedException`."""
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if not task.done() and _disconnected(watcher):
+            client_disconnect_aborts.inc(operation=operation)
+            await _cancel(task)
+            raise ClientDisconnectedException()
+        return await task
+    except asyncio.CancelledError:
+        await _cancel(task)
+        raise
+    finally:
+        await _cancel(watcher)
+
+
+async def stream_until_disconnect(
+    request: Request, source: AsyncIterator[T], *, operation: str
+) -> AsyncIterator[T]:
+    """Отдаёт элементы `source`, пока клиент на связи.
+
+    Источник целиком читается одной задачей (контекст и сессия БД живут в ней),
+    поэтому при отключении отменяется именно она, а не очередной `__anext__`.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def _produce() -> None:
+        try:
+            async for item in source:
+                queue.put_nowait(item)
+        except Exception as e:
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(_END)
+
+    producer = asyncio.ensure_future(_produce())
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    getter: asyncio.Task | None = None
+    finished = False
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(queue.get())
+            if _disconnected(watcher):
+                break
+            await asyncio.wait({getter} if watcher.done() else {getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                continue
+            item, getter = getter.result(), None
+            if item is _END:
+                finished = True
+                return
+            if isinstance(item, Exception):
+                finished = True
+                raise item
+            yield item
+    finally:
+        if getter is not None:
+            getter.cancel()
+        await _cancel(watcher)
+        if finished:
+            await asyncio.wait({producer})
+        else:
+            # The client left: disconnect seen, or the response itself was closed mid-stream.
+            client_disconnect_aborts.inc(operation=operation)
+            await _cancel(producer)
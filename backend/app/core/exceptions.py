@@ -29,3 +29,8 @@ class ServiceException(NeuroGlossException):
 class RateLimitExceededException(NeuroGlossException):
     def __init__(self, detail: str = "Rate limit exceeded"):
         super().__init__(status_code=status.HTTP_429_TOO_MANY_REQUESTS, code="rate_limited", detail=detail)
+
+class ClientDisconnectedException(NeuroGlossException):
+    def __init__(self, detail: str = "Client closed request"):
+        # 499 (nginx convention): nobody reads this response, it only shows up in logs and metrics.
+        super().__init__(status_code=499, code="client_closed_request", detail=detail)
@@ -0,0 +1,347 @@
+"""Метрики процесса в текстовом формате Prometheus (`GET /metrics`).
+
+Счётчики и гистограммы живут в памяти воркера и обновляются на горячем пути
+без блокировок (один поток событийного цикла). Статистика, которая уже
+копится в других модулях (кэши, планировщик, предохранитель, пул БД),
+снимается в момент запроса через коллекторы, а не дублируется.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+from typing import Callable, Iterable
+
+# (name, labels, value)
+Sample = tuple[str, dict[str, str], float]
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def route_template(scope: dict) -> str:
+    """Шаблон маршрута (`/api/v1/jobs/{job_id}`) вместо конкретного пути — чтобы не плодить серии."""
+    template = getattr(scope.get("route"), "path", None)
+    if not template:
+        return "unmatched"
+    # Included routers only know their own part of the path; the prefix is whatever precedes it.
+    tail = [seg for seg in template.split("/") if seg]
+    parts = str(scope.get("path") or "").rstrip("/").split("/")
+    prefix = "/".join(parts[: len(parts) - len(tail)]) if tail else "/".join(parts)
+    return prefix + template
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> list[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + float(amount)
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[Sample]:
+        return [(self.name, self._labels(k), v) for k, v in sorted(self._values.items())]
+
+    def clear(self) -> None:
+        self._values.clear()
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # Per label set: non-cumulative bucket counts (+Inf last), sum, count.
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = ([0] * (len(self.buckets) + 1), [0.0, 0.0])
+            self._series[key] = series
+        counts, totals = series
+        counts[bisect.bisect_left(self.buckets, float(value))] += 1
+        totals[0] += float(value)
+        totals[1] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return int(series[1][1]) if series else 0
+
+    def samples(self) -> list[Sample]:
+        out: list[Sample] = []
+        for key, (counts, totals) in sorted(self._series.items()):
+            labels = self._labels(key)
+            running = 0
+            for bound, n in zip((*self.buckets, math.inf), counts):
+                running += n
+                out.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, running))
+            out.append((f"{self.name}_sum", labels, totals[0]))
+            out.append((f"{self.name}_count", labels, totals[1]))
+        return out
+
+    def clear(self) -> None:
+        self._series.clear()
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+        # Collectors return (name, kind, help, samples) tuples computed at scrape time.
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Iterable[str] = (), **kwargs) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, **kwargs))
+
+    def add_collector(self, collector: Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families: list[tuple[str, str, str, list[Sample]]] = [
+            (m.name, m.kind, m.help, m.samples()) for m in self._metrics
+        ]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception:
+                # A broken collector must not take the whole scrape down.
+                continue
+        lines: list[str] = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        for m in self._metrics:
+            m.clear()
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    "neurogloss_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+llm_request_duration = metrics.histogram(
+    "neurogloss_llm_request_duration_seconds",
+    "Latency of a single provider call",
+    ("provider", "model", "operation", "outcome"),
+)
+llm_retries = metrics.counter(
+    "neurogloss_llm_retries_total",
+    "Provider calls retried after a transient error",
+    ("provider", "model", "reason"),
+)
+llm_circuit_failures = metrics.counter(
+    "neurogloss_llm_circuit_failures_total",
+    "Transient failures recorded by the circuit breaker",
+    ("key",),
+)
+llm_circuit_open = metrics.gauge(
+    "neurogloss_llm_circuit_open",
+    "1 while the breaker (or a provider backoff) blocks the model, as last seen by this worker",
+    ("key",),
+)
+llm_stream_rejections = metrics.counter(
+    "neurogloss_llm_stream_rejections_total",
+    "Streamed JSON responses aborted because they could no longer match the expected shape",
+    ("operation", "reason"),
+)
+client_disconnect_aborts = metrics.counter(
+    "neurogloss_client_disconnect_aborts_total",
+    "Requests whose in-flight work was cancelled because the client went away",
+    ("operation",),
+)
+chat_turns_discarded = metrics.counter(
+    "neurogloss_chat_turns_discarded_total",
+    "User chat turns removed because the request was aborted before a reply was stored",
+)
+topic_retrieval_cache = metrics.counter(
+    "neurogloss_topic_retrieval_cache_total",
+    "Topic retrieval cache lookups",
+    ("result",),
+)
+
+
+def _stats_family(name: str, kind: str, help_text: str, values: dict[str, float], label: str) -> tuple:
+    return (name, kind, help_text, [(name, {label: k}, float(v)) for k, v in values.items() if v is not None])
+
+
+def _collect_ai_runtime():
+    from app.core.ai.cache import prompt_cache
+    from app.core.ai.hedging import hedge_policy
+    from app.core.ai.prompt_fingerprint import semantic_cache
+    from app.core.ai.rate_budget import rate_budget
+    from app.core.ai.scheduler import llm_scheduler
+    from app.core.ai.singleflight import llm_single_flight
+
+    for cache_name, cache in (("prompt", prompt_cache), ("semantic", semantic_cache)):
+        st = cache.stats()
+        yield (
+            f"neurogloss_{cache_name}_cache_lookups_total",
+            "counter",
+            f"{cache_name.capitalize()} cache lookups by result",
+            [
+                (f"neurogloss_{cache_name}_cache_lookups_total", {"result": "hit"}, st["hits"]),
+                (f"neurogloss_{cache_name}_cache_lookups_total", {"result": "miss"}, st["misses"]),
+            ],
+        )
+        yield (
+            f"neurogloss_{cache_name}_cache_entries",
+            "gauge",
+            f"{cache_name.capitalize()} cache size",
+            [(f"neurogloss_{cache_name}_cache_entries", {}, st["size"])],
+        )
+
+    flight = llm_single_flight.stats()
+    yield _stats_family(
+        "neurogloss_llm_single_flight_total",
+        "counter",
+        "Single-flight calls by role",
+        {k: flight[k] for k in ("leaders", "coalesced", "abandoned")},
+        "role",
+    )
+    yield _stats_family(
+        "neurogloss_llm_hedge_total", "counter", "Hedged provider calls", hedge_policy.stats(), "event"
+    )
+    budget = rate_budget.stats()
+    yield _stats_family(
+        "neurogloss_llm_rate_budget_total",
+        "counter",
+        "Local rate budget waits and rejections",
+        {"wait": budget["waits"], "rejection": budget["rejections"]},
+        "event",
+    )
+
+    sched = llm_scheduler.stats()
+    for field in ("active", "queue_depth", "limit"):
+        name = f"neurogloss_llm_scheduler_{field}"
+        yield (
+            name,
+            "gauge",
+            f"LLM scheduler {field.replace('_', ' ')} per model",
+            [(name, {"model": m}, q[field]) for m, q in sched["models"].items()],
+        )
+    yield (
+        "neurogloss_llm_scheduler_wait_seconds_total",
+        "counter",
+        "Time spent waiting for a model slot by priority",
+        [
+            ("neurogloss_llm_scheduler_wait_seconds_total", {"priority": p}, st["wait_seconds_total"])
+            for p, st in sched["priorities"].items()
+        ],
+    )
+
+
+def _collect_background():
+    from app.features.ai.cache_maintenance import llm_cache_hits
+    from app.features.ai.telemetry import ai_event_buffer
+
+    events = ai_event_buffer.stats()
+    yield (
+        "neurogloss_ai_events_pending",
+        "gauge",
+        "Generation events waiting to be written",
+        [("neurogloss_ai_events_pending", {}, events["pending"])],
+    )
+    yield _stats_family(
+        "neurogloss_ai_events_total",
+        "counter",
+        "Generation events by fate",
+        {k: events[k] for k in ("enqueued", "dropped", "written")},
+        "state",
+    )
+    yield (
+        "neurogloss_llm_cache_pending_hit_keys",
+        "gauge",
+        "LLM cache rows with unflushed hit counters",
+        [("neurogloss_llm_cache_pending_hit_keys", {}, llm_cache_hits.pending())],
+    )
+
+
+def _collect_db_pool():
+    from app.core.database import engine
+
+    pool = engine.sync_engine.pool
+    values = {}
+    for field in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, field, None)
+        if callable(fn):
+            values[field] = fn()
+    if values:
+        yield _stats_family("neurogloss_db_pool_connections", "gauge", "Database pool connections", values, "state")
+
+
+metrics.add_collector(_collect_ai_runtime)
+metrics.add_collector(_collect_background)
+metrics.add_collector(_collect_db_pool)
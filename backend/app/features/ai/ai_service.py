@@ -7,6 +7,7 @@
 - кэш ответов и фоллбэки по моделям
 """
 
+import copy
 import json
 import asyncio
 import logging
@@ -14,12 +15,40 @@ import random
 import re
 import hashlib
 import time
-from typing import Any, Literal
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from app.core.config import settings
 from app.core.ai.base import LLMProvider
+from app.core.ai.cache import prompt_cache
+from app.core.ai.circuit_state import circuit_state
 from app.core.ai.groq_provider import GroqProvider
+from app.core.ai.hedging import hedge_policy
+from app.core.ai.pipeline import Stage, StageTimings, run_stages
+from app.core.ai.prompt_fingerprint import PromptFingerprint, semantic_cache
+from app.core.ai.profiles import ActiveProfile, current_profile, generation_profile, generation_profiles
+from app.core.ai.prompt_packer import estimate_tokens
+from app.core.ai.rate_budget import RateBudgetExhausted, rate_budget
+from app.core.ai.registry import provider_registry
+from app.core.ai.scheduler import PRIORITY_BACKGROUND, llm_priority
+from app.core.ai.json_stream import (
+    JsonFieldStreamer,
+    JsonShape,
+    JsonShapeValidator,
+    StreamSchemaError,
+    loads_json_object,
+)
+from app.core.ai.singleflight import llm_single_flight
+from app.core.metrics import (
+    llm_circuit_failures,
+    llm_circuit_open,
+    llm_request_duration,
+    llm_retries,
+    llm_stream_rejections,
+)
+from app.features.ai.cache_maintenance import entry_response, llm_cache_hits
+from app.features.ai.telemetry import ai_event_buffer
 from app.features.ai.repository import AIIOpsRepository
 from app.utils.prompt_templates import (
     LESSON_SYSTEM_TEMPLATE,
@@ -44,6 +73,15 @@ logger = logging.getLogger(__name__)
 
 GenerationMode = Literal["fast", "balanced", "strict"]
 
+CHARACTER_TURN_SHAPE = JsonShape(
+    fields={"action": ("string", "null"), "dialogue": ("string", "null")},
+    any_of=("action", "dialogue"),
+)
+ROOM_TURN_SHAPE = JsonShape(
+    fields={"speaker": ("string",), "message": ("string",)},
+    required=("speaker", "message"),
+)
+
 
 class AIService:
     def __init__(self, db: AsyncSession | None = None, provider: LLMProvider | None = None):
@@ -56,36 +94,33 @@ class AIService:
         model_name = getattr(provider, "model", None) if provider else None
         return provider_name, (str(model_name) if model_name is not None else None)
 
-    async def _log_chat_event(
+    def _log_chat_event(
         self,
         *,
-        db: AsyncSession | None,
         operation: str,
         latency_ms: int | None,
         error_codes: list[str] | None = None,
         quality_status: str | None = None,
         generation_mode: str | None = None,
     ) -> None:
-        if db is None:
-            return
-        try:
-            repo = AIIOpsRepository(db)
-            provider_name, model_name = self._provider_info(self.provider)
-            await repo.create_event(
-                enrollment_id=None,
-                generated_lesson_id=None,
+        provider_name, model_name = self._provider_info(self.provider)
+        if latency_ms is not None:
+            llm_request_duration.observe(
+                latency_ms / 1000.0,
+                provider=provider_name or "",
+                model=model_name or "",
                 operation=operation,
-                provider=provider_name,
-                model=model_name,
-                generation_mode=generation_mode,
-                latency_ms=latency_ms,
-                repair_count=None,
-                quality_status=quality_status,
-                error_codes=error_codes,
+                outcome="ok" if quality_status == "ok" else "error",
             )
-        except Exception:
-                                       
-            return
+        ai_event_buffer.record(
+            operation=operation,
+            provider=provider_name,
+            model=model_name,
+            generation_mode=generation_mode,
+            latency_ms=latency_ms,
+            quality_status=quality_status,
+            error_codes=error_codes,
+        )
 
     async def generate_character_chat_turn(
         self,
@@ -97,10 +132,12 @@ class AIService:
     ) -> str:
         started = time.monotonic()
         try:
-            text = await self.provider.generate_chat(messages, temperature=temperature)
+            with generation_profile("chat_turn") as active:
+                text = await self.provider.generate_chat(
+                    messages, temperature=self._profile_temperature(active, temperature)
+                )
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_turn",
                 latency_ms=latency_ms,
                 quality_status="ok",
@@ -109,8 +146,7 @@ class AIService:
             return text
         except Exception as e:
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_turn",
                 latency_ms=latency_ms,
                 quality_status="error",
@@ -129,25 +165,13 @@ class AIService:
     ) -> dict[str, Any]:
         started = time.monotonic()
         try:
-            transcript_lines: list[str] = []
-            for m in messages:
-                role = (m.get("role") or "").strip().lower()
-                content = m.get("content", "") or ""
-                if not content.strip():
-                    continue
-                if role == "system":
-                    transcript_lines.append("[SYSTEM]\n" + content.strip())
-                elif role == "user":
-                    transcript_lines.append("[USER] " + content.strip())
-                else:
-                    transcript_lines.append("[ASSISTANT] " + content.strip())
-
-            prompt = CHARACTER_CHAT_TURN_JSON_TEMPLATE.format(transcript="\n\n".join(transcript_lines))
+            prompt = CHARACTER_CHAT_TURN_JSON_TEMPLATE.format(transcript=self._messages_to_transcript(messages))
 
-            data = await self.provider.generate_json(prompt, temperature=temperature)
+            data = await self._generate_turn_json(
+                prompt, temperature=temperature, shape=CHARACTER_TURN_SHAPE, operation="chat_turn_json"
+            )
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_turn_json",
                 latency_ms=latency_ms,
                 quality_status="ok",
@@ -156,13 +180,12 @@ class AIService:
             return data
         except Exception as e:
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_turn_json",
                 latency_ms=latency_ms,
                 quality_status="error",
                 generation_mode=generation_mode,
-                error_codes=["provider_error"],
+                error_codes=[self._turn_error_code(e)],
             )
             raise ServiceException(f"AI provider error: {str(e)}")
 
@@ -175,10 +198,10 @@ class AIService:
     ) -> dict[str, Any]:
         started = time.monotonic()
         try:
-            data = await self.provider.generate_json(prompt)
+            with generation_profile("chat_lesson") as active:
+                data = await self.provider.generate_json(prompt, temperature=active.profile.temperature)
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_lesson",
                 latency_ms=latency_ms,
                 quality_status="ok",
@@ -187,8 +210,7 @@ class AIService:
             return data
         except Exception as e:
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="chat_lesson",
                 latency_ms=latency_ms,
                 quality_status="error",
@@ -209,25 +231,13 @@ class AIService:
         try:
                                                                     
                                                                                                             
-            transcript_lines: list[str] = []
-            for m in messages:
-                role = (m.get("role") or "").strip().lower()
-                content = m.get("content", "") or ""
-                if not content.strip():
-                    continue
-                if role == "system":
-                    transcript_lines.append("[SYSTEM]\n" + content.strip())
-                elif role == "user":
-                    transcript_lines.append("[USER] " + content.strip())
-                else:
-                    transcript_lines.append("[ASSISTANT] " + content.strip())
-
-            prompt = ROOM_CHAT_TURN_JSON_TEMPLATE.format(transcript="\n\n".join(transcript_lines))
+            prompt = ROOM_CHAT_TURN_JSON_TEMPLATE.format(transcript=self._messages_to_transcript(messages))
 
-            data = await self.provider.generate_json(prompt, temperature=temperature)
+            data = await self._generate_turn_json(
+                prompt, temperature=temperature, shape=ROOM_TURN_SHAPE, operation="room_turn"
+            )
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="room_turn",
                 latency_ms=latency_ms,
                 quality_status="ok",
@@ -236,63 +246,306 @@ class AIService:
             return data
         except Exception as e:
             latency_ms = int((time.monotonic() - started) * 1000)
-            await self._log_chat_event(
-                db=db,
+            self._log_chat_event(
                 operation="room_turn",
                 latency_ms=latency_ms,
                 quality_status="error",
                 generation_mode=generation_mode,
-                error_codes=["provider_error"],
+                error_codes=[self._turn_error_code(e)],
+            )
+            raise ServiceException(f"AI provider error: {str(e)}")
+
+    async def _generate_turn_json(
+        self, prompt: str, *, temperature: float | None, shape: JsonShape, operation: str
+    ) -> dict[str, Any]:
+        # Turns go straight to the provider unless hedging is enabled for "chat_turn".
+        if hedge_policy.delay_for("chat_turn") is not None:
+            data = await self._generate_json_with_retries(
+                prompt,
+                max_attempts=1,
+                use_cache=False,
+                temperature=temperature,
+                operation="chat_turn",
+                profile=operation,
+            )
+            self._check_turn_shape(shape, data, operation=operation)
+            return data
+
+        with generation_profile(operation) as active:
+            temperature = self._profile_temperature(active, temperature)
+            if not getattr(settings, "AI_TURN_SCHEMA_STREAMING", True):
+                data = await self.provider.generate_json(prompt, temperature=temperature)
+                self._check_turn_shape(shape, data, operation=operation)
+                return data
+
+            attempts = max(1, int(getattr(settings, "AI_TURN_SCHEMA_MAX_ATTEMPTS", 2) or 1))
+            for attempt in range(1, attempts + 1):
+                try:
+                    return await self._stream_checked_json(prompt, temperature=temperature, shape=shape)
+                except StreamSchemaError as e:
+                    llm_stream_rejections.inc(operation=operation, reason=e.reason)
+                    if attempt >= attempts or active.expired():
+                        raise
+                    logger.warning("Rejected %s output mid-stream (%s), retrying: %s", operation, e.reason, e)
+
+    async def _stream_checked_json(self, prompt: str, *, temperature: float | None, shape: JsonShape) -> dict[str, Any]:
+        """Читает ответ потоком и обрывает его, как только он перестаёт подходить под `shape`."""
+        validator = JsonShapeValidator(shape)
+        parts: list[str] = []
+        # aclosing() closes the provider stream (and its HTTP response) as soon as we stop reading.
+        async with aclosing(self.provider.stream_json(prompt, temperature=temperature)) as stream:
+            async for chunk in stream:
+                parts.append(chunk)
+                validator.feed(chunk)
+                if validator.complete:
+                    break
+        validator.end()
+        data = loads_json_object("".join(parts)[: validator.consumed])
+        shape.validate(data)
+        return data
+
+    @staticmethod
+    def _profile_temperature(active: ActiveProfile, temperature: float | None) -> float | None:
+        return temperature if temperature is not None else active.profile.temperature
+
+    async def _profiled_stream(
+        self, active: ActiveProfile, prompt: str, *, temperature: float | None
+    ) -> AsyncIterator[str]:
+        """`stream_json` под профилем операции.
+
+        Провайдер читает профиль при открытии потока, поэтому контекст держится
+        только до первого фрагмента и не переживает `yield`.
+        """
+        stream = self.provider.stream_json(prompt, temperature=temperature)
+        try:
+            with generation_profile(active):
+                try:
+                    first = await stream.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield first
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    @staticmethod
+    def _check_turn_shape(shape: JsonShape, data: Any, *, operation: str) -> None:
+        try:
+            shape.validate(data)
+        except StreamSchemaError as e:
+            llm_stream_rejections.inc(operation=operation, reason=e.reason)
+            raise
+
+    @staticmethod
+    def _turn_error_code(error: Exception) -> str:
+        return "schema_mismatch" if isinstance(error, StreamSchemaError) else "provider_error"
+
+    @staticmethod
+    def _messages_to_transcript(messages: list[dict[str, str]]) -> str:
+        transcript_lines: list[str] = []
+        for m in messages:
+            role = (m.get("role") or "").strip().lower()
+            content = m.get("content", "") or ""
+            if not content.strip():
+                continue
+            if role == "system":
+                transcript_lines.append("[SYSTEM]\n" + content.strip())
+            elif role == "user":
+                transcript_lines.append("[USER] " + content.strip())
+            else:
+                transcript_lines.append("[ASSISTANT] " + content.strip())
+        return "\n\n".join(transcript_lines)
+
+    async def _stream_turn_json(
+        self,
+        *,
+        db: AsyncSession | None,
+        prompt: str,
+        shape: JsonShape,
+        operation: str,
+        temperature: float | None,
+        generation_mode: str,
+    ) -> AsyncIterator[tuple[str, Any]]:
+        started = time.monotonic()
+        attempts = max(1, int(getattr(settings, "AI_TURN_SCHEMA_MAX_ATTEMPTS", 2) or 1))
+        active = generation_profiles.start(operation)
+        temperature = self._profile_temperature(active, temperature)
+        try:
+            for attempt in range(1, attempts + 1):
+                streamer = JsonFieldStreamer(tuple(shape.fields))
+                validator = JsonShapeValidator(shape)
+                parts: list[str] = []
+                emitted = False
+                try:
+                    async with aclosing(self._profiled_stream(active, prompt, temperature=temperature)) as stream:
+                        async for chunk in stream:
+                            parts.append(chunk)
+                            # Validate first so a bad chunk never reaches the client.
+                            validator.feed(chunk)
+                            for field, text in streamer.feed(chunk):
+                                emitted = True
+                                yield "delta", (field, text)
+                            if validator.complete:
+                                break
+                    validator.end()
+                    data = loads_json_object("".join(parts)[: validator.consumed])
+                    shape.validate(data)
+                    break
+                except StreamSchemaError as e:
+                    llm_stream_rejections.inc(operation=operation, reason=e.reason)
+                    # Once text has been shown to the client a retry would duplicate it.
+                    if emitted or attempt >= attempts or active.expired():
+                        raise
+                    logger.warning("Rejected %s output mid-stream (%s), retrying: %s", operation, e.reason, e)
+        except Exception as e:
+            latency_ms = int((time.monotonic() - started) * 1000)
+            self._log_chat_event(
+                operation=operation,
+                latency_ms=latency_ms,
+                quality_status="error",
+                generation_mode=generation_mode,
+                error_codes=[self._turn_error_code(e)],
             )
             raise ServiceException(f"AI provider error: {str(e)}")
 
+        latency_ms = int((time.monotonic() - started) * 1000)
+        self._log_chat_event(
+            operation=operation,
+            latency_ms=latency_ms,
+            quality_status="ok",
+            generation_mode=generation_mode,
+        )
+        yield "result", data
+
+    def stream_character_chat_turn_json(
+        self,
+        *,
+        db: AsyncSession | None,
+        messages: list[dict[str, str]],
+        temperature: float | None = None,
+        generation_mode: str = "deep",
+    ) -> AsyncIterator[tuple[str, Any]]:
+        """Потоковый вариант `generate_character_chat_turn_json`.
+
+        Отдаёт `("delta", (field, text))` по мере генерации `action`/`dialogue`
+        и в конце `("result", data)` с полным объектом.
+        """
+        prompt = CHARACTER_CHAT_TURN_JSON_TEMPLATE.format(transcript=self._messages_to_transcript(messages))
+        return self._stream_turn_json(
+            db=db,
+            prompt=prompt,
+            shape=CHARACTER_TURN_SHAPE,
+            operation="chat_turn_json",
+            temperature=temperature,
+            generation_mode=generation_mode,
+        )
+
+    def stream_room_chat_turn_json(
+        self,
+        *,
+        db: AsyncSession | None,
+        messages: list[dict[str, str]],
+        temperature: float | None = None,
+        generation_mode: str = "deep",
+    ) -> AsyncIterator[tuple[str, Any]]:
+        prompt = ROOM_CHAT_TURN_JSON_TEMPLATE.format(transcript=self._messages_to_transcript(messages))
+        return self._stream_turn_json(
+            db=db,
+            prompt=prompt,
+            shape=ROOM_TURN_SHAPE,
+            operation="room_turn",
+            temperature=temperature,
+            generation_mode=generation_mode,
+        )
+
                                                               
-    _circuit_state: dict[tuple[str, str], dict[str, float]] = {}
+    # Last fail_count seen per key; lets successes skip a backend write when nothing failed.
+    _circuit_seen_failures: dict[str, int] = {}
 
     @classmethod
-    def _circuit_key(cls, provider: LLMProvider) -> tuple[str, str]:
+    def _circuit_key(cls, provider: LLMProvider) -> str:
         provider_name = type(provider).__name__
         model_name = getattr(provider, "model", None) or ""
-        return provider_name, str(model_name)
+        return f"{provider_name}:{model_name}"
 
     @classmethod
-    def _is_circuit_open(cls, provider: LLMProvider) -> bool:
+    async def _is_circuit_open(cls, provider: LLMProvider) -> bool:
         key = cls._circuit_key(provider)
-        st = cls._circuit_state.get(key)
+        try:
+            st = await circuit_state.get(key)
+        except Exception as e:
+            logger.warning("Circuit state backend unavailable: %s", str(e))
+            return False
         if not st:
             return False
-        opened_until = float(st.get("opened_until", 0.0) or 0.0)
-        return opened_until > time.monotonic()
+        cls._circuit_seen_failures[key] = st.fail_count
+        blocked = st.blocked_until() > time.time()
+        llm_circuit_open.set(1 if blocked else 0, key=key)
+        return blocked
 
     @classmethod
-    def _record_circuit_failure(cls, provider: LLMProvider) -> None:
+    async def _record_circuit_failure(cls, provider: LLMProvider) -> None:
         threshold = int(getattr(settings, "AI_CIRCUIT_BREAKER_FAIL_THRESHOLD", 3) or 3)
         open_seconds = int(getattr(settings, "AI_CIRCUIT_BREAKER_OPEN_SECONDS", 60) or 60)
 
         key = cls._circuit_key(provider)
-        st = cls._circuit_state.get(key) or {"fail_count": 0.0, "opened_until": 0.0}
-        st["fail_count"] = float(st.get("fail_count", 0.0) or 0.0) + 1.0
-        if st["fail_count"] >= float(threshold):
-            st["opened_until"] = time.monotonic() + float(open_seconds)
-        cls._circuit_state[key] = st
+        llm_circuit_failures.inc(key=key)
+        try:
+            st = await circuit_state.record_failure(key, threshold=threshold, open_seconds=open_seconds)
+            cls._circuit_seen_failures[key] = st.fail_count
+        except Exception as e:
+            logger.warning("Circuit state backend unavailable: %s", str(e))
 
     @classmethod
-    def _record_circuit_success(cls, provider: LLMProvider) -> None:
+    async def _record_circuit_backoff(cls, provider: LLMProvider, seconds: float) -> None:
+        try:
+            await circuit_state.set_backoff(cls._circuit_key(provider), time.time() + float(seconds))
+        except Exception as e:
+            logger.warning("Circuit state backend unavailable: %s", str(e))
+
+    @classmethod
+    async def _record_circuit_success(cls, provider: LLMProvider) -> None:
         key = cls._circuit_key(provider)
-        if key in cls._circuit_state:
-            cls._circuit_state[key] = {"fail_count": 0.0, "opened_until": 0.0}
+        if not cls._circuit_seen_failures.get(key):
+            return
+        try:
+            await circuit_state.record_success(key)
+            cls._circuit_seen_failures[key] = 0
+        except Exception as e:
+            logger.warning("Circuit state backend unavailable: %s", str(e))
+
+    @staticmethod
+    def _db_lock(db: AsyncSession) -> asyncio.Lock:
+        # Parallel pipeline stages share one session, and a session runs one statement at a time.
+        lock = db.info.get("ai_cache_lock")
+        if lock is None:
+            lock = asyncio.Lock()
+            db.info["ai_cache_lock"] = lock
+        return lock
+
+    @staticmethod
+    def _rate_budget_delay(provider: LLMProvider, prompt: str) -> float:
+        model_name = getattr(provider, "model", None)
+        if not model_name:
+            return 0.0
+        output_tokens = int(getattr(settings, "AI_RATE_BUDGET_OUTPUT_TOKENS", 1024) or 1024)
+        return rate_budget.delay_for(str(model_name), estimate_tokens(prompt) + output_tokens)
 
     def _provider_candidates(self) -> list[LLMProvider]:
-                                                           
+        """Кандидаты по порядку: модели активного профиля, основная модель, затем `GROQ_FALLBACK_MODELS`."""
         if isinstance(self.provider, GroqProvider):
             primary_model = getattr(self.provider, "model", None) or ""
-            models = [str(primary_model)] if primary_model else []
+            active = current_profile()
+            models = [str(m) for m in (active.profile.models if active is not None else ()) if str(m)]
+            if primary_model and str(primary_model) not in models:
+                models.append(str(primary_model))
             for m in (getattr(settings, "GROQ_FALLBACK_MODELS", None) or []):
                 if str(m) not in models:
                     models.append(str(m))
             if not models:
                 models = ["llama-3.3-70b-versatile"]
-            return [GroqProvider(model=m) for m in models]
+            return [provider_registry.groq(m) for m in models]
 
         return [self.provider]
 
@@ -300,9 +553,15 @@ class AIService:
     def _select_provider() -> LLMProvider:
                                                  
                                                                                              
+        mode = str(getattr(settings, "AI_PROVIDER_MODE", "live") or "live").strip().lower()
+        if mode == "replay":
+            return provider_registry.replay()
         models = list(getattr(settings, "GROQ_FALLBACK_MODELS", None) or [])
         primary = str(models[0]) if models else "llama-3.3-70b-versatile"
-        return GroqProvider(model=primary)
+        if mode == "record":
+            # Recording pins the primary model: fallbacks would make the cassette depend on live failures.
+            return provider_registry.recording(provider_registry.groq(primary))
+        return provider_registry.groq(primary)
 
     @staticmethod
     def _compute_prompt_hash(prompt: str, *, provider: str | None, model: str | None) -> str:
@@ -315,7 +574,14 @@ class AIService:
         if not isinstance(prompt, str):
             prompt = str(prompt)
         if max_chars > 0 and len(prompt) > max_chars:
-            return prompt[:max_chars]
+            # Keep the instructions at the head and the newest context plus output
+            # format at the tail; the middle (oldest history) is what gets dropped.
+            marker = "\n...\n"
+            head = max(0, (max_chars - len(marker)) // 4)
+            tail = max(0, max_chars - len(marker) - head)
+            if tail <= 0:
+                return prompt[-max_chars:]
+            return prompt[:head] + marker + prompt[-tail:]
         return prompt
 
     @staticmethod
@@ -1227,6 +1493,117 @@ class AIService:
             native_language=native_language,
         )
 
+    _EXERCISE_INDEX = re.compile(r"^exercises\[(\d+)\]")
+
+    @classmethod
+    def _errors_by_exercise_index(cls, errors: list[dict]) -> dict[int, list[dict]] | None:
+        """Группирует ошибки по индексу упражнения; `None`, если есть ошибка уровня всего списка."""
+        by_index: dict[int, list[dict]] = {}
+        for e in errors or []:
+            m = cls._EXERCISE_INDEX.match(str(e.get("field") or "")) if isinstance(e, dict) else None
+            if m is None:
+                return None
+            by_index.setdefault(int(m.group(1)), []).append(e)
+        return by_index
+
+    async def _repair_exercise_item(
+        self,
+        item: Any,
+        errors: list[dict],
+        *,
+        target_language: str,
+        db: AsyncSession | None,
+    ) -> dict | None:
+        fixed = await self._fix_json_with_patch(
+            invalid_json={"exercise": item},
+            errors=self._errors_to_patch_lines(errors),
+            instruction=(
+                f"You previously generated ONE exercise for a {target_language} lesson. Fix ONLY this exercise object."
+            ),
+            db=db,
+        )
+        if isinstance(fixed, dict) and isinstance(fixed.get("exercise"), dict):
+            return fixed["exercise"]
+        if isinstance(fixed, dict) and fixed.get("type"):
+            return fixed
+        return None
+
+    async def _validate_and_repair_exercises(
+        self,
+        exercises_container: Any,
+        *,
+        target_language: str,
+        max_repairs: int,
+        db: AsyncSession | None,
+        sanitize: bool,
+    ) -> tuple[Any, list[dict], int]:
+        """Проверяет упражнения и чинит только сломанные элементы, параллельно и маленькими промптами.
+
+        После починки заново проверяются только исправленные элементы. Если ошибка
+        относится ко всему списку (например, он пуст), чинится весь JSON, как раньше.
+        Возвращает (контейнер, все найденные ошибки, число проверок).
+        """
+        validation_errors: list[dict] = []
+        attempts = 0
+
+        if sanitize:
+            exercises_container = self._sanitize_exercises_container(exercises_container)
+        exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
+        errs = self._validate_exercises(exercises, target_language=target_language)
+
+        while True:
+            attempts += 1
+            if not errs:
+                break
+
+            validation_errors.extend(errs)
+            if (attempts - 1) >= max_repairs:
+                break
+
+            logger.warning("AI exercises validation failed, attempting repair: %s", errs)
+            by_index = self._errors_by_exercise_index(errs)
+            if by_index is None:
+                exercises_container = await self._fix_json_with_patch(
+                    invalid_json=exercises_container,
+                    errors=self._errors_to_patch_lines(errs),
+                    instruction=(
+                        f"You previously generated ONLY exercises JSON for a {target_language} lesson. Fix ONLY the exercises JSON."
+                    ),
+                    db=db,
+                )
+                if sanitize:
+                    exercises_container = self._sanitize_exercises_container(exercises_container)
+                exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
+                errs = self._validate_exercises(exercises, target_language=target_language)
+                continue
+
+            exercises = list(exercises or [])
+            indices = sorted(i for i in by_index if i < len(exercises))
+            repaired = await asyncio.gather(
+                *(
+                    self._repair_exercise_item(exercises[i], by_index[i], target_language=target_language, db=db)
+                    for i in indices
+                ),
+                return_exceptions=True,
+            )
+
+            errs = []
+            for i, item in zip(indices, repaired):
+                if isinstance(item, dict) and sanitize:
+                    kept = (self._sanitize_exercises_container({"exercises": [item]}) or {}).get("exercises") or []
+                    item = kept[0] if kept else None
+                if not isinstance(item, dict):
+                    # Repair failed: the item keeps its original issues.
+                    errs.extend(by_index[i])
+                    continue
+                exercises[i] = item
+                for e in self._validate_exercises([item], target_language=target_language):
+                    field = self._EXERCISE_INDEX.sub(f"exercises[{i}]", str(e.get("field") or ""), count=1)
+                    errs.append({**e, "field": field})
+            exercises_container = {**exercises_container, "exercises": exercises}
+
+        return exercises_container, validation_errors, attempts
+
     async def _fix_json_with_patch(
         self,
         *,
@@ -1250,13 +1627,15 @@ class AIService:
             + "- Do NOT add any commentary or markdown.\n"
         )
         prompt = self._truncate_prompt(prompt)
-        return await self._generate_json_with_retries(
-            prompt,
-            max_attempts=3,
-            db=db,
-            use_cache=True,
-            temperature=float(getattr(settings, "AI_TEMPERATURE_REPAIR", 0.1) or 0.1),
-        )
+        with llm_priority(PRIORITY_BACKGROUND):
+            return await self._generate_json_with_retries(
+                prompt,
+                max_attempts=3,
+                db=db,
+                use_cache=True,
+                temperature=float(getattr(settings, "AI_TEMPERATURE_REPAIR", 0.1) or 0.1),
+                operation="repair",
+            )
 
     @staticmethod
     def _errors_to_patch_lines(errors: list[dict]) -> list[str]:
@@ -1365,7 +1744,14 @@ class AIService:
             prior_topics="\n".join([f"- {t}" for t in (prior_topics or [])[:30]]) or "- none",
             used_words=", ".join((used_words or [])[:80]) or "none",
         )
-        return await self._generate_json_with_retries(prompt, max_attempts=4, db=db, use_cache=False)
+        fingerprint = PromptFingerprint(
+            operation="lesson_plan",
+            exact={"target_language": target_language, "native_language": native_language, "level": level, "topic": topic},
+            fuzzy={"interests": interests, "prior_topics": (prior_topics or [])[:30], "used_words": (used_words or [])[:80]},
+        )
+        return await self._generate_json_with_retries(
+            prompt, max_attempts=4, db=db, use_cache=False, operation="lesson_plan", fingerprint=fingerprint
+        )
 
     async def _strict_review_and_fix_core(
         self,
@@ -1383,7 +1769,10 @@ class AIService:
             topic=topic,
             level=level,
         ) + "\n\nLESSON_JSON:\n" + json.dumps(lesson_core, ensure_ascii=False)
-        review = await self._generate_json_with_retries(review_prompt, max_attempts=3, db=db, use_cache=False)
+        with llm_priority(PRIORITY_BACKGROUND):
+            review = await self._generate_json_with_retries(
+                review_prompt, max_attempts=3, db=db, use_cache=False, operation="review"
+            )
         issues = review.get("issues") if isinstance(review, dict) else None
         issues_list: list[dict] = list(issues) if isinstance(issues, list) else []
         if not issues_list:
@@ -1419,7 +1808,10 @@ class AIService:
         review_prompt += "\n\nTEXT:\n" + str(text or "")
         review_prompt += "\n\nVOCAB_PAIRS:\n" + str(vocab_pairs or "")
         review_prompt += "\n\nEXERCISES_JSON:\n" + json.dumps(exercises_container, ensure_ascii=False)
-        review = await self._generate_json_with_retries(review_prompt, max_attempts=3, db=db, use_cache=False)
+        with llm_priority(PRIORITY_BACKGROUND):
+            review = await self._generate_json_with_retries(
+                review_prompt, max_attempts=3, db=db, use_cache=False, operation="review"
+            )
         issues = review.get("issues") if isinstance(review, dict) else None
         issues_list: list[dict] = list(issues) if isinstance(issues, list) else []
         if not issues_list:
@@ -1452,6 +1844,136 @@ class AIService:
                 return None
         return None
 
+    async def _call_candidate_with_retries(
+        self,
+        candidate: LLMProvider,
+        prompt: str,
+        *,
+        max_attempts: int,
+        temperature: float | None,
+        operation: str | None = None,
+    ) -> dict:
+        provider_name = type(candidate).__name__ if candidate else None
+        model_name = getattr(candidate, "model", None) if candidate else None
+        labels = {"provider": provider_name or "", "model": str(model_name or ""), "operation": operation or "json"}
+
+        for attempt in range(1, max_attempts + 1):
+            started = time.monotonic()
+            try:
+                result = await candidate.generate_json(prompt, temperature=temperature)
+                llm_request_duration.observe(time.monotonic() - started, outcome="ok", **labels)
+                await self._record_circuit_success(candidate)
+                return result
+            except RateBudgetExhausted:
+                # Nothing was sent; the caller moves on to the next model instead of sleeping here.
+                raise
+            except asyncio.CancelledError:
+                llm_request_duration.observe(time.monotonic() - started, outcome="cancelled", **labels)
+                raise
+            except Exception as e:
+                llm_request_duration.observe(time.monotonic() - started, outcome="error", **labels)
+                message = str(e)
+                retry_after = self._extract_retry_after_seconds(message)
+
+                is_rate_limit = "429" in message or "rate limit" in message.lower() or "rate_limit" in message.lower()
+                is_transient = is_rate_limit or any(
+                    token in message.lower()
+                    for token in [
+                        "timeout",
+                        "timed out",
+                        "temporar",
+                        "service unavailable",
+                        "503",
+                        "connection",
+                        "network",
+                    ]
+                )
+
+                if is_transient:
+                    await self._record_circuit_failure(candidate)
+
+                # Tell the other workers to leave this model alone until the provider says so.
+                if is_rate_limit and retry_after is not None:
+                    await self._record_circuit_backoff(candidate, retry_after)
+
+                if is_rate_limit and retry_after is not None and retry_after >= 120.0:
+                    raise ServiceException(
+                        f"Provider retry requested retry_after_seconds={int(retry_after)}"
+                    )
+
+                if attempt >= max_attempts or not is_transient:
+                    raise
+
+                if retry_after is None:
+                    retry_after = min(30.0, (2 ** (attempt - 1))) + random.random()
+
+                # A backoff that outlives the operation deadline is pointless; let the caller try the next model.
+                active = current_profile()
+                remaining = active.remaining() if active is not None else None
+                if remaining is not None and retry_after >= remaining:
+                    raise
+
+                llm_retries.inc(
+                    provider=labels["provider"],
+                    model=labels["model"],
+                    reason="rate_limit" if is_rate_limit else "transient",
+                )
+                logger.warning(
+                    "AI transient error, retrying. provider=%s model=%s attempt=%s/%s sleep=%.2fs error=%s",
+                    provider_name,
+                    model_name,
+                    attempt,
+                    max_attempts,
+                    retry_after,
+                    message,
+                )
+                await asyncio.sleep(retry_after)
+
+        raise ServiceException("AI generation failed: no attempts made")
+
+    async def _generate_json_flight(
+        self,
+        candidate: LLMProvider,
+        prompt: str,
+        *,
+        prompt_hash: str | None,
+        use_cache: bool,
+        max_attempts: int,
+        temperature: float | None,
+        operation: str | None,
+    ) -> tuple[dict, bool]:
+        provider_name = type(candidate).__name__ if candidate else None
+        model_name = getattr(candidate, "model", None) if candidate else None
+
+        # Identical prompts in flight share one provider call; the memory tier
+        # is filled by the shared task, the DB row by the first caller that gets the result.
+        flight_key = (
+            prompt_hash or self._compute_prompt_hash(prompt, provider=provider_name, model=model_name),
+            provider_name,
+            str(model_name or ""),
+            temperature,
+        )
+
+        async def _run() -> dict:
+            started = time.monotonic()
+            try:
+                res = await self._call_candidate_with_retries(
+                    candidate, prompt, max_attempts=max_attempts, temperature=temperature, operation=operation
+                )
+            except asyncio.CancelledError:
+                # A cancelled (hedged-out) call took at least this long; keeping the
+                # sample stops the percentile from drifting down to winners only.
+                hedge_policy.observe(operation, time.monotonic() - started)
+                raise
+            hedge_policy.observe(operation, time.monotonic() - started)
+            if use_cache and prompt_hash is not None and isinstance(res, dict):
+                prompt_cache.set(prompt_hash, res)
+            return res
+
+        result, shared = await llm_single_flight.do(flight_key, _run)
+        # Validators normalize lessons in place, so every caller gets its own copy.
+        return copy.deepcopy(result), shared
+
     async def _generate_json_with_retries(
         self,
         prompt: str,
@@ -1460,37 +1982,111 @@ class AIService:
         db: AsyncSession | None = None,
         use_cache: bool = True,
         temperature: float | None = None,
+        operation: str | None = None,
+        fingerprint: PromptFingerprint | None = None,
+        profile: str | None = None,
     ) -> dict:
-        last_exc: Exception | None = None
-        prompt = self._truncate_prompt(prompt)
-        candidates = self._provider_candidates()
-
-        for candidate in candidates:
-            if self._is_circuit_open(candidate):
-                continue
+        # `profile` overrides the generation profile when `operation` is only a hedging/metrics key.
+        with generation_profile(profile or operation) as active:
+            last_exc: Exception | None = None
+            prompt = self._truncate_prompt(prompt)
+            temperature = self._profile_temperature(active, temperature)
+            candidates = self._provider_candidates()
+            hedge_delay = hedge_policy.delay_for(operation)
+            if fingerprint is not None and not semantic_cache.enabled_for(fingerprint.operation):
+                fingerprint = None
+
+            idx = 0
+            while idx < len(candidates):
+                candidate = candidates[idx]
+                idx += 1
+                if active.expired():
+                    raise ServiceException(
+                        f"AI generation failed: deadline exceeded (operation={active.profile.operation})"
+                        + (f", last error: {last_exc}" if last_exc else "")
+                    )
+                if await self._is_circuit_open(candidate):
+                    continue
 
-            provider_name = type(candidate).__name__ if candidate else None
-            model_name = getattr(candidate, "model", None) if candidate else None
+                provider_name = type(candidate).__name__ if candidate else None
+                model_name = getattr(candidate, "model", None) if candidate else None
 
-            prompt_hash = None
-            if use_cache and db is not None:
-                try:
+                prompt_hash = None
+                if use_cache:
                     prompt_hash = self._compute_prompt_hash(prompt, provider=provider_name, model=model_name)
-                    repo = AIIOpsRepository(db)
-                    cached = await repo.get_cache_by_hash(prompt_hash)
-                    if cached is not None and isinstance(getattr(cached, "response_json", None), dict):
-                        return dict(cached.response_json)
-                except Exception:
-                    prompt_hash = None
+                    cached_json = prompt_cache.get(prompt_hash)
+                    if cached_json is not None:
+                        llm_cache_hits.record(prompt_hash)
+                        return cached_json
+
+                if use_cache and db is not None:
+                    try:
+                        repo = AIIOpsRepository(db)
+                        async with self._db_lock(db):
+                            cached = await repo.get_cache_by_hash(prompt_hash)
+                        cached_response = entry_response(cached)
+                        if isinstance(cached_response, dict):
+                            llm_cache_hits.record(prompt_hash)
+                            prompt_cache.set(prompt_hash, cached_response)
+                            return dict(cached_response)
+                    except Exception:
+                        prompt_hash = None
+
+                if fingerprint is not None:
+                    near = semantic_cache.get(fingerprint, provider=provider_name, model=model_name)
+                    if near is not None:
+                        return near
+
+                # Route around a model whose header-reported budget is spent, as long as another is left.
+                if idx < len(candidates) and self._rate_budget_delay(candidate, prompt) > float(
+                    getattr(settings, "AI_RATE_BUDGET_MAX_WAIT_SECONDS", 5.0) or 0.0
+                ):
+                    continue
+
+                flight_kwargs = dict(
+                    use_cache=use_cache,
+                    max_attempts=max_attempts,
+                    temperature=temperature,
+                    operation=operation,
+                )
+                backup = None
+                if hedge_delay is not None:
+                    for c in candidates[idx:]:
+                        if not await self._is_circuit_open(c):
+                            backup = c
+                            break
 
-            for attempt in range(1, max_attempts + 1):
                 try:
-                    result = await candidate.generate_json(prompt, temperature=temperature)
-                    self._record_circuit_success(candidate)
+                    if backup is None:
+                        result, shared = await self._generate_json_flight(
+                            candidate, prompt, prompt_hash=prompt_hash, **flight_kwargs
+                        )
+                    else:
+                        idx = candidates.index(backup) + 1
+                        backup_name = type(backup).__name__
+                        backup_model = getattr(backup, "model", None)
+                        backup_hash = (
+                            self._compute_prompt_hash(prompt, provider=backup_name, model=backup_model)
+                            if use_cache
+                            else None
+                        )
+                        (result, shared), hedge_won = await hedge_policy.race(
+                            lambda: self._generate_json_flight(candidate, prompt, prompt_hash=prompt_hash, **flight_kwargs),
+                            lambda: self._generate_json_flight(backup, prompt, prompt_hash=backup_hash, **flight_kwargs),
+                            delay=hedge_delay,
+                        )
+                        if hedge_won:
+                            provider_name, model_name, prompt_hash = backup_name, backup_model, backup_hash
+                except ServiceException:
+                    raise
+                except Exception as e:
+                    last_exc = e
+                    continue
 
-                    if use_cache and db is not None and prompt_hash is not None and isinstance(result, dict):
-                        try:
-                            repo = AIIOpsRepository(db)
+                if not shared and use_cache and db is not None and prompt_hash is not None and isinstance(result, dict):
+                    try:
+                        repo = AIIOpsRepository(db)
+                        async with self._db_lock(db):
                             await repo.create_cache_entry(
                                 prompt_hash=prompt_hash,
                                 prompt=prompt,
@@ -1498,62 +2094,17 @@ class AIService:
                                 provider=provider_name,
                                 model=model_name,
                             )
-                        except IntegrityError:
-                            pass
-                        except Exception:
-                            pass
-
-                    return result
-                except Exception as e:
-                    last_exc = e
-                    message = str(e)
-                    retry_after = self._extract_retry_after_seconds(message)
-
-                    is_rate_limit = "429" in message or "rate limit" in message.lower() or "rate_limit" in message.lower()
-                    is_transient = is_rate_limit or any(
-                        token in message.lower()
-                        for token in [
-                            "timeout",
-                            "timed out",
-                            "temporar",
-                            "service unavailable",
-                            "503",
-                            "connection",
-                            "network",
-                        ]
-                    )
+                    except IntegrityError:
+                        pass
+                    except Exception:
+                        pass
 
-                    if is_transient:
-                        self._record_circuit_failure(candidate)
+                if not shared and fingerprint is not None and isinstance(result, dict):
+                    semantic_cache.set(fingerprint, provider=provider_name, model=model_name, response=result)
 
-                                                                                                               
-                                                                                              
-                    if is_rate_limit and retry_after is not None and retry_after >= 120.0:
-                        raise ServiceException(
-                            f"Provider retry requested retry_after_seconds={int(retry_after)}"
-                        )
-
-                    if attempt >= max_attempts or not is_transient:
-                        break
-
-                                                                                                                
-                    if retry_after is None:
-                        retry_after = min(30.0, (2 ** (attempt - 1))) + random.random()
-
-                    logger.warning(
-                        "AI transient error, retrying. provider=%s model=%s attempt=%s/%s sleep=%.2fs error=%s",
-                        provider_name,
-                        model_name,
-                        attempt,
-                        max_attempts,
-                        retry_after,
-                        message,
-                    )
-                    await asyncio.sleep(retry_after)
+                return result
 
-                                                                                                
-
-        raise ServiceException(f"AI generation failed: {str(last_exc) if last_exc else 'unknown error'}")
+            raise ServiceException(f"AI generation failed: {str(last_exc) if last_exc else 'unknown error'}")
 
     async def generate_lesson(
         self,
@@ -1568,6 +2119,7 @@ class AIService:
         recent_exercise_types: list[str] | None = None,
         generation_mode: GenerationMode = "balanced",
         db: AsyncSession | None = None,
+        reuse_core: dict | None = None,
     ) -> dict:
         if not settings.AI_ENABLED:
             raise ServiceException("AI is disabled")
@@ -1579,8 +2131,10 @@ class AIService:
         provider_name = type(self.provider).__name__ if getattr(self, "provider", None) else None
         model_name = getattr(self.provider, "model", None) if getattr(self, "provider", None) else None
 
-                                                                                       
-        if mode == "strict":
+        # `reuse_core` is an already validated text+vocabulary (escalation): only exercises are regenerated.
+        if isinstance(reuse_core, dict):
+            lesson_core = reuse_core
+        elif mode == "strict":
             lesson_core = await self.generate_text_vocab_only(
                 topic=topic,
                 target_language=target_language,
@@ -1626,25 +2180,36 @@ class AIService:
         exercises_container: dict
         vocab_words = self._vocab_words_from_list(vocab_list)
 
+        timings = StageTimings(meta_core.get("stage_timings_ms") or {}) if isinstance(meta_core, dict) else StageTimings()
+
         if mode == "strict":
-                                                       
-            ex_vocab = await self.generate_exercises_vocab_only(
-                vocabulary=vocab_list,
-                target_language=target_language,
-                native_language=native_language,
-                topic=topic,
-                db=db,
-            )
-            ex_text = await self.generate_exercises_text_only(
-                text=text,
-                vocabulary=vocab_list,
-                target_language=target_language,
-                native_language=native_language,
-                topic=topic,
-                db=db,
+            # Vocabulary- and text-based exercises only need the finished core, so they run side by side.
+            async def _ex_vocab_stage(_: dict) -> dict:
+                return await self.generate_exercises_vocab_only(
+                    vocabulary=vocab_list,
+                    target_language=target_language,
+                    native_language=native_language,
+                    topic=topic,
+                    db=db,
+                )
+
+            async def _ex_text_stage(_: dict) -> dict:
+                return await self.generate_exercises_text_only(
+                    text=text,
+                    vocabulary=vocab_list,
+                    target_language=target_language,
+                    native_language=native_language,
+                    topic=topic,
+                    db=db,
+                )
+
+            ex = await run_stages(
+                [Stage("exercises_vocab", _ex_vocab_stage), Stage("exercises_text", _ex_text_stage)],
+                timings,
             )
             exercises_container = {
-                "exercises": list(ex_vocab.get("exercises") or []) + list(ex_text.get("exercises") or [])
+                "exercises": list(ex["exercises_vocab"].get("exercises") or [])
+                + list(ex["exercises_text"].get("exercises") or [])
             }
         else:
                                     
@@ -1655,90 +2220,68 @@ class AIService:
                 text=text,
                 vocab_pairs=vocab_pairs,
             )
-            exercises_container = await self._generate_json_with_retries(
-                prompt_ex,
-                max_attempts=max_ai_attempts,
-                db=db,
-                use_cache=True,
-            )
+            with timings.stage("exercises"):
+                exercises_container = await self._generate_json_with_retries(
+                    prompt_ex,
+                    max_attempts=max_ai_attempts,
+                    db=db,
+                    use_cache=True,
+                    operation="exercises",
+                )
 
-        exercises_attempts = 0
         quality_status = "ok"
 
-                                                                                             
-        exercises_container = self._sanitize_exercises_container(exercises_container)
-
-        for _ in range(0, ex_repairs_max + 1):
-            exercises_attempts += 1
-
-                                                                            
-            exercises_container = self._sanitize_exercises_container(exercises_container)
-            exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
-            errs = self._validate_exercises(exercises, target_language=target_language)
-            if not errs:
-                break
-
-            validation_errors.extend(errs)
-            if (exercises_attempts - 1) >= ex_repairs_max:
-                break
-
-            logger.warning("AI exercises validation failed, attempting JSON fix: %s", errs)
-            exercises_container = await self._fix_json_with_patch(
-                invalid_json=exercises_container,
-                errors=self._errors_to_patch_lines(errs),
-                instruction=(
-                    f"You previously generated ONLY exercises JSON for a {target_language} lesson. Fix ONLY the exercises JSON." 
-                ),
+        with timings.stage("exercises_repair"):
+            exercises_container, ex_errs, exercises_attempts = await self._validate_and_repair_exercises(
+                exercises_container,
+                target_language=target_language,
+                max_repairs=ex_repairs_max,
                 db=db,
+                sanitize=True,
             )
-
-            exercises_container = self._sanitize_exercises_container(exercises_container)
+        validation_errors.extend(ex_errs)
 
                                                                                
         if mode == "strict" and isinstance(exercises_container, dict):
+            # Both checks read the same exercises, so their issues go into a single repair call.
             exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
             trace_errs = self._validate_exercise_traceability(exercises, vocab_words=vocab_words)
-            if trace_errs:
+            ss_errs = self._validate_sentence_source(exercises, lesson_text=text)
+            if trace_errs or ss_errs:
                 validation_errors.extend(trace_errs)
+                validation_errors.extend(ss_errs)
 
-                exercises_container = await self._fix_json_with_patch(
-                    invalid_json=exercises_container,
-                    errors=self._errors_to_patch_lines(trace_errs),
-                    instruction=(
-                        f"You previously generated ONLY exercises JSON for a {target_language} lesson. "
+                instruction = f"You previously generated ONLY exercises JSON for a {target_language} lesson. "
+                if trace_errs:
+                    instruction += (
                         f"Add/repair traceability fields: source (must match exercise type: quiz/match=vocab, others=text) "
-                        f"and targets (each must be from the lesson vocabulary)."
-                    ),
-                    db=db,
-                )
-
-                                                                                      
-            exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
-            ss_errs = self._validate_sentence_source(exercises, lesson_text=text)
-            if ss_errs:
-                validation_errors.extend(ss_errs)
-                exercises_container = await self._fix_json_with_patch(
-                    invalid_json=exercises_container,
-                    errors=self._errors_to_patch_lines(ss_errs),
-                    instruction=(
-                        f"You previously generated ONLY exercises JSON for a {target_language} lesson. "
+                        f"and targets (each must be from the lesson vocabulary). "
+                    )
+                if ss_errs:
+                    instruction += (
                         f"For every text-based exercise (true_false/fill_blank/scramble) set sentence_source to an EXACT substring from the provided lesson text."
-                    ),
-                    db=db,
-                )
+                    )
+                with timings.stage("exercises_traceability"):
+                    exercises_container = await self._fix_json_with_patch(
+                        invalid_json=exercises_container,
+                        errors=self._errors_to_patch_lines(list(trace_errs) + list(ss_errs)),
+                        instruction=instruction.strip(),
+                        db=db,
+                    )
 
                                                                                                                   
         if mode == "strict" and isinstance(exercises_container, dict):
             try:
-                reviewed_ex, ex_issues = await self._strict_review_and_fix_exercises(
-                    exercises_container=exercises_container,
-                    target_language=target_language,
-                    native_language=native_language,
-                    topic=topic,
-                    text=text,
-                    vocab_pairs=vocab_pairs,
-                    db=db,
-                )
+                with timings.stage("exercises_review"):
+                    reviewed_ex, ex_issues = await self._strict_review_and_fix_exercises(
+                        exercises_container=exercises_container,
+                        target_language=target_language,
+                        native_language=native_language,
+                        topic=topic,
+                        text=text,
+                        vocab_pairs=vocab_pairs,
+                        db=db,
+                    )
                 if isinstance(reviewed_ex, dict):
                     exercises_container = reviewed_ex
                 if ex_issues:
@@ -1777,6 +2320,7 @@ class AIService:
                 "provider": provider_name,
                 "model": model_name,
                 "quality_status": quality_status,
+                "stage_timings_ms": dict(timings),
             },
         }
 
@@ -1784,6 +2328,8 @@ class AIService:
         if mode == "balanced":
             too_many_errors = len(validation_errors) >= 6
             if quality_status == "needs_review" or too_many_errors:
+                # The core passed validation already; escalate only the exercise stage to strict settings.
+                escalation_started = time.monotonic()
                 try:
                     strict_out = await self.generate_lesson(
                         topic=topic,
@@ -1797,10 +2343,26 @@ class AIService:
                         recent_exercise_types=recent_exercise_types,
                         generation_mode="strict",
                         db=db,
+                        reuse_core=lesson_core,
                     )
-                    return strict_out
                 except Exception:
                     return out
+                strict_meta = strict_out.get("_meta") if isinstance(strict_out.get("_meta"), dict) else {}
+                # The reused core skipped the strict-only core review, so the lesson is not a strict one
+                # (the lesson library ranks variants by this label).
+                strict_meta["generation_mode"] = "balanced"
+                strict_meta["escalation"] = {
+                    "from": "balanced",
+                    "exercises_mode": "strict",
+                    "reason": "needs_review" if quality_status == "needs_review" else "validation_errors",
+                    "reused": ["text", "vocabulary"],
+                    "rerun": ["exercises"],
+                    "balanced_validation_errors": len(validation_errors),
+                    "balanced_stage_timings_ms": dict(timings),
+                    "elapsed_ms": int((time.monotonic() - escalation_started) * 1000),
+                }
+                strict_out["_meta"] = strict_meta
+                return strict_out
 
         return out
 
@@ -1840,6 +2402,7 @@ class AIService:
             db=db,
             use_cache=True,
             temperature=float(getattr(settings, "AI_TEMPERATURE_TEXT", 0.6) or 0.6),
+            operation="lesson_core",
         )
 
     async def extract_vocab_from_text(
@@ -1857,12 +2420,19 @@ class AIService:
             level=level,
             text=str(text or ""),
         )
+        fingerprint = PromptFingerprint(
+            operation="vocab_extraction",
+            exact={"target_language": target_language, "native_language": native_language, "level": level},
+            fuzzy={"text": str(text or "")},
+        )
         return await self._generate_json_with_retries(
             prompt,
             max_attempts=6,
             db=db,
             use_cache=True,
             temperature=float(getattr(settings, "AI_TEMPERATURE_JSON", 0.2) or 0.2),
+            operation="vocab_extraction",
+            fingerprint=fingerprint,
         )
 
     async def generate_exercises_vocab_only(
@@ -1892,6 +2462,7 @@ class AIService:
             db=db,
             use_cache=True,
             temperature=float(getattr(settings, "AI_TEMPERATURE_JSON", 0.2) or 0.2),
+            operation="exercises",
         )
 
     async def generate_exercises_text_only(
@@ -1923,6 +2494,7 @@ class AIService:
             db=db,
             use_cache=True,
             temperature=float(getattr(settings, "AI_TEMPERATURE_JSON", 0.2) or 0.2),
+            operation="exercises",
         )
 
     async def generate_text_vocab_only(
@@ -1966,22 +2538,6 @@ class AIService:
             native_language=native_language,
         )
 
-        plan_payload = None
-        if mode == "strict":
-            try:
-                plan_payload = await self._strict_plan(
-                    topic=topic,
-                    target_language=target_language,
-                    native_language=native_language,
-                    level=level,
-                    interests=interests_str,
-                    prior_topics=prior_topics,
-                    used_words=used_words,
-                    db=db,
-                )
-            except Exception:
-                plan_payload = None
-
         prompt_text_vocab = LESSON_TEXT_VOCAB_TEMPLATE.format(
             target_language=target_language,
             native_language=native_language,
@@ -1990,12 +2546,33 @@ class AIService:
             interests=interests_str,
         ) + base_suffix
 
-        if isinstance(plan_payload, dict) and plan_payload:
-            prompt_text_vocab += "\n\nLESSON_PLAN_JSON (follow this plan):\n" + json.dumps(plan_payload, ensure_ascii=False)
+        async def _plan_stage(_: dict) -> dict | None:
+            return await self._strict_plan(
+                topic=topic,
+                target_language=target_language,
+                native_language=native_language,
+                level=level,
+                interests=interests_str,
+                prior_topics=prior_topics,
+                used_words=used_words,
+                db=db,
+            )
 
-                                                                           
-        if mode == "strict" and strict_multistep:
-            text_payload = await self.generate_text_only(
+        async def _text_vocab_stage(inputs: dict) -> dict:
+            prompt = prompt_text_vocab
+            plan_payload = inputs.get("plan")
+            if isinstance(plan_payload, dict) and plan_payload:
+                prompt += "\n\nLESSON_PLAN_JSON (follow this plan):\n" + json.dumps(plan_payload, ensure_ascii=False)
+            return await self._generate_json_with_retries(
+                prompt,
+                max_attempts=max_ai_attempts,
+                db=db,
+                use_cache=True,
+                operation="lesson_core",
+            )
+
+        async def _text_stage(_: dict) -> dict:
+            return await self.generate_text_only(
                 topic=topic,
                 target_language=target_language,
                 native_language=native_language,
@@ -2007,6 +2584,9 @@ class AIService:
                 recent_exercise_types=recent_exercise_types,
                 db=db,
             )
+
+        async def _vocab_stage(inputs: dict) -> dict:
+            text_payload = inputs["text"]
             text_val = str(text_payload.get("text") or "") if isinstance(text_payload, dict) else ""
             vocab_payload = await self.extract_vocab_from_text(
                 text=text_val,
@@ -2015,56 +2595,68 @@ class AIService:
                 level=level,
                 db=db,
             )
-            lesson_core = {
+            return {
                 "text": text_val,
                 "vocabulary": (vocab_payload.get("vocabulary") if isinstance(vocab_payload, dict) else []) or [],
             }
+
+        # Strict multistep writes the text first and extracts vocabulary from it; the plan only
+        # feeds the single-shot text+vocab prompt, so it is scheduled only where it is consumed.
+        timings = StageTimings()
+        if mode == "strict" and strict_multistep:
+            stages = [Stage("text", _text_stage), Stage("vocab", _vocab_stage, deps=("text",))]
+            core_stage = "vocab"
+        elif mode == "strict":
+            stages = [
+                Stage("plan", _plan_stage, optional=True),
+                Stage("text_vocab", _text_vocab_stage, deps=("plan",)),
+            ]
+            core_stage = "text_vocab"
         else:
-            lesson_core = await self._generate_json_with_retries(
-                prompt_text_vocab,
-                max_attempts=max_ai_attempts,
-                db=db,
-                use_cache=True,
-            )
+            stages = [Stage("text_vocab", _text_vocab_stage)]
+            core_stage = "text_vocab"
+        lesson_core = (await run_stages(stages, timings))[core_stage]
+
         validation_errors: list[dict] = []
         repair_count = 0
 
-        for _ in range(0, core_repairs_max + 1):
-            errs = self._validate_text_and_vocab(
-                lesson_core,
-                target_language=target_language,
-                native_language=native_language,
-            )
+        with timings.stage("core_repair"):
+            for _ in range(0, core_repairs_max + 1):
+                errs = self._validate_text_and_vocab(
+                    lesson_core,
+                    target_language=target_language,
+                    native_language=native_language,
+                )
 
                                                                           
-            if mode == "strict" and self._is_game_role_topic(topic):
-                txt = str(lesson_core.get("text") or "") if isinstance(lesson_core, dict) else ""
-                if not self._has_game_context(txt):
-                    errs = list(errs) + [
-                        {
-                            "code": "topic_not_game_context",
-                            "field": "text",
-                            "reason": "topic_relevance",
-                            "message": "Topic indicates a MOBA game/roles, but the text lacks game context (match/team/roles/map/items).",
-                        }
-                    ]
+                if mode == "strict" and self._is_game_role_topic(topic):
+                    txt = str(lesson_core.get("text") or "") if isinstance(lesson_core, dict) else ""
+                    if not self._has_game_context(txt):
+                        errs = list(errs) + [
+                            {
+                                "code": "topic_not_game_context",
+                                "field": "text",
+                                "reason": "topic_relevance",
+                                "message": "Topic indicates a MOBA game/roles, but the text lacks game context (match/team/roles/map/items).",
+                            }
+                        ]
 
-            if not errs:
-                break
-            validation_errors.extend(errs)
-            if repair_count >= core_repairs_max:
-                break
-            logger.warning("AI lesson core validation failed, attempting JSON fix: %s", errs)
-            repair_count += 1
-            lesson_core = await self._fix_json_with_patch(
-                invalid_json=lesson_core,
-                errors=self._errors_to_patch_lines(errs),
-                instruction=(
-                    f"You previously generated lesson JSON for {target_language}/{native_language} but it failed validation. "
-                    f"Fix the SAME JSON. If the topic is about a MOBA game / Mobile Legends roles (marksman/fighter/etc.), rewrite the text to be explicitly about the video game (match, team, roles, map, items), not real-life warriors." 
-                ),
-                db=db,
-            )
+                if not errs:
+                    break
+                validation_errors.extend(errs)
+                if repair_count >= core_repairs_max:
+                    break
+                logger.warning("AI lesson core validation failed, attempting JSON fix: %s", errs)
+                repair_count += 1
+                lesson_core = await self._fix_json_with_patch(
+                    invalid_json=lesson_core,
+                    errors=self._errors_to_patch_lines(errs),
+                    instruction=(
+                        f"You previously generated lesson JSON for {target_language}/{native_language} but it failed validation. "
+                        f"Fix the SAME JSON. If the topic is about a MOBA game / Mobile Legends roles (marksman/fighter/etc.), rewrite the text to be explicitly about the video game (match, team, roles, map, items), not real-life warriors." 
+                    ),
+                    db=db,
+                )
 
         core_final_errs = self._validate_text_and_vocab(
             lesson_core,
@@ -2077,30 +2669,31 @@ class AIService:
 
         if mode == "strict":
             try:
-                reviewed, review_issues = await self._strict_review_and_fix_core(
-                    lesson_core=lesson_core,
-                    topic=topic,
-                    target_language=target_language,
-                    native_language=native_language,
-                    level=level,
-                    db=db,
-                )
-                if isinstance(reviewed, dict):
-                    lesson_core = reviewed
-                    if review_issues:
-                        validation_errors.extend(
-                            [
-                                {
-                                    "code": (it.get("code") or "review_issue"),
-                                    "field": (it.get("field") or "review"),
-                                    "reason": "review",
-                                    "message": (it.get("why") or ""),
-                                }
-                                for it in (review_issues or [])
-                                if isinstance(it, dict)
-                            ]
-                        )
-                        repair_count += 1
+                with timings.stage("core_review"):
+                    reviewed, review_issues = await self._strict_review_and_fix_core(
+                        lesson_core=lesson_core,
+                        topic=topic,
+                        target_language=target_language,
+                        native_language=native_language,
+                        level=level,
+                        db=db,
+                    )
+                    if isinstance(reviewed, dict):
+                        lesson_core = reviewed
+                        if review_issues:
+                            validation_errors.extend(
+                                [
+                                    {
+                                        "code": (it.get("code") or "review_issue"),
+                                        "field": (it.get("field") or "review"),
+                                        "reason": "review",
+                                        "message": (it.get("why") or ""),
+                                    }
+                                    for it in (review_issues or [])
+                                    if isinstance(it, dict)
+                                ]
+                            )
+                            repair_count += 1
             except Exception:
                 pass
 
@@ -2113,6 +2706,7 @@ class AIService:
                 "validation_errors": validation_errors,
                 "provider": provider_name,
                 "model": model_name,
+                "stage_timings_ms": dict(timings),
             },
         }
 
@@ -2156,31 +2750,17 @@ class AIService:
             max_attempts=max_ai_attempts,
             db=db,
             use_cache=True,
+            operation="exercises",
         )
-        validation_errors: list[dict] = []
-        exercises_attempts = 0
         quality_status = "ok"
 
-        for _ in range(0, ex_repairs_max + 1):
-            exercises_attempts += 1
-            exercises = exercises_container.get("exercises") if isinstance(exercises_container, dict) else None
-            errs = self._validate_exercises(exercises, target_language=target_language)
-            if not errs:
-                break
-
-            validation_errors.extend(errs)
-            if (exercises_attempts - 1) >= ex_repairs_max:
-                break
-
-            logger.warning("AI exercises validation failed, attempting JSON fix: %s", errs)
-            exercises_container = await self._fix_json_with_patch(
-                invalid_json=exercises_container,
-                errors=self._errors_to_patch_lines(errs),
-                instruction=(
-                    f"You previously generated ONLY exercises JSON for a {target_language} lesson. Fix ONLY the exercises JSON."
-                ),
-                db=db,
-            )
+        exercises_container, validation_errors, exercises_attempts = await self._validate_and_repair_exercises(
+            exercises_container,
+            target_language=target_language,
+            max_repairs=ex_repairs_max,
+            db=db,
+            sanitize=False,
+        )
 
         if self._validate_exercises(
             exercises_container.get("exercises") if isinstance(exercises_container, dict) else None,
@@ -2223,9 +2803,16 @@ class AIService:
             interests=interests,
         )
         prompt = self._truncate_prompt(prompt)
+        fingerprint = PromptFingerprint(
+            operation="course_path",
+            exact={"target_language": target_language, "native_language": native_language, "level": level},
+            fuzzy={"theme": theme_str, "interests": [i for i in str(interests or "").split(",")]},
+        )
 
         try:
-            return await self._generate_json_with_retries(prompt, db=db, use_cache=True)
+            return await self._generate_json_with_retries(
+                prompt, db=db, use_cache=True, operation="course_path", fingerprint=fingerprint
+            )
         except ServiceException as e:
             logger.warning("Path Generation Failed: %s", str(e))
                                             
@@ -2254,7 +2841,8 @@ class AIService:
              messages.append({"role": role_name, "content": self._truncate_prompt(msg['content'])})
 
         try:
-            return await self.provider.generate_chat(messages)
+            with generation_profile("roleplay") as active:
+                return await self.provider.generate_chat(messages, temperature=active.profile.temperature)
         except Exception as e:
             raise ServiceException(f"AI provider error: {str(e)}")
 
@@ -0,0 +1,240 @@
+"""Обслуживание таблицы `llm_cache_entries`.
+
+- промпт и ответ хранятся сжатыми (zlib), старые строки читаются как есть
+- попадания копятся в памяти и пишутся пачкой (`hit_count`, `last_hit_at`)
+- вытеснение по TTL и по числу строк (LRU по последнему использованию)
+  идёт небольшими порциями, каждая — в своей транзакции
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import zlib
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import bindparam, delete, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.features.ai.models import LLMCacheEntry
+from app.features.common.db import begin_if_needed
+
+
+logger = logging.getLogger(__name__)
+
+_table = LLMCacheEntry.__table__
+
+
+def compress_text(value: str) -> bytes:
+    return zlib.compress(str(value or "").encode("utf-8"), 6)
+
+
+def decompress_text(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def encode_response(response: Any) -> bytes:
+    return compress_text(json.dumps(response, ensure_ascii=False, separators=(",", ":")))
+
+
+def entry_response(entry: LLMCacheEntry | None) -> dict | None:
+    if entry is None:
+        return None
+    if entry.response_gz is not None:
+        try:
+            return json.loads(decompress_text(entry.response_gz))
+        except (zlib.error, ValueError):
+            logger.warning("Corrupted compressed cache entry %s", entry.prompt_hash)
+            return None
+    return entry.response_json
+
+
+def entry_prompt(entry: LLMCacheEntry) -> str:
+    return decompress_text(entry.prompt_gz) if entry.prompt_gz is not None else str(entry.prompt or "")
+
+
+def _session_factory(session_factory=None):
+    if session_factory is not None:
+        return session_factory
+    from app.core.database import AsyncSessionLocal
+
+    return AsyncSessionLocal
+
+
+class CacheHitRecorder:
+    def __init__(self) -> None:
+        self._pending: dict[str, tuple[int, datetime]] = {}
+
+    def record(self, prompt_hash: str | None) -> None:
+        if not prompt_hash:
+            return
+        count, _ = self._pending.get(prompt_hash, (0, None))
+        self._pending[prompt_hash] = (count + 1, datetime.utcnow())
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def clear(self) -> None:
+        self._pending.clear()
+
+    async def flush(self, session_factory=None) -> int:
+        """Пишет накопленные попадания одним executemany; возвращает число обновлённых ключей."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        rows = [{"h": h, "n": n, "ts": ts} for h, (n, ts) in batch.items()]
+        stmt = (
+            update(_table)
+            .where(_table.c.prompt_hash == bindparam("h"))
+            .values(hit_count=_table.c.hit_count + bindparam("n"), last_hit_at=bindparam("ts"))
+        )
+        try:
+            async with _session_factory(session_factory)() as db:
+                async with begin_if_needed(db):
+                    await db.execute(stmt, rows)
+        except Exception:
+            logger.warning("Failed to flush %d LLM cache hit counters", len(rows), exc_info=True)
+            for h, (n, ts) in batch.items():
+                count, _ = self._pending.get(h, (0, None))
+                self._pending[h] = (count + n, ts)
+            return 0
+        return len(rows)
+
+
+async def _delete_chunk(session_factory, query) -> int:
+    async with session_factory() as db:
+        async with begin_if_needed(db):
+            ids = list((await db.execute(query)).scalars().all())
+            if ids:
+                await db.execute(delete(_table).where(_table.c.id.in_(ids)))
+    return len(ids)
+
+
+async def evict_llm_cache(
+    session_factory=None,
+    *,
+    ttl_seconds: int | None = None,
+    max_rows: int | None = None,
+    chunk_size: int | None = None,
+    max_chunks: int | None = None,
+) -> dict[str, int]:
+    """Удаляет просроченные и самые давно использованные строки порциями по `chunk_size`."""
+    factory = _session_factory(session_factory)
+    ttl = int(ttl_seconds if ttl_seconds is not None else getattr(settings, "AI_LLM_CACHE_TTL_SECONDS", 0) or 0)
+    cap = int(max_rows if max_rows is not None else getattr(settings, "AI_LLM_CACHE_MAX_ROWS", 0) or 0)
+    chunk = max(1, int(chunk_size or getattr(settings, "AI_LLM_CACHE_EVICT_CHUNK", 500) or 500))
+    budget = max(1, int(max_chunks or getattr(settings, "AI_LLM_CACHE_EVICT_MAX_CHUNKS", 20) or 20))
+
+    last_used = func.coalesce(_table.c.last_hit_at, _table.c.created_at)
+    out = {"expired": 0, "over_capacity": 0, "chunks": 0}
+
+    if ttl > 0:
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        while out["chunks"] < budget:
+            n = await _delete_chunk(
+                factory, select(_table.c.id).where(last_used < cutoff).order_by(last_used.asc()).limit(chunk)
+            )
+            if not n:
+                break
+            out["chunks"] += 1
+            out["expired"] += n
+
+    if cap > 0:
+        async with factory() as db:
+            total = int((await db.execute(select(func.count()).select_from(_table))).scalar() or 0)
+        excess = total - cap
+        while excess > 0 and out["chunks"] < budget:
+            n = await _delete_chunk(
+                factory, select(_table.c.id).order_by(last_used.asc()).limit(min(chunk, excess))
+            )
+            if not n:
+                break
+            out["chunks"] += 1
+            out["over_capacity"] += n
+            excess -= n
+
+    return out
+
+
+async def cache_size_report(db: AsyncSession) -> dict[str, Any]:
+    totals = (
+        await db.execute(
+            select(
+                func.count(),
+                func.coalesce(func.sum(_table.c.size_bytes), 0),
+                func.coalesce(func.sum(_table.c.hit_count), 0),
+                func.min(_table.c.created_at),
+                func.max(_table.c.created_at),
+            ).select_from(_table)
+        )
+    ).one()
+    legacy_rows = (
+        await db.execute(select(func.count()).select_from(_table).where(_table.c.response_gz.is_(None)))
+    ).scalar()
+    by_model = (
+        await db.execute(
+            select(_table.c.provider, _table.c.model, func.count(), func.coalesce(func.sum(_table.c.size_bytes), 0))
+            .group_by(_table.c.provider, _table.c.model)
+            .order_by(func.count().desc())
+        )
+    ).all()
+
+    table_bytes = None
+    if db.get_bind().dialect.name == "postgresql":
+        table_bytes = (await db.execute(text("SELECT pg_total_relation_size('llm_cache_entries')"))).scalar()
+
+    return {
+        "rows": int(totals[0] or 0),
+        "legacy_uncompressed_rows": int(legacy_rows or 0),
+        "stored_bytes": int(totals[1] or 0),
+        "table_bytes": int(table_bytes) if table_bytes is not None else None,
+        "total_hits": int(totals[2] or 0),
+        "pending_hit_keys": llm_cache_hits.pending(),
+        "oldest_created_at": totals[3],
+        "newest_created_at": totals[4],
+        "ttl_seconds": int(getattr(settings, "AI_LLM_CACHE_TTL_SECONDS", 0) or 0),
+        "max_rows": int(getattr(settings, "AI_LLM_CACHE_MAX_ROWS", 0) or 0),
+        "by_model": [
+            {"provider": r[0], "model": r[1], "rows": int(r[2] or 0), "stored_bytes": int(r[3] or 0)} for r in by_model
+        ],
+    }
+
+
+class LLMCacheMaintenance:
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+
+    async def _loop(self) -> None:
+        flush_every = float(getattr(settings, "AI_LLM_CACHE_HIT_FLUSH_SECONDS", 30.0) or 30.0)
+        evict_every = float(getattr(settings, "AI_LLM_CACHE_EVICT_INTERVAL_SECONDS", 3600) or 3600)
+        since_evict = 0.0
+        while True:
+            await asyncio.sleep(flush_every)
+            await llm_cache_hits.flush()
+            since_evict += flush_every
+            if since_evict >= evict_every:
+                since_evict = 0.0
+                try:
+                    result = await evict_llm_cache()
+                    if result["expired"] or result["over_capacity"]:
+                        logger.info("LLM cache eviction: %s", result)
+                except Exception:
+                    logger.warning("LLM cache eviction failed", exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await llm_cache_hits.flush()
+
+
+llm_cache_hits = CacheHitRecorder()
+llm_cache_maintenance = LLMCacheMaintenance()
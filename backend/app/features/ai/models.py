@@ -1,6 +1,6 @@
 import uuid
 
-from sqlalchemy import Column, DateTime, Integer, JSON, String, UniqueConstraint
+from sqlalchemy import Column, DateTime, Index, Integer, JSON, LargeBinary, String, UniqueConstraint
 from sqlalchemy.sql import func
 
 from app.models.base import Base
@@ -19,12 +19,23 @@ class LLMCacheEntry(Base):
     provider = Column(String, nullable=True)
     model = Column(String, nullable=True)
 
+    # Legacy rows keep plain prompt/response_json; new rows store zlib-compressed *_gz instead.
     prompt = Column(String, nullable=False, default="")
-    response_json = Column(JSON, nullable=False)
+    response_json = Column(JSON, nullable=True)
+    prompt_gz = Column(LargeBinary, nullable=True)
+    response_gz = Column(LargeBinary, nullable=True)
+    size_bytes = Column(Integer, nullable=False, default=0)
+
+    hit_count = Column(Integer, nullable=False, default=0)
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
+# Eviction filters and orders by this exact expression (cache_maintenance.evict_llm_cache).
+Index("ix_llm_cache_last_used", func.coalesce(LLMCacheEntry.last_hit_at, LLMCacheEntry.created_at))
+
+
 class AIGenerationEvent(Base):
     __tablename__ = "ai_generation_events"
 
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
-from typing import Any
+import json
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.features.ai.models import LLMCacheEntry, AIGenerationEvent
+from app.core.config import settings
+from app.features.ai.cache_maintenance import compress_text, encode_response
+from app.features.ai.models import LLMCacheEntry
 
 
 class AIIOpsRepository:
@@ -25,41 +27,26 @@ class AIIOpsRepository:
         provider: str | None = None,
         model: str | None = None,
     ) -> LLMCacheEntry:
-        obj = LLMCacheEntry(
-            prompt_hash=prompt_hash,
-            prompt=prompt,
-            response_json=response_json,
-            provider=provider,
-            model=model,
-        )
-        self.db.add(obj)
-        return obj
-
-    async def create_event(
-        self,
-        *,
-        enrollment_id: Any | None,
-        generated_lesson_id: Any | None,
-        operation: str,
-        provider: str | None,
-        model: str | None,
-        generation_mode: str | None,
-        latency_ms: int | None,
-        repair_count: int | None,
-        quality_status: str | None,
-        error_codes: list[str] | None,
-    ) -> AIGenerationEvent:
-        obj = AIGenerationEvent(
-            enrollment_id=enrollment_id,
-            generated_lesson_id=generated_lesson_id,
-            operation=operation,
-            provider=provider,
-            model=model,
-            generation_mode=generation_mode,
-            latency_ms=latency_ms,
-            repair_count=repair_count,
-            quality_status=quality_status,
-            error_codes=error_codes,
-        )
+        if getattr(settings, "AI_LLM_CACHE_COMPRESS", True):
+            prompt_gz = compress_text(prompt)
+            response_gz = encode_response(response_json)
+            obj = LLMCacheEntry(
+                prompt_hash=prompt_hash,
+                prompt="",
+                prompt_gz=prompt_gz,
+                response_gz=response_gz,
+                size_bytes=len(prompt_gz) + len(response_gz),
+                provider=provider,
+                model=model,
+            )
+        else:
+            obj = LLMCacheEntry(
+                prompt_hash=prompt_hash,
+                prompt=prompt,
+                response_json=response_json,
+                size_bytes=len(prompt.encode("utf-8")) + len(json.dumps(response_json, ensure_ascii=False).encode("utf-8")),
+                provider=provider,
+                model=model,
+            )
         self.db.add(obj)
         return obj
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class LLMCacheModelUsage(BaseModel):
+    provider: str | None = None
+    model: str | None = None
+    rows: int
+    stored_bytes: int
+
+
+class LLMCacheReport(BaseModel):
+    rows: int
+    legacy_uncompressed_rows: int
+    stored_bytes: int
+    table_bytes: int | None = None
+    total_hits: int
+    pending_hit_keys: int
+    oldest_created_at: datetime | None = None
+    newest_created_at: datetime | None = None
+    ttl_seconds: int
+    max_rows: int
+    by_model: list[LLMCacheModelUsage]
+
+
+class LLMCacheEvictionResult(BaseModel):
+    expired: int
+    over_capacity: int
+    chunks: int
@@ -0,0 +1,145 @@
+"""Отложенная запись телеметрии генерации (`ai_generation_events`).
+
+События не пишутся в транзакцию запроса: они копятся в ограниченной очереди
+процесса и сбрасываются многострочным INSERT — когда набралась пачка или
+прошло `AI_TELEMETRY_FLUSH_SECONDS`. Если очередь полна, новое событие
+отбрасывается и учитывается в счётчике `dropped`. При остановке приложения
+очередь дописывается до конца.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import insert
+
+from app.core.config import settings
+from app.features.ai.models import AIGenerationEvent
+from app.features.common.db import begin_if_needed
+
+
+logger = logging.getLogger(__name__)
+
+_table = AIGenerationEvent.__table__
+_FIELDS = frozenset(c.name for c in _table.columns) - {"id", "created_at"}
+
+
+def _session_factory(session_factory=None):
+    if session_factory is not None:
+        return session_factory
+    from app.core.database import AsyncSessionLocal
+
+    return AsyncSessionLocal
+
+
+class AIEventBuffer:
+    def __init__(self) -> None:
+        self._queue: deque[dict[str, Any]] = deque()
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+
+    @staticmethod
+    def _capacity() -> int:
+        return max(1, int(getattr(settings, "AI_TELEMETRY_BUFFER_MAX", 10000) or 10000))
+
+    @staticmethod
+    def _batch_size() -> int:
+        return max(1, int(getattr(settings, "AI_TELEMETRY_BATCH_SIZE", 200) or 200))
+
+    def record(self, **fields: Any) -> bool:
+        """Ставит событие в очередь; `False`, если оно отброшено из‑за переполнения."""
+        if len(self._queue) >= self._capacity():
+            self.dropped += 1
+            return False
+        row = {k: v for k, v in fields.items() if k in _FIELDS}
+        row["id"] = uuid.uuid4()
+        # Stamped when the event happens, not when the batch is flushed.
+        row["created_at"] = datetime.now(timezone.utc)
+        self._queue.append(row)
+        self.enqueued += 1
+        if self._wakeup is not None and len(self._queue) >= self._batch_size():
+            self._wakeup.set()
+        return True
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    async def flush(self, session_factory=None, *, max_batches: int | None = None) -> int:
+        """Пишет очередь пачками по `AI_TELEMETRY_BATCH_SIZE`; возвращает число записанных строк."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        batches = 0
+        async with self._flush_lock:
+            while self._queue and (max_batches is None or batches < max_batches):
+                size = min(self._batch_size(), len(self._queue))
+                rows = [self._queue.popleft() for _ in range(size)]
+                try:
+                    async with _session_factory(session_factory)() as db:
+                        async with begin_if_needed(db):
+                            await db.execute(insert(_table), rows)
+                except Exception:
+                    self.failures += 1
+                    logger.warning("Failed to write %d AI generation events", len(rows), exc_info=True)
+                    # Put the batch back in front as far as capacity allows; the rest is lost.
+                    room = max(0, self._capacity() - len(self._queue))
+                    self.dropped += len(rows) - min(room, len(rows))
+                    self._queue.extendleft(reversed(rows[:room]))
+                    break
+                written += len(rows)
+                batches += 1
+        self.written += written
+        self.batches += batches
+        return written
+
+    async def _loop(self) -> None:
+        interval = float(getattr(settings, "AI_TELEMETRY_FLUSH_SECONDS", 2.0) or 2.0)
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._wakeup = None
+        await self.flush()
+
+    def clear(self) -> None:
+        self._queue.clear()
+        self.enqueued = self.dropped = self.written = self.batches = self.failures = 0
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._queue),
+            "capacity": self._capacity(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "failures": self.failures,
+        }
+
+
+ai_event_buffer = AIEventBuffer()
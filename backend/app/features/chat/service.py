@@ -1,12 +1,13 @@
 import re
 import math
+import asyncio
 import logging
-from typing import Any
+from typing import Any, AsyncIterator
 from datetime import datetime, timedelta, timezone
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import select
+from sqlalchemy import delete, select
 
 from app.core.exceptions import EntityNotFoundException, ServiceException
 from app.features.common.db import begin_if_needed
@@ -23,7 +24,11 @@ from app.features.chat.repository import (
 )
 from app.features.memory.repository import MemoryRepository
 from app.features.ai.ai_service import ai_service
+from app.core.ai.profiles import generation_profile
+from app.core.ai.prompt_packer import PromptPacker, PromptSection, context_budget_for_model
+from app.core.ai.scheduler import PRIORITY_BACKGROUND, llm_priority
 from app.core.config import settings
+from app.core.metrics import chat_turns_discarded
 from app.utils.prompt_templates import CHAT_SESSION_SUMMARY_TEMPLATE
 from app.features.posts.service import PostService
 from app.features.posts.schemas import PostCreate
@@ -205,7 +210,8 @@ class ChatService:
             dialogue="\n".join(history_lines[-120:]),
         )
 
-        summary_text = await ai_service.provider.generate_text(prompt)
+        with llm_priority(PRIORITY_BACKGROUND), generation_profile("summary") as active:
+            summary_text = await ai_service.provider.generate_text(prompt, temperature=active.profile.temperature)
         row = ChatSessionSummary(session_id=session.id, up_to_turn_index=max_index, content=summary_text)
         async with begin_if_needed(self.db):
             await self.summaries.create(row)
@@ -422,20 +428,7 @@ class ChatService:
                 "Output JSON format:\n{\n  \"speaker\": \"<one of the CHARACTER names above>\",\n  \"message\": \"...\"\n}"
             )
 
-        if pinned:
-            system_parts.append("PINNED MEMORY (always true):\n" + "\n".join([f"- {m.title}: {m.content}" for m in pinned]))
-
-        if latest_summary and (latest_summary.content or "").strip():
-            system_parts.append("SESSION SUMMARY:\n" + latest_summary.content.strip())
-
-        if relevant:
-            system_parts.append(
-                "RELEVANT MEMORY:\n" + "\n".join([f"- {m.title}: {m.content}" for m in relevant])
-            )
-
-        system_prompt = "\n\n".join([p for p in system_parts if (p or "").strip()])
-
-        messages: list[dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        history: list[dict[str, str]] = []
         for t in recent:
             content = t.content
             try:
@@ -446,184 +439,383 @@ class ChatService:
                 content = t.content
 
             if t.role == "user":
-                messages.append({"role": "user", "content": content})
-            elif t.role in {"assistant", "director"}:
-                messages.append({"role": "assistant", "content": content})
+                history.append({"role": "user", "content": content})
             else:
-                messages.append({"role": "assistant", "content": content})
+                history.append({"role": "assistant", "content": content})
+
+        summary_text = (latest_summary.content or "").strip() if latest_summary else ""
+        persona = [p for p in system_parts if (p or "").strip()]
+
+        # Newest turns and memories first; each optional section is capped by its
+        # share of the per-model budget so no one section crowds out the rest.
+        # Pinned memories are user-promised facts: always sent, like the persona.
+        model = getattr(ai_service.provider, "model", None)
+        packed = PromptPacker(context_budget_for_model(model)).pack(
+            [
+                PromptSection("persona", persona, priority=0, required=True),
+                PromptSection("current", [user_message], priority=0, required=True),
+                PromptSection(
+                    "recent",
+                    [m["content"] or "" for m in reversed(history)],
+                    priority=1,
+                    quota=0.6,
+                    contiguous=True,
+                ),
+                PromptSection("pinned", [f"- {m.title}: {m.content}" for m in pinned], priority=0, required=True),
+                PromptSection("summary", [summary_text] if summary_text else [], priority=3, quota=0.1),
+                PromptSection("relevant", [f"- {m.title}: {m.content}" for m in relevant], priority=4, quota=0.15),
+            ]
+        )
+
+        kept_pinned = [pinned[i] for i in packed.kept("pinned")]
+        kept_relevant = [relevant[i] for i in packed.kept("relevant")]
+        kept_history = [history[len(history) - 1 - i] for i in reversed(packed.kept("recent"))]
+
+        if kept_pinned:
+            persona.append("PINNED MEMORY (always true):\n" + "\n".join([f"- {m.title}: {m.content}" for m in kept_pinned]))
+
+        if packed.kept("summary"):
+            persona.append("SESSION SUMMARY:\n" + summary_text)
 
+        if kept_relevant:
+            persona.append(
+                "RELEVANT MEMORY:\n" + "\n".join([f"- {m.title}: {m.content}" for m in kept_relevant])
+            )
+
+        if any(packed.dropped.values()):
+            logger.debug(
+                "Chat context packed session_id=%s tokens=%s/%s dropped=%s",
+                str(session.id),
+                packed.used_tokens,
+                packed.budget_tokens,
+                packed.dropped,
+            )
+
+        system_prompt = "\n\n".join(persona)
+
+        messages: list[dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        messages.extend(kept_history)
         messages.append({"role": "user", "content": user_message})
-        return messages, (pinned + relevant), room_participants_by_name, temperature
+        return messages, (kept_pinned + kept_relevant), room_participants_by_name, temperature
 
-    async def generate_turn(self, *, owner_user_id, session_id, user_message: str) -> dict[str, Any]:
+    async def ensure_session_owner(self, *, session_id, owner_user_id) -> ChatSession:
         session = await self.sessions.get(session_id)
         if not session or session.owner_user_id != owner_user_id:
             raise EntityNotFoundException("ChatSession", session_id)
+        return session
 
-                                                                                                          
-        last_integrity_error: Exception | None = None
-        for _ in range(3):
+    @staticmethod
+    def _parse_user_message(raw_user_message: str) -> tuple[str, str]:
+        cleaned_user_message = raw_user_message
+        user_kind = "dialogue"
+
+        m = (raw_user_message or "").strip()
+        if m.lower().startswith("/me "):
+            user_kind = "action"
+            cleaned_user_message = m[4:].strip()
+        elif len(m) >= 2 and m.startswith("*") and m.endswith("*"):
+            inner = m[1:-1].strip()
+            if inner:
+                user_kind = "action"
+                cleaned_user_message = inner
+        return cleaned_user_message, user_kind
+
+    async def _create_user_turn(self, *, owner_user_id, session_id, user_message: str) -> tuple[ChatTurn, str]:
+        next_idx = await self.sessions.next_turn_index(session_id)
+        cleaned_user_message, user_kind = self._parse_user_message(user_message)
+
+        user_turn = ChatTurn(
+            session_id=session_id,
+            turn_index=next_idx,
+            role="user",
+            content=cleaned_user_message,
+            meta={"kind": user_kind},
+        )
+        async with begin_if_needed(self.db):
+            await self.turns.create(user_turn)
+
+        await self._moderate(
+            owner_user_id=owner_user_id,
+            session_id=session_id,
+            turn_id=user_turn.id,
+            content=user_message,
+        )
+        return user_turn, cleaned_user_message
+
+    async def _discard_unanswered_turn(self, turn_id) -> None:
+        """Удаляет ход пользователя, ответ на который так и не был записан (клиент оборвал запрос).
+
+        Иначе повторная отправка того же сообщения задвоит реплику в истории сессии.
+        Выполняется под `shield`: отмена, которая сюда привела, не должна прервать уборку.
+        """
+
+        async def _delete() -> None:
             try:
-                                   
-                next_idx = await self.sessions.next_turn_index(session_id)
-                raw_user_message = user_message
-                cleaned_user_message = raw_user_message
-                user_kind = "dialogue"
-
-                m = (raw_user_message or "").strip()
-                if m.lower().startswith("/me "):
-                    user_kind = "action"
-                    cleaned_user_message = m[4:].strip()
-                elif len(m) >= 2 and m.startswith("*") and m.endswith("*"):
-                    inner = m[1:-1].strip()
-                    if inner:
-                        user_kind = "action"
-                        cleaned_user_message = inner
-
-                user_turn = ChatTurn(
-                    session_id=session_id,
-                    turn_index=next_idx,
-                    role="user",
-                    content=cleaned_user_message,
-                    meta={"kind": user_kind},
-                )
+                await self.db.rollback()
                 async with begin_if_needed(self.db):
-                    await self.turns.create(user_turn)
+                    await self.db.execute(delete(ChatTurn).where(ChatTurn.id == turn_id))
+                chat_turns_discarded.inc()
+            except Exception:
+                logger.exception("Failed to discard unanswered chat turn (turn_id=%s)", str(turn_id))
 
-                await self._moderate(
-                    owner_user_id=owner_user_id,
-                    session_id=session_id,
-                    turn_id=user_turn.id,
-                    content=raw_user_message,
+        await asyncio.shield(_delete())
+
+    async def _persist_character_reply(self, *, session: ChatSession, data: dict, next_idx: int) -> list[ChatTurn]:
+        action = str((data or {}).get("action") or "").strip()
+        dialogue = str((data or {}).get("dialogue") or "").strip()
+        if not action and not dialogue:
+            raise ServiceException("Character response invalid: missing action/dialogue")
+
+        assistant_turns: list[ChatTurn] = []
+        async with begin_if_needed(self.db):
+            if action:
+                assistant_turn_action = ChatTurn(
+                    session_id=session.id,
+                    turn_index=next_idx,
+                    role="assistant",
+                    character_id=session.character_id,
+                    content=action,
+                    meta={"kind": "action"},
                 )
+                await self.turns.create(assistant_turn_action)
+                assistant_turns.append(assistant_turn_action)
+                next_idx += 1
 
-                messages, used_mem, room_map, temperature = await self._build_messages_for_llm(
-                    session=session,
-                    user_message=cleaned_user_message,
+            if dialogue:
+                assistant_turn_dialogue = ChatTurn(
+                    session_id=session.id,
+                    turn_index=next_idx,
+                    role="assistant",
+                    character_id=session.character_id,
+                    content=dialogue,
+                    meta={"kind": "dialogue"},
                 )
+                await self.turns.create(assistant_turn_dialogue)
+                assistant_turns.append(assistant_turn_dialogue)
+        return assistant_turns
+
+    async def _persist_room_reply(self, *, session: ChatSession, data: dict, next_idx: int, room_map) -> list[ChatTurn]:
+        speaker = str((data or {}).get("speaker") or "").strip()
+        message = str((data or {}).get("message") or "").strip()
+        if not speaker or not message:
+            raise ServiceException("Room response invalid: missing speaker/message")
+
+        rp = room_map.get(self._speaker_key(speaker))
+        character_id = getattr(rp, "character_id", None) if rp else None
+
+        assistant_turn = ChatTurn(
+            session_id=session.id,
+            turn_index=next_idx,
+            role="assistant",
+            character_id=character_id,
+            content=message,
+            meta={"speaker": speaker, "kind": "dialogue"},
+        )
+        async with begin_if_needed(self.db):
+            await self.turns.create(assistant_turn)
+        return [assistant_turn]
 
-                assistant_turns: list[ChatTurn] = []
-                next_idx2 = next_idx + 1
+    async def _finalize_turn(
+        self,
+        *,
+        session: ChatSession,
+        user_turn: ChatTurn,
+        assistant_turns: list[ChatTurn],
+        used_mem,
+    ) -> dict[str, Any]:
+        await self.db.refresh(user_turn)
+        for t in assistant_turns:
+            await self.db.refresh(t)
+
+        # Product analytics: last activity + counters + memory usage metrics.
+        now = datetime.utcnow()
+        async with begin_if_needed(self.db):
+            session.last_activity_at = now
+            session.turns_count = int(getattr(session, "turns_count", 0) or 0) + 1 + len(assistant_turns)
+            session.user_turns_count = int(getattr(session, "user_turns_count", 0) or 0) + 1
+            session.assistant_turns_count = int(getattr(session, "assistant_turns_count", 0) or 0) + len(assistant_turns)
+            self.db.add(session)
 
-                if session.character_id:
-                    data = await ai_service.generate_character_chat_turn_json(
-                        db=self.db,
-                        messages=messages,
-                        temperature=temperature,
-                    )
+            for mem in list(used_mem or []):
+                try:
+                    mem.use_count = int(getattr(mem, "use_count", 0) or 0) + 1
+                    mem.last_used_at = now
+                    self.db.add(mem)
+                except Exception:
+                    continue
 
-                    action = str((data or {}).get("action") or "").strip()
-                    dialogue = str((data or {}).get("dialogue") or "").strip()
-                    if not action and not dialogue:
-                        raise ServiceException("Character response invalid: missing action/dialogue")
-
-                    async with begin_if_needed(self.db):
-                        if action:
-                            assistant_turn_action = ChatTurn(
-                                session_id=session_id,
-                                turn_index=next_idx2,
-                                role="assistant",
-                                character_id=session.character_id,
-                                content=action,
-                                meta={"kind": "action"},
-                            )
-                            await self.turns.create(assistant_turn_action)
-                            assistant_turns.append(assistant_turn_action)
-                            next_idx2 += 1
-
-                        if dialogue:
-                            assistant_turn_dialogue = ChatTurn(
-                                session_id=session_id,
-                                turn_index=next_idx2,
-                                role="assistant",
-                                character_id=session.character_id,
-                                content=dialogue,
-                                meta={"kind": "dialogue"},
-                            )
-                            await self.turns.create(assistant_turn_dialogue)
-                            assistant_turns.append(assistant_turn_dialogue)
-                else:
-                                                             
-                    data = await ai_service.generate_room_chat_turn_json(
-                        db=self.db,
-                        messages=messages,
-                        temperature=temperature,
-                    )
-                    speaker = str(data.get("speaker") or "").strip()
-                    message = str(data.get("message") or "").strip()
-                    if not speaker or not message:
-                        raise ServiceException("Room response invalid: missing speaker/message")
+        try:
+            await self._maybe_summarize(session)
+        except Exception:
+            pass
 
-                    rp = room_map.get(self._speaker_key(speaker))
-                    character_id = getattr(rp, "character_id", None) if rp else None
+        # Auto-post: run after assistant turn(s) are persisted.
+        for t in assistant_turns:
+            try:
+                await self._maybe_create_auto_post(session=session, assistant_turn=t)
+            except Exception:
+                pass
+
+        return {
+            "session": session,
+            "user_turn": user_turn,
+            "assistant_turns": assistant_turns,
+            "memory_used": used_mem,
+        }
 
-                    assistant_turn = ChatTurn(
+    async def generate_turn(self, *, owner_user_id, session_id, user_message: str) -> dict[str, Any]:
+        session = await self.ensure_session_owner(session_id=session_id, owner_user_id=owner_user_id)
+
+        last_integrity_error: Exception | None = None
+        unanswered_turn_id = None
+        try:
+            for _ in range(3):
+                try:
+                    user_turn, cleaned_user_message = await self._create_user_turn(
+                        owner_user_id=owner_user_id,
                         session_id=session_id,
-                        turn_index=next_idx2,
-                        role="assistant",
-                        character_id=character_id,
-                        content=message,
-                        meta={"speaker": speaker, "kind": "dialogue"},
+                        user_message=user_message,
                     )
-                    async with begin_if_needed(self.db):
-                        await self.turns.create(assistant_turn)
-                    assistant_turns.append(assistant_turn)
+                    unanswered_turn_id = user_turn.id
 
-                await self.db.refresh(user_turn)
-                for t in assistant_turns:
-                    await self.db.refresh(t)
+                    messages, used_mem, room_map, temperature = await self._build_messages_for_llm(
+                        session=session,
+                        user_message=cleaned_user_message,
+                    )
 
-                # Product analytics: last activity + counters + memory usage metrics.
-                now = datetime.utcnow()
-                async with begin_if_needed(self.db):
-                    session.last_activity_at = now
-                    session.turns_count = int(getattr(session, "turns_count", 0) or 0) + 1 + len(assistant_turns)
-                    session.user_turns_count = int(getattr(session, "user_turns_count", 0) or 0) + 1
-                    session.assistant_turns_count = int(getattr(session, "assistant_turns_count", 0) or 0) + len(assistant_turns)
-                    self.db.add(session)
-
-                    for mem in list(used_mem or []):
-                        try:
-                            mem.use_count = int(getattr(mem, "use_count", 0) or 0) + 1
-                            mem.last_used_at = now
-                            self.db.add(mem)
-                        except Exception:
-                            continue
-
-                                 
-                try:
-                    await self._maybe_summarize(session)
-                except Exception:
-                    pass
-
-                # Auto-post: run after assistant turn(s) are persisted.
-                for t in assistant_turns:
-                    try:
-                        await self._maybe_create_auto_post(session=session, assistant_turn=t)
-                    except Exception:
-                        pass
-
-                return {
-                    "session": session,
-                    "user_turn": user_turn,
-                    "assistant_turns": assistant_turns,
-                    "memory_used": used_mem,
-                }
-
-            except IntegrityError as e:
-                last_integrity_error = e
-            except Exception as e:
-                last_integrity_error = e
-
-                if isinstance(e, (EntityNotFoundException, ServiceException)):
-                    raise
-
-                logger.exception(
-                    "Unhandled error while generating chat turn (session_id=%s)",
-                    str(session_id),
-                )
-                raise ServiceException("Failed to generate chat turn")
+                    next_idx2 = user_turn.turn_index + 1
+
+                    if session.character_id:
+                        data = await ai_service.generate_character_chat_turn_json(
+                            db=self.db,
+                            messages=messages,
+                            temperature=temperature,
+                        )
+                        assistant_turns = await self._persist_character_reply(session=session, data=data, next_idx=next_idx2)
+                    else:
+                        data = await ai_service.generate_room_chat_turn_json(
+                            db=self.db,
+                            messages=messages,
+                            temperature=temperature,
+                        )
+                        assistant_turns = await self._persist_room_reply(
+                            session=session,
+                            data=data,
+                            next_idx=next_idx2,
+                            room_map=room_map,
+                        )
+                    unanswered_turn_id = None
+
+                    return await self._finalize_turn(
+                        session=session,
+                        user_turn=user_turn,
+                        assistant_turns=assistant_turns,
+                        used_mem=used_mem,
+                    )
+
+                except IntegrityError as e:
+                    last_integrity_error = e
+                except Exception as e:
+                    last_integrity_error = e
+
+                    if isinstance(e, (EntityNotFoundException, ServiceException)):
+                        raise
+
+                    logger.exception(
+                        "Unhandled error while generating chat turn (session_id=%s)",
+                        str(session_id),
+                    )
+                    raise ServiceException("Failed to generate chat turn")
+        except asyncio.CancelledError:
+            if unanswered_turn_id is not None:
+                await self._discard_unanswered_turn(unanswered_turn_id)
+            raise
 
         if last_integrity_error is not None:
             raise ServiceException("Failed to write turn")
         raise ServiceException("Failed to generate turn")
+
+    async def stream_turn(self, *, owner_user_id, session_id, user_message: str) -> AsyncIterator[tuple[str, Any]]:
+        """Потоковый вариант `generate_turn`.
+
+        События: `user_turn` (ход пользователя записан), `delta` (фрагмент
+        текста ответа), `done` (ответ записан, тот же состав, что у `generate_turn`).
+        """
+        session = await self.ensure_session_owner(session_id=session_id, owner_user_id=owner_user_id)
+
+        user_turn: ChatTurn | None = None
+        cleaned_user_message = ""
+        for _ in range(3):
+            try:
+                user_turn, cleaned_user_message = await self._create_user_turn(
+                    owner_user_id=owner_user_id,
+                    session_id=session_id,
+                    user_message=user_message,
+                )
+                break
+            except IntegrityError:
+                continue
+        if user_turn is None:
+            raise ServiceException("Failed to write turn")
+
+        yield "user_turn", user_turn
+
+        try:
+            messages, used_mem, room_map, temperature = await self._build_messages_for_llm(
+                session=session,
+                user_message=cleaned_user_message,
+            )
+
+            if session.character_id:
+                events = ai_service.stream_character_chat_turn_json(
+                    db=self.db,
+                    messages=messages,
+                    temperature=temperature,
+                )
+            else:
+                events = ai_service.stream_room_chat_turn_json(
+                    db=self.db,
+                    messages=messages,
+                    temperature=temperature,
+                )
+
+            data: dict = {}
+            speaker: str | None = None
+            speaker_parts: list[str] = []
+            async for kind, payload in events:
+                if kind == "result":
+                    data = payload if isinstance(payload, dict) else {}
+                    continue
+                field, text = payload
+                if field == "speaker":
+                    speaker_parts.append(text)
+                    continue
+                if field == "message":
+                    if speaker is None:
+                        speaker = "".join(speaker_parts).strip() or None
+                    yield "delta", {"kind": "dialogue", "speaker": speaker, "text": text}
+                else:
+                    yield "delta", {"kind": field, "text": text}
+
+            next_idx2 = user_turn.turn_index + 1
+            if session.character_id:
+                assistant_turns = await self._persist_character_reply(session=session, data=data, next_idx=next_idx2)
+            else:
+                assistant_turns = await self._persist_room_reply(
+                    session=session,
+                    data=data,
+                    next_idx=next_idx2,
+                    room_map=room_map,
+                )
+        except asyncio.CancelledError:
+            # The client is gone and no reply was stored: drop the turn like the non-streaming path does.
+            await self._discard_unanswered_turn(user_turn.id)
+            raise
+
+        result = await self._finalize_turn(
+            session=session,
+            user_turn=user_turn,
+            assistant_turns=assistant_turns,
+            used_mem=used_mem,
+        )
+        yield "done", result
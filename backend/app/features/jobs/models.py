@@ -0,0 +1,50 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, JSON, String, Text
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+from app.models.custom_types import GUID
+
+
+JOB_KIND_LESSON = "lesson"
+JOB_KIND_COURSE_PATH = "course_path"
+JOB_KIND_CHAT_LEARNING_LESSON = "chat_learning_lesson"
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created", "status", "created_at"),
+        Index("ix_generation_jobs_owner_created", "owner_user_id", "created_at"),
+    )
+
+    id = Column(GUID, primary_key=True, default=uuid.uuid4)
+
+    owner_user_id = Column(GUID, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+
+    # lesson | course_path | chat_learning_lesson
+    kind = Column(String, nullable=False)
+
+    # queued | running | succeeded | failed
+    status = Column(String, nullable=False, default=JOB_STATUS_QUEUED)
+
+    params = Column(JSON, nullable=False)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    attempts = Column(Integer, nullable=False, default=0)
+
+    # A running job whose lease has expired is picked up again (worker crashed).
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
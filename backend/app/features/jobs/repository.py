@@ -0,0 +1,89 @@
+from datetime import datetime
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.features.common.db import BaseRepository
+from app.features.jobs.models import GenerationJob, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING
+
+
+class GenerationJobRepository(BaseRepository[GenerationJob]):
+    def __init__(self, db: AsyncSession):
+        super().__init__(GenerationJob, db)
+
+    async def list_for_owner(self, owner_user_id, *, skip: int = 0, limit: int = 50):
+        q = (
+            select(GenerationJob)
+            .where(GenerationJob.owner_user_id == owner_user_id)
+            .order_by(GenerationJob.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        res = await self.db.execute(q)
+        return res.scalars().all()
+
+    async def list_claimable_ids(self, *, now: datetime, limit: int = 10):
+        q = (
+            select(GenerationJob.id)
+            .where(
+                or_(
+                    GenerationJob.status == JOB_STATUS_QUEUED,
+                    and_(GenerationJob.status == JOB_STATUS_RUNNING, GenerationJob.locked_until < now),
+                )
+            )
+            .order_by(GenerationJob.created_at.asc())
+            .limit(limit)
+        )
+        res = await self.db.execute(q)
+        return list(res.scalars().all())
+
+    async def try_claim(self, job_id, *, now: datetime, locked_until: datetime) -> bool:
+        # Compare-and-set: only one worker (in any process) wins the row.
+        q = (
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .where(
+                or_(
+                    GenerationJob.status == JOB_STATUS_QUEUED,
+                    and_(GenerationJob.status == JOB_STATUS_RUNNING, GenerationJob.locked_until < now),
+                )
+            )
+            .values(
+                status=JOB_STATUS_RUNNING,
+                locked_until=locked_until,
+                started_at=now,
+                attempts=GenerationJob.attempts + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        res = await self.db.execute(q)
+        return int(res.rowcount or 0) == 1
+
+    async def extend_lease(self, job_id, *, locked_until: datetime) -> None:
+        q = (
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .where(GenerationJob.status == JOB_STATUS_RUNNING)
+            .values(locked_until=locked_until)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(q)
+
+    async def finish(self, job_id, *, status: str, result=None, error: str | None = None, now: datetime) -> None:
+        q = (
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .values(status=status, result=result, error=error, finished_at=now, locked_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(q)
+
+    async def requeue(self, job_id) -> None:
+        q = (
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id)
+            .where(GenerationJob.status == JOB_STATUS_RUNNING)
+            .values(status=JOB_STATUS_QUEUED, locked_until=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(q)
@@ -0,0 +1,49 @@
+from datetime import datetime
+from typing import Any, Literal
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class LessonJobCreate(BaseModel):
+    topic: str = Field(min_length=1, max_length=200)
+    target_language: str
+    native_language: str
+    level: str
+    interests: list[str] = Field(default_factory=list)
+    prior_topics: list[str] = Field(default_factory=list)
+    used_words: list[str] = Field(default_factory=list)
+    opening_sentences: list[str] = Field(default_factory=list)
+    recent_exercise_types: list[str] = Field(default_factory=list)
+    generation_mode: Literal["fast", "balanced", "strict"] = "balanced"
+
+
+class CoursePathJobCreate(BaseModel):
+    target_language: str
+    native_language: str
+    level: str
+    interests: str = "General"
+    theme: str | None = None
+
+
+class ChatLearningLessonJobCreate(BaseModel):
+    session_id: UUID
+    generation_mode: Literal["fast", "balanced", "strict"] = "balanced"
+
+
+class GenerationJobOut(BaseModel):
+    id: UUID
+    kind: str
+    status: str
+    attempts: int
+    error: str | None = None
+    created_at: datetime | None = None
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class GenerationJobResultOut(GenerationJobOut):
+    result: dict[str, Any] | None = None
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.exceptions import EntityNotFoundException, NeuroGlossException, ServiceException
+from app.features.chat.repository import ChatSessionRepository, ChatTurnRepository
+from app.features.common.db import begin_if_needed
+from app.features.jobs.models import (
+    GenerationJob,
+    JOB_KIND_CHAT_LEARNING_LESSON,
+    JOB_KIND_COURSE_PATH,
+    JOB_KIND_LESSON,
+    JOB_STATUS_QUEUED,
+)
+from app.features.jobs.repository import GenerationJobRepository
+from app.features.jobs.schemas import ChatLearningLessonJobCreate, CoursePathJobCreate, LessonJobCreate
+from app.features.jobs.worker import job_worker_pool
+from app.utils.prompt_templates import CHAT_LEARNING_LESSON_TEMPLATE
+
+
+class GenerationJobService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.jobs = GenerationJobRepository(db)
+        self.sessions = ChatSessionRepository(db)
+        self.turns = ChatTurnRepository(db)
+
+    async def _submit(self, *, owner_user_id: UUID, kind: str, params: dict) -> GenerationJob:
+        if not settings.AI_ENABLED:
+            raise ServiceException("AI is disabled")
+
+        row = GenerationJob(owner_user_id=owner_user_id, kind=kind, status=JOB_STATUS_QUEUED, params=params, attempts=0)
+        async with begin_if_needed(self.db):
+            await self.jobs.create(row)
+
+        await self.db.refresh(row)
+        job_worker_pool.notify()
+        return row
+
+    async def submit_lesson(self, *, owner_user_id: UUID, body: LessonJobCreate) -> GenerationJob:
+        return await self._submit(owner_user_id=owner_user_id, kind=JOB_KIND_LESSON, params=body.model_dump())
+
+    async def submit_course_path(self, *, owner_user_id: UUID, body: CoursePathJobCreate) -> GenerationJob:
+        return await self._submit(owner_user_id=owner_user_id, kind=JOB_KIND_COURSE_PATH, params=body.model_dump())
+
+    async def submit_chat_learning_lesson(self, *, owner_user_id: UUID, body: ChatLearningLessonJobCreate) -> GenerationJob:
+        session = await self.sessions.get(body.session_id)
+        if not session or session.owner_user_id != owner_user_id:
+            raise EntityNotFoundException("ChatSession", body.session_id)
+
+        recent = await self.turns.list_recent(session.id, limit=80)
+        lines: list[str] = []
+        for t in recent:
+            name = "USER" if t.role == "user" else ("ASSISTANT" if t.role in {"assistant", "director"} else t.role.upper())
+            lines.append(f"{name}: {t.content}")
+        if not lines:
+            raise NeuroGlossException(status_code=400, code="chat_empty", detail="Chat session has no turns yet")
+
+        # The prompt is a snapshot of the chat at submit time, so retries see the same input.
+        prompt = CHAT_LEARNING_LESSON_TEMPLATE.format(chat="\n".join(lines))
+        params = {"session_id": str(session.id), "generation_mode": body.generation_mode, "prompt": prompt}
+        return await self._submit(owner_user_id=owner_user_id, kind=JOB_KIND_CHAT_LEARNING_LESSON, params=params)
+
+    async def list_for_owner(self, *, owner_user_id: UUID, skip: int, limit: int):
+        return await self.jobs.list_for_owner(owner_user_id, skip=skip, limit=limit)
+
+    async def get_for_owner(self, *, job_id: UUID, owner_user_id: UUID) -> GenerationJob:
+        row = await self.jobs.get(job_id)
+        if not row or row.owner_user_id != owner_user_id:
+            raise EntityNotFoundException("GenerationJob", job_id)
+        return row
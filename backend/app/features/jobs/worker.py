@@ -0,0 +1,204 @@
+"""Фоновые воркеры для долгих генераций (урок, путь курса, урок по чату).
+
+Задания лежат в таблице `generation_jobs`. Воркер забирает задание атомарным
+UPDATE (compare-and-set по статусу), пока работает — продлевает аренду
+`locked_until`. Если процесс упал, по истечении аренды задание подхватит
+другой воркер; после `AI_JOB_MAX_ATTEMPTS` попыток оно помечается как failed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.core.ai.scheduler import PRIORITY_LESSON, llm_priority
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.exceptions import NeuroGlossException
+from app.features.common.db import begin_if_needed
+from app.features.jobs.models import (
+    GenerationJob,
+    JOB_KIND_CHAT_LEARNING_LESSON,
+    JOB_KIND_COURSE_PATH,
+    JOB_KIND_LESSON,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_SUCCEEDED,
+)
+from app.features.jobs.repository import GenerationJobRepository
+from app.features.lesson_library.service import LessonLibraryService
+
+
+logger = logging.getLogger(__name__)
+
+
+async def execute_job(db, job: GenerationJob) -> dict[str, Any]:
+    from app.features.ai.ai_service import ai_service
+
+    p = dict(job.params or {})
+    if job.kind == JOB_KIND_LESSON:
+        return await LessonLibraryService(db).get_or_generate(
+            topic=p["topic"],
+            target_language=p["target_language"],
+            native_language=p["native_language"],
+            level=p["level"],
+            interests=list(p.get("interests") or []),
+            prior_topics=list(p.get("prior_topics") or []),
+            used_words=list(p.get("used_words") or []),
+            opening_sentences=list(p.get("opening_sentences") or []),
+            recent_exercise_types=list(p.get("recent_exercise_types") or []),
+            generation_mode=p.get("generation_mode") or "balanced",
+        )
+    if job.kind == JOB_KIND_COURSE_PATH:
+        return await ai_service.generate_course_path(
+            target_language=p["target_language"],
+            native_language=p["native_language"],
+            level=p["level"],
+            interests=p.get("interests") or "General",
+            theme=p.get("theme"),
+            db=db,
+        )
+    if job.kind == JOB_KIND_CHAT_LEARNING_LESSON:
+        return await ai_service.generate_chat_learning_lesson_json(
+            db=db,
+            prompt=p["prompt"],
+            generation_mode=p.get("generation_mode") or "balanced",
+        )
+    raise ValueError(f"Unknown job kind: {job.kind}")
+
+
+def _error_text(e: BaseException) -> str:
+    if isinstance(e, NeuroGlossException):
+        return str(e.detail)[:2000]
+    if isinstance(e, asyncio.TimeoutError):
+        return "Job timed out"
+    return (f"{type(e).__name__}: {e}")[:2000]
+
+
+class JobWorkerPool:
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory or AsyncSessionLocal
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self.succeeded = 0
+        self.failed = 0
+
+    @staticmethod
+    def _lease() -> timedelta:
+        return timedelta(seconds=int(getattr(settings, "AI_JOB_LEASE_SECONDS", 120) or 120))
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def claim_next(self) -> GenerationJob | None:
+        async with self._session_factory() as db:
+            repo = GenerationJobRepository(db)
+            now = datetime.utcnow()
+            for job_id in await repo.list_claimable_ids(now=now):
+                async with begin_if_needed(db):
+                    won = await repo.try_claim(job_id, now=now, locked_until=now + self._lease())
+                if won:
+                    return await repo.get(job_id)
+        return None
+
+    async def _finish(self, job_id, *, status: str, result=None, error: str | None = None) -> None:
+        async with self._session_factory() as db:
+            async with begin_if_needed(db):
+                await GenerationJobRepository(db).finish(
+                    job_id, status=status, result=result, error=error, now=datetime.utcnow()
+                )
+
+    async def _keep_lease(self, job_id) -> None:
+        interval = max(1.0, self._lease().total_seconds() / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self._session_factory() as db:
+                    async with begin_if_needed(db):
+                        await GenerationJobRepository(db).extend_lease(
+                            job_id, locked_until=datetime.utcnow() + self._lease()
+                        )
+            except Exception:
+                logger.warning("Failed to extend lease for job %s", job_id, exc_info=True)
+
+    async def run_job(self, job: GenerationJob) -> None:
+        max_attempts = int(getattr(settings, "AI_JOB_MAX_ATTEMPTS", 3) or 3)
+        if int(job.attempts or 0) > max_attempts:
+            self.failed += 1
+            await self._finish(job.id, status=JOB_STATUS_FAILED, error=f"Job abandoned after {max_attempts} attempts")
+            return
+
+        timeout = float(getattr(settings, "AI_JOB_TIMEOUT_SECONDS", 900) or 900)
+        lease = asyncio.create_task(self._keep_lease(job.id))
+        try:
+            async with self._session_factory() as db:
+                with llm_priority(PRIORITY_LESSON):
+                    # Jobs write cache rows and library entries on this session; commit them with the job.
+                    async with begin_if_needed(db):
+                        result = await asyncio.wait_for(execute_job(db, job), timeout=timeout)
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back instead of waiting for the lease to expire.
+            try:
+                async with self._session_factory() as db:
+                    async with begin_if_needed(db):
+                        await GenerationJobRepository(db).requeue(job.id)
+            except Exception:
+                pass
+            raise
+        except Exception as e:
+            logger.warning("Generation job %s (%s) failed", job.id, job.kind, exc_info=True)
+            self.failed += 1
+            await self._finish(job.id, status=JOB_STATUS_FAILED, error=_error_text(e))
+        else:
+            self.succeeded += 1
+            await self._finish(job.id, status=JOB_STATUS_SUCCEEDED, result=result)
+        finally:
+            lease.cancel()
+
+    async def run_pending_once(self, *, limit: int | None = None) -> int:
+        """Выполняет задания из очереди, пока они есть (или до `limit`); возвращает их число."""
+        done = 0
+        while limit is None or done < limit:
+            job = await self.claim_next()
+            if job is None:
+                break
+            await self.run_job(job)
+            done += 1
+        return done
+
+    async def _loop(self) -> None:
+        poll = float(getattr(settings, "AI_JOB_POLL_SECONDS", 5.0) or 5.0)
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                ran = await self.run_pending_once(limit=1)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Job worker iteration failed")
+                ran = 0
+            if ran:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=poll)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, workers: int) -> None:
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(max(0, int(workers)))]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._wakeup.set()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+job_worker_pool = JobWorkerPool()
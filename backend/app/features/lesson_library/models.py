@@ -0,0 +1,37 @@
+import uuid
+
+from sqlalchemy import Column, DateTime, Index, Integer, JSON, String, UniqueConstraint
+from sqlalchemy.sql import func
+
+from app.models.base import Base
+from app.models.custom_types import GUID
+
+
+class LessonLibraryEntry(Base):
+    __tablename__ = "lesson_library_entries"
+    __table_args__ = (
+        UniqueConstraint("fingerprint", "content_hash", name="uq_lesson_library_fingerprint_content"),
+        Index("ix_lesson_library_fingerprint", "fingerprint"),
+    )
+
+    id = Column(GUID, primary_key=True, default=uuid.uuid4)
+
+    # sha256 of the normalized (topic, target_language, native_language, level)
+    fingerprint = Column(String, nullable=False)
+    # sha256 of the canonical lesson JSON; one fingerprint keeps a few variants
+    content_hash = Column(String, nullable=False)
+
+    topic = Column(String, nullable=False, default="")
+    target_language = Column(String, nullable=False, default="")
+    native_language = Column(String, nullable=False, default="")
+    level = Column(String, nullable=False, default="")
+
+    generation_mode = Column(String, nullable=True)
+    quality_status = Column(String, nullable=True)
+
+    lesson_json = Column(JSON, nullable=False)
+
+    hit_count = Column(Integer, nullable=False, default=0)
+    last_hit_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.features.common.db import BaseRepository
+from app.features.lesson_library.models import LessonLibraryEntry
+
+
+class LessonLibraryRepository(BaseRepository[LessonLibraryEntry]):
+    def __init__(self, db: AsyncSession):
+        super().__init__(LessonLibraryEntry, db)
+
+    async def list_variants(self, fingerprint: str):
+        q = (
+            select(LessonLibraryEntry)
+            .where(LessonLibraryEntry.fingerprint == fingerprint)
+            .order_by(LessonLibraryEntry.hit_count.asc(), LessonLibraryEntry.created_at.asc())
+        )
+        res = await self.db.execute(q)
+        return res.scalars().all()
+
+    async def record_hit(self, entry_id, *, now: datetime) -> None:
+        q = (
+            update(LessonLibraryEntry)
+            .where(LessonLibraryEntry.id == entry_id)
+            .values(hit_count=LessonLibraryEntry.hit_count + 1, last_hit_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(q)
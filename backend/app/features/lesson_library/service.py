@@ -0,0 +1,293 @@
+"""Общая библиотека уроков.
+
+Урок для одной и той же тройки (тема, языки, уровень) не генерируется заново
+для каждого ученика: проверенный результат `generate_lesson` (quality_status=ok)
+кладётся в `lesson_library_entries` по отпечатку нормализованных параметров.
+На один отпечаток хранится несколько вариантов; ученику отдаётся тот, что
+подходит ему после дешёвой персонализации (без вызова модели).
+
+Интересы ученика в отпечаток не входят: варианты ранжируются по совпадению
+с ними (интересы, для которых вариант генерировался, и текст урока). Если
+ни один вариант не совпал, а в библиотеке ещё есть место, урок генерируется
+заново и становится вариантом под эти интересы.
+"""
+
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.features.common.db import begin_if_needed
+from app.features.lesson_library.models import LessonLibraryEntry
+from app.features.lesson_library.repository import LessonLibraryRepository
+
+
+logger = logging.getLogger(__name__)
+
+_MODE_RANK = {"fast": 0, "balanced": 1, "strict": 2}
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _normalize(value: str | None) -> str:
+    text = unicodedata.normalize("NFKC", str(value or "")).casefold()
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def lesson_fingerprint(*, topic: str, target_language: str, native_language: str, level: str) -> str:
+    key = "|".join(
+        [
+            "v1",
+            _normalize(topic),
+            _normalize(target_language),
+            _normalize(native_language),
+            _normalize(level).replace(" ", "").upper(),
+        ]
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def lesson_content_hash(lesson: dict) -> str:
+    payload = {k: lesson.get(k) for k in ("text", "vocabulary", "exercises")}
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def interest_score(lesson: dict, interests: list[str] | None) -> int:
+    """Сколько интересов ученика встречается в интересах варианта или в тексте урока."""
+    wanted = {_normalize(i) for i in (interests or []) if _normalize(i)}
+    if not wanted:
+        return 0
+    meta = lesson.get("_meta") if isinstance(lesson.get("_meta"), dict) else {}
+    stored = {_normalize(i) for i in (meta.get("library_interests") or [])}
+    text = f" {_normalize(lesson.get('text'))} "
+    return sum(1 for i in wanted if i in stored or f" {i} " in text)
+
+
+def personalize_lesson(
+    lesson: dict,
+    *,
+    used_words: list[str] | None = None,
+    opening_sentences: list[str] | None = None,
+    recent_exercise_types: list[str] | None = None,
+) -> dict | None:
+    """Подстраивает готовый урок под ученика или возвращает `None`, если вариант ему не подходит.
+
+    Новые слова идут раньше уже знакомых, упражнения недавних типов — в конце.
+    Вариант отбрасывается, если знакомых слов больше `AI_LESSON_LIBRARY_MAX_KNOWN_RATIO`
+    или текст начинается так же, как один из недавних уроков.
+    """
+    out = copy.deepcopy(lesson)
+
+    text = _normalize(out.get("text"))
+    for sentence in opening_sentences or []:
+        s = _normalize(sentence)
+        if s and text.startswith(s):
+            return None
+
+    known = {_normalize(w) for w in (used_words or []) if _normalize(w)}
+    vocab = [it for it in (out.get("vocabulary") or []) if isinstance(it, dict)]
+    if vocab and known:
+        fresh = [it for it in vocab if _normalize(it.get("word")) not in known]
+        max_known = float(getattr(settings, "AI_LESSON_LIBRARY_MAX_KNOWN_RATIO", 0.5) or 0.0)
+        if (len(vocab) - len(fresh)) / len(vocab) > max_known:
+            return None
+        out["vocabulary"] = fresh + [it for it in vocab if _normalize(it.get("word")) in known]
+
+    recent = {_normalize(t) for t in (recent_exercise_types or [])}
+    exercises = out.get("exercises") or []
+    if recent and isinstance(exercises, list):
+        # Stable sort keeps the original order inside each group.
+        out["exercises"] = sorted(
+            exercises,
+            key=lambda ex: isinstance(ex, dict) and _normalize(ex.get("type")) in recent,
+        )
+    return out
+
+
+class LessonLibraryService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self.entries = LessonLibraryRepository(db)
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(getattr(settings, "AI_LESSON_LIBRARY_ENABLED", True))
+
+    async def lookup(
+        self,
+        *,
+        topic: str,
+        target_language: str,
+        native_language: str,
+        level: str,
+        generation_mode: str = "balanced",
+        interests: list[str] | None = None,
+        used_words: list[str] | None = None,
+        opening_sentences: list[str] | None = None,
+        recent_exercise_types: list[str] | None = None,
+    ) -> dict | None:
+        started = time.monotonic()
+        fingerprint = lesson_fingerprint(
+            topic=topic, target_language=target_language, native_language=native_language, level=level
+        )
+        wanted_rank = _MODE_RANK.get(generation_mode, 1)
+
+        variants = list(await self.entries.list_variants(fingerprint))
+        scores = {entry.id: interest_score(entry.lesson_json or {}, interests) for entry in variants}
+        max_variants = max(1, int(getattr(settings, "AI_LESSON_LIBRARY_VARIANTS", 3) or 3))
+        if interests and not any(scores.values()) and len(variants) < max_variants:
+            # Room left for a variant closer to this learner: generating one beats an off-interest lesson.
+            return None
+
+        # Stable sort keeps the repository order (least used first) among equal scores.
+        for entry in sorted(variants, key=lambda e: -scores[e.id]):
+            if entry.quality_status != "ok" or _MODE_RANK.get(entry.generation_mode or "", 0) < wanted_rank:
+                continue
+            lesson = personalize_lesson(
+                entry.lesson_json,
+                used_words=used_words,
+                opening_sentences=opening_sentences,
+                recent_exercise_types=recent_exercise_types,
+            )
+            if lesson is None:
+                continue
+
+            async with begin_if_needed(self.db):
+                await self.entries.record_hit(entry.id, now=datetime.utcnow())
+
+            meta = lesson.get("_meta") if isinstance(lesson.get("_meta"), dict) else {}
+            meta.pop("library_interests", None)
+            meta["stage_timings_ms"] = {"library": int((time.monotonic() - started) * 1000)}
+            meta["library"] = {"hit": True, "entry_id": str(entry.id), "fingerprint": fingerprint}
+            lesson["_meta"] = meta
+            return lesson
+        return None
+
+    async def store(
+        self,
+        lesson: dict,
+        *,
+        topic: str,
+        target_language: str,
+        native_language: str,
+        level: str,
+        interests: list[str] | None = None,
+    ) -> LessonLibraryEntry | None:
+        meta = lesson.get("_meta") if isinstance(lesson.get("_meta"), dict) else {}
+        if meta.get("quality_status") != "ok" or not lesson.get("exercises"):
+            return None
+
+        fingerprint = lesson_fingerprint(
+            topic=topic, target_language=target_language, native_language=native_language, level=level
+        )
+        content_hash = lesson_content_hash(lesson)
+        variants = list(await self.entries.list_variants(fingerprint))
+        if any(v.content_hash == content_hash for v in variants):
+            return None
+
+        stored = copy.deepcopy(lesson)
+        stored_meta = dict(meta)
+        stored_meta.pop("stage_timings_ms", None)
+        stored_meta.pop("library", None)
+        stored_meta["library_interests"] = [str(i) for i in (interests or []) if str(i).strip()][:20]
+        stored["_meta"] = stored_meta
+
+        row = LessonLibraryEntry(
+            fingerprint=fingerprint,
+            content_hash=content_hash,
+            topic=str(topic or "")[:200],
+            target_language=str(target_language or ""),
+            native_language=str(native_language or ""),
+            level=str(level or ""),
+            generation_mode=stored_meta.get("generation_mode"),
+            quality_status=stored_meta.get("quality_status"),
+            lesson_json=stored,
+            hit_count=0,
+        )
+
+        max_variants = max(1, int(getattr(settings, "AI_LESSON_LIBRARY_VARIANTS", 3) or 3))
+        async with begin_if_needed(self.db):
+            # Make room by dropping the weakest variant: lowest mode, then least used.
+            excess = len(variants) + 1 - max_variants
+            if excess > 0:
+                weakest = sorted(
+                    variants,
+                    key=lambda v: (_MODE_RANK.get(v.generation_mode or "", 0), int(v.hit_count or 0)),
+                )[:excess]
+                for v in weakest:
+                    await self.entries.delete(v.id)
+            await self.entries.create(row)
+        return row
+
+    async def get_or_generate(
+        self,
+        *,
+        topic: str,
+        target_language: str,
+        native_language: str,
+        level: str,
+        interests: list[str] | None = None,
+        prior_topics: list[str] | None = None,
+        used_words: list[str] | None = None,
+        opening_sentences: list[str] | None = None,
+        recent_exercise_types: list[str] | None = None,
+        generation_mode: str = "balanced",
+    ) -> dict[str, Any]:
+        from app.features.ai.ai_service import ai_service
+
+        if self.enabled():
+            hit = await self.lookup(
+                topic=topic,
+                target_language=target_language,
+                native_language=native_language,
+                level=level,
+                generation_mode=generation_mode,
+                interests=interests,
+                used_words=used_words,
+                opening_sentences=opening_sentences,
+                recent_exercise_types=recent_exercise_types,
+            )
+            if hit is not None:
+                return hit
+
+        lesson = await ai_service.generate_lesson(
+            topic=topic,
+            target_language=target_language,
+            native_language=native_language,
+            level=level,
+            interests=interests,
+            prior_topics=prior_topics,
+            used_words=used_words,
+            opening_sentences=opening_sentences,
+            recent_exercise_types=recent_exercise_types,
+            generation_mode=generation_mode,
+            db=self.db,
+        )
+        if not self.enabled() or not isinstance(lesson, dict):
+            return lesson
+
+        stored = None
+        try:
+            stored = await self.store(
+                lesson,
+                topic=topic,
+                target_language=target_language,
+                native_language=native_language,
+                level=level,
+                interests=interests,
+            )
+        except Exception:
+            logger.warning("Failed to store lesson in the library", exc_info=True)
+        if isinstance(lesson.get("_meta"), dict):
+            lesson["_meta"]["library"] = {"hit": False, "stored": stored is not None}
+        return lesson
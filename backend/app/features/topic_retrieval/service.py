@@ -6,6 +6,7 @@ from urllib.parse import urlparse
 import httpx
 
 from app.core.config import settings
+from app.core.metrics import topic_retrieval_cache
 
 
 @dataclass(frozen=True)
@@ -56,7 +57,9 @@ class TopicRetrievalService:
         if cached is not None:
             ts, res = cached
             if (now - ts) <= ttl:
+                topic_retrieval_cache.inc(result="hit")
                 return res
+        topic_retrieval_cache.inc(result="miss")
 
         timeout_s = float(getattr(settings, "TOPIC_RETRIEVAL_TIMEOUT_SECONDS", 8) or 8)
         lang = str(getattr(settings, "TOPIC_RETRIEVAL_WIKI_LANG", "ru") or "ru")
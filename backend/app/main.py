@@ -1,11 +1,12 @@
 from fastapi import FastAPI, Request, status, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 import uuid
 import time
+import secrets
 from sqlalchemy import text
 
 from app.core.config import settings
@@ -13,11 +14,17 @@ from app.api.v1.router import api_router
 from app.core.exceptions import NeuroGlossException
 from app.core.rate_limit import limiter
 from app.core.database import AsyncSessionLocal
+from app.core.metrics import http_request_duration, metrics, route_template
 import logging
 from app.core.logging_json import JsonFormatter
 from app.core.request_context import request_id_ctx, RequestIdFilter
 from app.core.events.base import event_bus, LevelCompletedEvent
 from app.core.events.listeners import XPListener, AchievementListener
+from app.core.ai.registry import provider_registry
+from app.core.ai.circuit_state import circuit_state
+from app.features.jobs.worker import job_worker_pool
+from app.features.ai.cache_maintenance import llm_cache_maintenance
+from app.features.ai.telemetry import ai_event_buffer
 
                        
 root_logger = logging.getLogger()
@@ -47,7 +54,11 @@ async def request_id_middleware(request: Request, call_next):
     finally:
         request_id_ctx.reset(token)
     response.headers["X-Request-Id"] = request_id
-    duration_ms = int((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - start
+    duration_ms = int(elapsed * 1000)
+    http_request_duration.observe(
+        elapsed, method=request.method, route=route_template(request.scope), status=str(response.status_code)
+    )
     logger.info(
         "%s %s -> %s (%sms) request_id=%s",
         request.method,
@@ -180,6 +191,33 @@ async def _subscribe_event_listeners() -> None:
     event_bus.subscribe(LevelCompletedEvent, AchievementListener())
 
 
+@app.on_event("startup")
+async def _start_job_workers() -> None:
+    workers = int(getattr(settings, "AI_JOB_WORKERS", 0) or 0)
+    if settings.AI_ENABLED and workers > 0:
+        job_worker_pool.start(workers)
+
+
+@app.on_event("startup")
+async def _start_llm_cache_maintenance() -> None:
+    if settings.AI_ENABLED:
+        llm_cache_maintenance.start()
+
+
+@app.on_event("startup")
+async def _start_ai_telemetry() -> None:
+    ai_event_buffer.start()
+
+
+@app.on_event("shutdown")
+async def _close_ai_providers() -> None:
+    await job_worker_pool.stop()
+    await llm_cache_maintenance.stop()
+    await ai_event_buffer.stop()
+    await provider_registry.aclose()
+    await circuit_state.aclose()
+
+
 @app.get("/health")
 async def health():
     return {"status": "ok"}
@@ -191,6 +229,15 @@ async def health_db():
         await db.execute(text("SELECT 1"))
     return {"status": "ok"}
 
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    if not getattr(settings, "METRICS_ENABLED", False):
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if token and not secrets.compare_digest(request.headers.get("authorization", ""), f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 def root():
     return {"message": "Welcome to NeuroGlossAI API"}
@@ -0,0 +1,205 @@
+"""Прогон цикла повторов и предохранителя под сбоями модели.
+
+    python -m bench.faults --requests 200 --concurrency 20 \\
+        --faults "random:429=0.05,503=0.05,timeout:2000=0.02,malformed=0.02,slow:3000=0.05" \\
+        --max-attempts 5 --breaker-threshold 3 --breaker-open-seconds 60
+
+Каждый запрос — уникальный промпт через `AIService._generate_json_with_retries`
+(кэш выключен), провайдер — синтетическая модель из `bench.load`, обёрнутая в
+`FaultInjectingProvider`. В отчёте: доля успешных запросов, задержка
+p50/p95/p99 (всех и успешных), сколько было вызовов модели, какие сбои
+подмешаны, сколько повторов и срабатываний предохранителя, причины отказов.
+Меняя пороги и сценарий, можно подбирать паузы и предохранитель по данным.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from bench.load import LatencyModel, SyntheticProvider, percentile, prepare_environment
+
+
+def _latency_block(values: list[float]) -> dict[str, float]:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+    }
+
+
+def _counter_total(counter, **match: str) -> float:
+    return sum(v for _, labels, v in counter.samples() if all(labels.get(k) == m for k, m in match.items()))
+
+
+async def run_fault_scenario(
+    *,
+    requests: int,
+    concurrency: int,
+    faults: str,
+    latency: LatencyModel,
+    max_attempts: int = 5,
+    breaker_threshold: int | None = None,
+    breaker_open_seconds: int | None = None,
+    interval_ms: float = 0.0,
+    seed: int = 0,
+) -> dict[str, Any]:
+    from app.core.ai.circuit_state import circuit_state
+    from app.core.ai.faults import FaultInjectingProvider
+    from app.core.config import settings
+    from app.core.metrics import llm_circuit_failures, llm_retries
+    from app.features.ai.ai_service import AIService
+
+    overrides = {
+        "AI_CIRCUIT_BREAKER_FAIL_THRESHOLD": breaker_threshold,
+        "AI_CIRCUIT_BREAKER_OPEN_SECONDS": breaker_open_seconds,
+    }
+    saved = {k: getattr(settings, k) for k, v in overrides.items() if v is not None}
+    for k, v in overrides.items():
+        if v is not None:
+            setattr(settings, k, v)
+
+    base = SyntheticProvider(latency, seed=seed)
+    provider = FaultInjectingProvider(base, faults, seed=seed)
+    svc = AIService(provider=provider)
+    key = AIService._circuit_key(provider)
+    retries_before = {
+        reason: _counter_total(llm_retries, model=str(provider.model), reason=reason)
+        for reason in ("rate_limit", "transient")
+    }
+    breaker_before = _counter_total(llm_circuit_failures, key=key)
+
+    ok_latencies: list[float] = []
+    all_latencies: list[float] = []
+    failures: dict[str, int] = {}
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(i: int) -> None:
+        async with sem:
+            started = time.monotonic()
+            try:
+                await svc._generate_json_with_retries(
+                    f"fault bench request {i}", max_attempts=max_attempts, use_cache=False, operation="fault_bench"
+                )
+            except Exception as e:
+                message = str(e)
+                if message.endswith("unknown error"):
+                    # Every candidate was skipped: breaker open or provider backoff, no call made.
+                    reason = "breaker/backoff open, no provider call"
+                else:
+                    reason = f"{type(e).__name__}: {message[:70]}"
+                failures[reason] = failures.get(reason, 0) + 1
+            else:
+                ok_latencies.append(time.monotonic() - started)
+            finally:
+                all_latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    try:
+        tasks = []
+        for i in range(requests):
+            tasks.append(asyncio.create_task(_one(i)))
+            if interval_ms > 0:
+                await asyncio.sleep(interval_ms / 1000.0)
+        await asyncio.gather(*tasks)
+    finally:
+        for k, v in saved.items():
+            setattr(settings, k, v)
+        await circuit_state.record_success(key)
+        AIService._circuit_seen_failures.pop(key, None)
+    elapsed = time.monotonic() - started
+
+    return {
+        "requests": requests,
+        "succeeded": len(ok_latencies),
+        "success_rate": round(len(ok_latencies) / requests, 4) if requests else 0.0,
+        "elapsed_s": round(elapsed, 2),
+        "latency_all": _latency_block(all_latencies),
+        "latency_ok": _latency_block(ok_latencies),
+        "provider_calls": sum(provider.stats().values()),
+        "injected": {k: v for k, v in provider.stats().items() if v},
+        "retries": {
+            reason: int(_counter_total(llm_retries, model=str(provider.model), reason=reason) - before)
+            for reason, before in retries_before.items()
+        },
+        "breaker_failures": int(_counter_total(llm_circuit_failures, key=key) - breaker_before),
+        "failures": dict(sorted(failures.items(), key=lambda kv: -kv[1])),
+    }
+
+
+def format_report(summary: dict[str, Any]) -> str:
+    lines = [
+        f"success {summary['succeeded']}/{summary['requests']} ({summary['success_rate'] * 100:.1f}%) "
+        f"in {summary['elapsed_s']}s, provider calls {summary['provider_calls']}",
+    ]
+    for name in ("latency_all", "latency_ok"):
+        b = summary[name]
+        lines.append(
+            f"{name:<12} n={b['count']:<5} p50={b['p50_ms']}ms p95={b['p95_ms']}ms p99={b['p99_ms']}ms max={b['max_ms']}ms"
+        )
+    lines.append(f"injected     {summary['injected']}")
+    lines.append(f"retries      {summary['retries']}  breaker failures {summary['breaker_failures']}")
+    for reason, n in summary["failures"].items():
+        lines.append(f"failed x{n:<4} {reason}")
+    return "\n".join(lines)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m bench.faults", description="Retry/breaker behaviour under injected faults.")
+    p.add_argument("--requests", type=int, default=100)
+    p.add_argument("--concurrency", type=int, default=10)
+    p.add_argument("--interval-ms", type=float, default=0.0, help="pause between request starts")
+    p.add_argument("--faults", default="random:429=0.05,503=0.05,timeout=0.02,malformed=0.02,slow=0.05")
+    p.add_argument("--latency", default="lognormal:600:0.4", help="latency of the healthy synthetic model")
+    p.add_argument("--max-attempts", type=int, default=5)
+    p.add_argument("--breaker-threshold", type=int, default=None)
+    p.add_argument("--breaker-open-seconds", type=int, default=None)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", type=Path, default=None, help="also write the summary here")
+    return p
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    # No database is touched: use_cache is off and nothing is persisted.
+    prepare_environment("sqlite+aiosqlite:///:memory:")
+    logging.basicConfig(level=logging.ERROR)
+    try:
+        from app.core.ai.faults import FaultSchedule
+
+        FaultSchedule.parse(args.faults)
+        latency = LatencyModel.parse(args.latency)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    summary = asyncio.run(
+        run_fault_scenario(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            faults=args.faults,
+            latency=latency,
+            max_attempts=args.max_attempts,
+            breaker_threshold=args.breaker_threshold,
+            breaker_open_seconds=args.breaker_open_seconds,
+            interval_ms=args.interval_ms,
+            seed=args.seed,
+        )
+    )
+    print(format_report(summary))
+    if args.json:
+        args.json.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""Нагрузочный прогон API в процессе, с синтетической моделью вместо «Грока».
+
+    python -m bench.load --users 20 --duration 30 --latency lognormal:800:0.5 --error-rate 0.02
+
+Приложение поднимается в этом же процессе (httpx + ASGI, без сети) поверх
+SQLite (по умолчанию — свежий файл в `./data/`) или базы из `--database-url`.
+Каждый виртуальный пользователь регистрируется, входит, создаёт персонажа и
+сессию чата, а потом в цикле выполняет смесь шагов: ход в чате, CRUD памяти,
+ленты постов. В конце — пропускная способность и p50/p95/p99 по маршрутам
+(таблицей и, если задан `--json`, файлом).
+
+Задержка модели: `fixed:MS`, `uniform:MIN:MAX` или `lognormal:MEDIAN_MS:SIGMA`.
+С одинаковым `--seed` синтетическая модель ведёт себя одинаково.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+import math
+import os
+import pkgutil
+import random
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        parts = str(spec or "fixed:0").split(":")
+        kind = parts[0].strip().lower()
+        try:
+            nums = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError(f"Bad latency spec: {spec!r}")
+        if kind == "fixed" and len(nums) == 1:
+            return cls(kind, nums[0])
+        if kind == "uniform" and len(nums) == 2:
+            return cls(kind, min(nums), max(nums))
+        if kind == "lognormal" and len(nums) == 2:
+            return cls(kind, nums[0], nums[1])
+        raise ValueError(f"Bad latency spec: {spec!r} (fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN_MS:SIGMA)")
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return self.a * math.exp(rng.gauss(0.0, self.b))
+        return self.a
+
+
+class SyntheticProvider:
+    """`LLMProvider` без сети: ответ нужной формы после задержки из `LatencyModel`."""
+
+    model = "synthetic"
+
+    def __init__(self, latency: LatencyModel, *, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = max(0.0, min(1.0, float(error_rate)))
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    async def _delay(self) -> None:
+        self.calls += 1
+        delay_ms = self.latency.sample_ms(self._rng)
+        failed = self._rng.random() < self.error_rate
+        if delay_ms > 0:
+            await asyncio.sleep(delay_ms / 1000.0)
+        if failed:
+            self.errors += 1
+            raise RuntimeError("503 service unavailable (synthetic)")
+
+    async def generate_json(self, prompt: str, *, temperature: float | None = None) -> dict[str, Any]:
+        await self._delay()
+        return {"action": "*nods*", "dialogue": f"Synthetic reply #{self.calls}"}
+
+    async def generate_text(self, prompt: str, *, temperature: float | None = None) -> str:
+        await self._delay()
+        return "Synthetic summary."
+
+    async def generate_chat(self, messages: list[dict[str, str]], *, temperature: float | None = None) -> str:
+        await self._delay()
+        return "Synthetic chat reply."
+
+    async def stream_json(self, prompt: str, *, temperature: float | None = None) -> AsyncIterator[str]:
+        data = await self.generate_json(prompt, temperature=temperature)
+        yield json.dumps(data, ensure_ascii=False)
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "errors": self.errors}
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Ближайший ранг: `q` в [0, 100] по уже отсортированному списку."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@dataclass
+class RouteStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: dict[int, int] = field(default_factory=dict)
+
+
+class LoadRecorder:
+    def __init__(self) -> None:
+        self.routes: dict[str, RouteStats] = {}
+        self.started = time.monotonic()
+        self.finished: float | None = None
+
+    def record(self, route: str, seconds: float, status: int, ok: bool) -> None:
+        st = self.routes.setdefault(route, RouteStats())
+        st.latencies.append(seconds)
+        st.statuses[status] = st.statuses.get(status, 0) + 1
+        if not ok:
+            st.errors += 1
+
+    def summary(self) -> dict[str, Any]:
+        elapsed = max(1e-9, (self.finished or time.monotonic()) - self.started)
+        routes = {}
+        total = 0
+        for route, st in sorted(self.routes.items()):
+            values = sorted(st.latencies)
+            total += len(values)
+            routes[route] = {
+                "count": len(values),
+                "errors": st.errors,
+                "rps": round(len(values) / elapsed, 2),
+                "p50_ms": round(percentile(values, 50) * 1000, 1),
+                "p95_ms": round(percentile(values, 95) * 1000, 1),
+                "p99_ms": round(percentile(values, 99) * 1000, 1),
+                "max_ms": round((values[-1] if values else 0.0) * 1000, 1),
+                "statuses": {str(k): v for k, v in sorted(st.statuses.items())},
+            }
+        return {"elapsed_s": round(elapsed, 2), "requests": total, "rps": round(total / elapsed, 2), "routes": routes}
+
+
+def format_table(summary: dict[str, Any]) -> str:
+    header = f"{'route':<44} {'count':>6} {'err':>5} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}"
+    lines = [header, "-" * len(header)]
+    for route, r in summary["routes"].items():
+        lines.append(
+            f"{route:<44} {r['count']:>6} {r['errors']:>5} {r['rps']:>7} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['max_ms']:>8}"
+        )
+    lines.append("-" * len(header))
+    lines.append(f"total {summary['requests']} requests in {summary['elapsed_s']}s — {summary['rps']} req/s (latency in ms)")
+    return "\n".join(lines)
+
+
+class VirtualUser:
+    def __init__(self, client, recorder: LoadRecorder, *, index: int, run_id: str, rng: random.Random):
+        self.client = client
+        # Setup requests go to a separate recorder so they don't skew steady-state throughput.
+        self.setup_recorder = LoadRecorder()
+        self.recorder = self.setup_recorder
+        self.steady_recorder = recorder
+        self.index = index
+        self.run_id = run_id
+        self.rng = rng
+        self.headers: dict[str, str] = {}
+        self.session_id: str | None = None
+        self.memory_ids: list[str] = []
+
+    async def call(self, route: str, method: str, url: str, *, expect=(200,), **kwargs):
+        started = time.monotonic()
+        status = 0
+        try:
+            r = await self.client.request(method, url, headers={**self.headers, **kwargs.pop("headers", {})}, **kwargs)
+            status = r.status_code
+            return r
+        except Exception:
+            return None
+        finally:
+            self.recorder.record(route, time.monotonic() - started, status, status in expect)
+
+    async def setup(self) -> bool:
+        username = f"b{self.run_id}u{self.index}"
+        password = "bench-password-1"
+        device = {"X-Session-Id": f"bench-{self.index}", "X-Device-Id": f"bench-{self.index}"}
+        await self.call(
+            "POST /auth/register",
+            "POST",
+            "/api/v1/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": password},
+            headers=device,
+        )
+        r = await self.call(
+            "POST /auth/login",
+            "POST",
+            "/api/v1/auth/login",
+            data={"username": username, "password": password},
+            headers=device,
+        )
+        if r is None or r.status_code != 200:
+            return False
+        self.headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+        r = await self.call(
+            "POST /characters/me",
+            "POST",
+            "/api/v1/characters/me",
+            json={
+                "slug": f"bench{self.index}",
+                "display_name": f"Bench {self.index}",
+                "description": "Load test character",
+                "system_prompt": "You are a patient language partner.",
+                "is_public": False,
+                "is_nsfw": False,
+            },
+        )
+        if r is None or r.status_code != 200:
+            return False
+        r = await self.call(
+            "POST /chat/sessions",
+            "POST",
+            "/api/v1/chat/sessions",
+            json={"character_id": r.json()["id"], "room_id": None, "title": ""},
+        )
+        if r is None or r.status_code != 200:
+            return False
+        self.session_id = r.json()["id"]
+        return True
+
+    async def chat_turn(self) -> None:
+        await self.call(
+            "POST /chat/sessions/{id}/turn",
+            "POST",
+            f"/api/v1/chat/sessions/{self.session_id}/turn",
+            json={"content": self.rng.choice(["Hi!", "How are you?", "Tell me about your day.", "What is this word?"])},
+        )
+
+    async def memory_crud(self) -> None:
+        r = await self.call(
+            "POST /memory/me",
+            "POST",
+            "/api/v1/memory/me",
+            json={"title": "note", "content": "likes tea", "importance": 1, "is_pinned": False},
+        )
+        if r is not None and r.status_code == 200:
+            self.memory_ids.append(r.json()["id"])
+        await self.call("GET /memory/me", "GET", "/api/v1/memory/me")
+        if self.memory_ids:
+            mid = self.rng.choice(self.memory_ids)
+            await self.call("PATCH /memory/me/{id}", "PATCH", f"/api/v1/memory/me/{mid}", json={"title": "note*"})
+        if len(self.memory_ids) > 5:
+            mid = self.memory_ids.pop(0)
+            await self.call("DELETE /memory/me/{id}", "DELETE", f"/api/v1/memory/me/{mid}")
+
+    async def post_feeds(self) -> None:
+        if self.rng.random() < 0.2:
+            await self.call(
+                "POST /posts/me",
+                "POST",
+                "/api/v1/posts/me",
+                json={"title": "t", "content": "c", "character_id": None, "media": None, "is_public": True},
+            )
+        await self.call("GET /posts/public", "GET", "/api/v1/posts/public")
+        await self.call("GET /posts/me", "GET", "/api/v1/posts/me")
+
+    async def run(self, *, deadline: float, iterations: int | None, think_ms: float, weights: dict[str, int]) -> None:
+        self.recorder = self.steady_recorder
+        steps: list[Callable[[], Awaitable[None]]] = []
+        for name, weight in weights.items():
+            steps.extend([getattr(self, name)] * max(0, int(weight)))
+        done = 0
+        while steps and time.monotonic() < deadline and (iterations is None or done < iterations):
+            await self.rng.choice(steps)()
+            done += 1
+            if think_ms > 0:
+                await asyncio.sleep(self.rng.uniform(0.5, 1.5) * think_ms / 1000.0)
+
+
+def _import_all_models() -> None:
+    import app.features as features
+
+    for mod in pkgutil.iter_modules(features.__path__):
+        if mod.ispkg and importlib.util.find_spec(f"app.features.{mod.name}.models") is not None:
+            importlib.import_module(f"app.features.{mod.name}.models")
+
+
+async def run_load(
+    *,
+    users: int,
+    duration: float,
+    iterations: int | None,
+    think_ms: float,
+    provider,
+    weights: dict[str, int],
+    seed: int = 0,
+    create_schema: bool = True,
+) -> dict[str, Any]:
+    from httpx import ASGITransport, AsyncClient
+
+    from app.core.database import engine
+    from app.features.ai.ai_service import ai_service
+    from app.features.common.db import Base
+    from app.main import app
+
+    _import_all_models()
+    if create_schema:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    limiter = getattr(app.state, "limiter", None)
+    if limiter is not None:
+        limiter.enabled = False
+    original_provider = ai_service.provider
+    ai_service.provider = provider
+
+    recorder = LoadRecorder()
+    run_id = uuid.uuid4().hex[:6]
+    try:
+        async with app.router.lifespan_context(app):
+            transport = ASGITransport(app=app)
+            async with AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+                vus = [
+                    VirtualUser(client, recorder, index=i, run_id=run_id, rng=random.Random(seed * 1000 + i))
+                    for i in range(users)
+                ]
+                setup_started = time.monotonic()
+                ready = await asyncio.gather(*(vu.setup() for vu in vus))
+                recorder.started = time.monotonic()
+                deadline = recorder.started + float(duration)
+                await asyncio.gather(
+                    *(
+                        vu.run(deadline=deadline, iterations=iterations, think_ms=think_ms, weights=weights)
+                        for vu, ok in zip(vus, ready)
+                        if ok
+                    )
+                )
+                recorder.finished = time.monotonic()
+    finally:
+        ai_service.provider = original_provider
+
+    setup = LoadRecorder()
+    for vu in vus:
+        for route, st in vu.setup_recorder.routes.items():
+            merged = setup.routes.setdefault(route, RouteStats())
+            merged.latencies.extend(st.latencies)
+            merged.errors += st.errors
+            for code, n in st.statuses.items():
+                merged.statuses[code] = merged.statuses.get(code, 0) + n
+    setup.started, setup.finished = setup_started, recorder.started
+
+    summary = recorder.summary()
+    summary["setup"] = setup.summary()
+    summary["users"] = {"requested": users, "ready": sum(1 for ok in ready if ok)}
+    if hasattr(provider, "stats"):
+        summary["provider"] = provider.stats()
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(prog="python -m bench.load", description="In-process load test with a synthetic LLM.")
+    p.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    p.add_argument("--duration", type=float, default=30.0, help="seconds of steady load after setup")
+    p.add_argument("--iterations", type=int, default=None, help="stop each user after N steps (overrides duration)")
+    p.add_argument("--think-ms", type=float, default=0.0, help="mean pause between steps of one user")
+    p.add_argument("--latency", default="lognormal:600:0.4", help="fixed:MS | uniform:MIN:MAX | lognormal:MEDIAN_MS:SIGMA")
+    p.add_argument("--error-rate", type=float, default=0.0, help="share of synthetic LLM calls that fail")
+    p.add_argument("--mix", default="chat_turn=4,memory_crud=2,post_feeds=2", help="step weights")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--database-url", default=None, help="defaults to a fresh SQLite file under ./data")
+    p.add_argument("--no-create-schema", action="store_true", help="expect an already migrated database")
+    p.add_argument("--json", type=Path, default=None, help="also write the summary here")
+    return p
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+    weights: dict[str, int] = {}
+    for part in str(spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in {"chat_turn", "memory_crud", "post_feeds"}:
+            raise ValueError(f"Unknown step in --mix: {name!r}")
+        weights[name] = int(weight or 1)
+    return weights
+
+
+def prepare_environment(database_url: str | None) -> str | None:
+    """Настройки читаются при импорте `app`, поэтому окружение готовится до него."""
+    os.environ.setdefault("SECRET_KEY", "bench-secret-key")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    os.environ.setdefault("AI_JOB_WORKERS", "0")
+    scratch = None
+    if database_url:
+        os.environ["DATABASE_URL"] = database_url
+    else:
+        os.makedirs("./data", exist_ok=True)
+        scratch = f"./data/bench_{os.getpid()}.db"
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{scratch}"
+    return scratch
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        latency = LatencyModel.parse(args.latency)
+        weights = parse_mix(args.mix)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    scratch = prepare_environment(args.database_url)
+    provider = SyntheticProvider(latency, error_rate=args.error_rate, seed=args.seed)
+    try:
+        summary = asyncio.run(
+            run_load(
+                users=args.users,
+                duration=args.duration if args.iterations is None else float("inf"),
+                iterations=args.iterations,
+                think_ms=args.think_ms,
+                provider=provider,
+                weights=weights,
+                seed=args.seed,
+                create_schema=not args.no_create_schema,
+            )
+        )
+    finally:
+        if scratch and os.path.exists(scratch):
+            os.remove(scratch)
+
+    print("setup:")
+    print(format_table(summary["setup"]))
+    print()
+    print(f"steady load ({summary['users']['ready']}/{summary['users']['requested']} users ready):")
+    print(format_table(summary))
+    if "provider" in summary:
+        print(f"synthetic LLM: {summary['provider']}")
+    if args.json:
+        args.json.write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -65,6 +65,8 @@ async def _db_schema(async_sessionmaker) -> AsyncGenerator[None, None]:
     from app.features.auth import models as _auth_models  # noqa: F401
     from app.features.characters import models as _characters_models  # noqa: F401
     from app.features.chat import models as _chat_models  # noqa: F401
+    from app.features.jobs import models as _jobs_models  # noqa: F401
+    from app.features.lesson_library import models as _lesson_library_models  # noqa: F401
     from app.features.memory import models as _memory_models  # noqa: F401
     from app.features.posts import models as _posts_models  # noqa: F401
     from app.features.rooms import models as _rooms_models  # noqa: F401
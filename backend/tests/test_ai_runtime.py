@@ -0,0 +1,1009 @@
+import pytest
+
+
+class _CountingProvider:
+    model = "fake-model"
+
+    def __init__(self, response: dict | None = None):
+        self.calls = 0
+        self.response = response or {"ok": True}
+
+    async def generate_json(self, prompt, *, temperature=None):
+        self.calls += 1
+        return dict(self.response)
+
+    async def generate_text(self, prompt, *, temperature=None):
+        self.calls += 1
+        return "text"
+
+    async def generate_chat(self, messages, *, temperature=None):
+        self.calls += 1
+        return "chat"
+
+
+@pytest.fixture(autouse=True)
+def _reset_prompt_cache():
+    from app.core.ai.cache import prompt_cache
+    from app.core.ai.circuit_state import circuit_state
+    from app.features.ai.ai_service import AIService
+
+    from app.core.ai.rate_budget import rate_budget
+    from app.core.ai.prompt_fingerprint import semantic_cache
+    from app.features.ai.cache_maintenance import llm_cache_hits
+    from app.features.ai.telemetry import ai_event_buffer
+
+    prompt_cache.clear()
+    circuit_state.clear()
+    rate_budget.clear()
+    semantic_cache.clear()
+    llm_cache_hits.clear()
+    ai_event_buffer.clear()
+    AIService._circuit_seen_failures.clear()
+    yield
+    prompt_cache.clear()
+    circuit_state.clear()
+    rate_budget.clear()
+    semantic_cache.clear()
+    llm_cache_hits.clear()
+    ai_event_buffer.clear()
+    AIService._circuit_seen_failures.clear()
+
+
+def test_lru_ttl_cache_evicts_by_size_and_age(monkeypatch):
+    from app.core.ai import cache as cache_mod
+
+    c = cache_mod.LRUTTLCache(max_entries=2, ttl_seconds=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    assert c.get("a") == 1
+    c.set("c", 3)
+    assert c.get("b") is None
+    assert c.stats()["evictions"] == 1
+
+    now = cache_mod.time.monotonic()
+    monkeypatch.setattr(cache_mod.time, "monotonic", lambda: now + 11)
+    assert c.get("a") is None
+    stats = c.stats()
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_generate_json_served_from_memory_tier(db):
+    from app.core.ai.cache import prompt_cache
+    from app.features.ai.ai_service import AIService
+
+    provider = _CountingProvider({"items": [1, 2]})
+    svc = AIService(provider=provider)
+
+    first = await svc._generate_json_with_retries("prompt JSON", db=db, use_cache=True)
+    first["items"].append(3)
+    second = await svc._generate_json_with_retries("prompt JSON", db=db, use_cache=True)
+
+    assert provider.calls == 1
+    assert second == {"items": [1, 2]}
+    assert prompt_cache.stats()["hits"] == 1
+
+
+class _SlowProvider(_CountingProvider):
+    def __init__(self, response: dict | None = None):
+        super().__init__(response)
+        import asyncio
+
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def generate_json(self, prompt, *, temperature=None):
+        import asyncio
+
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return dict(self.response)
+
+
+@pytest.mark.asyncio
+async def test_identical_prompts_in_flight_are_coalesced(db):
+    import asyncio
+
+    from app.core.ai.singleflight import llm_single_flight
+    from app.features.ai.ai_service import AIService
+
+    provider = _SlowProvider({"items": [1]})
+    svc = AIService(provider=provider)
+    before = llm_single_flight.coalesced
+
+    tasks = [
+        asyncio.create_task(svc._generate_json_with_retries("same prompt JSON", use_cache=False))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0.01)
+    provider.release.set()
+    results = await asyncio.gather(*tasks)
+
+    assert provider.calls == 1
+    assert llm_single_flight.coalesced - before == 2
+    assert results == [{"items": [1]}] * 3
+    results[0]["items"].append(2)
+    assert results[1] == {"items": [1]}
+    assert llm_single_flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_waiter_cancellation():
+    import asyncio
+
+    from app.core.ai.singleflight import SingleFlight
+
+    sf = SingleFlight()
+    provider = _SlowProvider({"v": 1})
+
+    first = asyncio.create_task(sf.do("k", lambda: provider.generate_json("p")))
+    second = asyncio.create_task(sf.do("k", lambda: provider.generate_json("p")))
+    await asyncio.sleep(0.01)
+
+    first.cancel()
+    await asyncio.sleep(0.01)
+    assert not provider.cancelled
+
+    provider.release.set()
+    result, shared = await second
+    assert result == {"v": 1}
+    # The leader is gone, so the follower owns the result.
+    assert shared is False
+    assert provider.calls == 1
+
+    provider.release.clear()
+    lonely = asyncio.create_task(sf.do("k2", lambda: provider.generate_json("p")))
+    await asyncio.sleep(0.01)
+    lonely.cancel()
+    await asyncio.sleep(0.01)
+    assert provider.cancelled
+    assert sf.stats()["abandoned"] == 1
+    assert sf.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_follower_writes_cache_row_when_leader_disconnects(async_sessionmaker):
+    import asyncio
+
+    from sqlalchemy import select
+
+    from app.features.ai.ai_service import AIService
+    from app.features.ai.models import LLMCacheEntry
+
+    provider = _SlowProvider({"items": ["shared"]})
+    svc = AIService(provider=provider)
+    prompt = "leader leaves JSON"
+
+    async with async_sessionmaker() as leader_db, async_sessionmaker() as follower_db:
+        leader = asyncio.create_task(svc._generate_json_with_retries(prompt, db=leader_db, use_cache=True))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(svc._generate_json_with_retries(prompt, db=follower_db, use_cache=True))
+        await asyncio.sleep(0.01)
+
+        # The leader's client disconnects mid-generation; the follower is still waiting.
+        leader.cancel()
+        await asyncio.gather(leader, return_exceptions=True)
+        assert not provider.cancelled
+
+        provider.release.set()
+        assert await follower == {"items": ["shared"]}
+        assert provider.calls == 1
+        await follower_db.commit()
+
+    prompt_hash = svc._compute_prompt_hash(svc._truncate_prompt(prompt), provider="_SlowProvider", model="fake-model")
+    async with async_sessionmaker() as s:
+        row = (await s.execute(select(LLMCacheEntry).where(LLMCacheEntry.prompt_hash == prompt_hash))).scalars().first()
+    assert row is not None
+
+
+@pytest.mark.asyncio
+async def test_hedged_request_uses_backup_and_cancels_primary(monkeypatch):
+    import asyncio
+
+    from app.core.ai.hedging import hedge_policy
+    from app.core.config import settings
+    from app.features.ai.ai_service import AIService
+
+    slow = _SlowProvider({"from": "primary"})
+    slow.model = "primary-model"
+    fast = _CountingProvider({"from": "backup"})
+    fast.model = "backup-model"
+
+    monkeypatch.setattr(settings, "AI_HEDGE_OPERATIONS", ["exercises"], raising=False)
+    monkeypatch.setattr(settings, "AI_HEDGE_MAX_DELAY_SECONDS", 0.05, raising=False)
+    monkeypatch.setattr(AIService, "_provider_candidates", lambda self: [slow, fast])
+    hedge_policy.tracker.clear()
+    wins_before = hedge_policy.hedge_wins
+
+    svc = AIService(provider=slow)
+    result = await svc._generate_json_with_retries("hedge me JSON", use_cache=False, operation="exercises")
+    await asyncio.sleep(0.01)
+
+    assert result == {"from": "backup"}
+    assert slow.cancelled
+    assert fast.calls == 1
+    assert hedge_policy.hedge_wins - wins_before == 1
+
+
+def test_hedge_delay_follows_latency_percentile(monkeypatch):
+    from app.core.ai.hedging import HedgePolicy
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "AI_HEDGE_OPERATIONS", ["chat_turn"], raising=False)
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_SAMPLES", 10, raising=False)
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_DELAY_SECONDS", 0.1, raising=False)
+    monkeypatch.setattr(settings, "AI_HEDGE_MAX_DELAY_SECONDS", 5.0, raising=False)
+    monkeypatch.setattr(settings, "AI_HEDGE_PERCENTILE", 0.9, raising=False)
+
+    policy = HedgePolicy()
+    assert policy.delay_for("lesson_core") is None
+    assert policy.delay_for("chat_turn") == 5.0
+
+    for i in range(1, 11):
+        policy.observe("chat_turn", i / 10)
+    assert policy.delay_for("chat_turn") == pytest.approx(0.9)
+
+
+@pytest.mark.asyncio
+async def test_provider_registry_reuses_instances_and_pool():
+    from app.core.ai.registry import ProviderRegistry
+
+    registry = ProviderRegistry()
+    a = registry.groq("model-a")
+    assert registry.groq("model-a") is a
+    b = registry.groq("model-b")
+    assert b is not a
+    assert a.client._client is b.client._client is registry.http_client()
+
+    pool = registry.http_client()
+    await registry.aclose()
+    assert pool.is_closed
+    assert registry.groq("model-a") is a
+    assert a.client._client is registry.http_client() is not pool
+    assert not a.client._client.is_closed
+    await registry.aclose()
+
+
+def test_prompt_packer_keeps_newest_within_quotas():
+    from app.core.ai.prompt_packer import PromptPacker, PromptSection, estimate_tokens
+
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("привет") > estimate_tokens("privet")
+
+    turns_newest_first = [f"turn {i} " + "x" * 36 for i in range(9, -1, -1)]
+    packed = PromptPacker(100).pack(
+        [
+            PromptSection("current", ["hello?"], priority=0, required=True),
+            PromptSection("recent", turns_newest_first, priority=1, quota=0.6, contiguous=True),
+            PromptSection("memory", ["a" * 400, "short fact"], priority=2, quota=0.2),
+        ]
+    )
+
+    assert packed.kept("current") == [0]
+    assert packed.kept("recent") == [0, 1, 2, 3]
+    assert packed.kept("memory") == [1]
+    assert packed.used_tokens <= 100
+
+
+def test_truncate_prompt_keeps_tail(monkeypatch):
+    from app.core.config import settings
+    from app.features.ai.ai_service import AIService
+
+    monkeypatch.setattr(settings, "AI_MAX_PROMPT_CHARS", 100)
+    prompt = "HEAD " + "m" * 500 + " NEWEST USER MESSAGE. Output JSON."
+    out = AIService._truncate_prompt(prompt)
+
+    assert len(out) == 100
+    assert out.startswith("HEAD ")
+    assert out.endswith("NEWEST USER MESSAGE. Output JSON.")
+
+
+@pytest.mark.asyncio
+async def test_sqlite_circuit_state_is_shared_between_workers(tmp_path):
+    from app.core.ai.circuit_state import SqliteCircuitStateBackend
+
+    path = str(tmp_path / "circuit.sqlite3")
+    worker_a = SqliteCircuitStateBackend(path)
+    worker_b = SqliteCircuitStateBackend(path)
+
+    await worker_a.record_failure("GroqProvider:m", threshold=2, open_seconds=60)
+    st = await worker_b.record_failure("GroqProvider:m", threshold=2, open_seconds=60)
+    assert st.fail_count == 2
+    assert (await worker_a.get("GroqProvider:m")).opened_until > 0
+
+    await worker_b.set_backoff("GroqProvider:other", 123.0)
+    await worker_b.set_backoff("GroqProvider:other", 50.0)
+    assert (await worker_a.get("GroqProvider:other")).backoff_until == 123.0
+
+    await worker_a.record_success("GroqProvider:m")
+    st = await worker_b.get("GroqProvider:m")
+    assert st.fail_count == 0 and st.opened_until == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_model_is_skipped_after_backoff(monkeypatch):
+    from app.features.ai.ai_service import AIService
+
+    class _RateLimited(_CountingProvider):
+        async def generate_json(self, prompt, *, temperature=None):
+            self.calls += 1
+            raise RuntimeError("Error code: 429 rate limit. Please try again in 30s")
+
+    limited = _RateLimited()
+    limited.model = "limited"
+    svc = AIService(provider=limited)
+
+    with pytest.raises(Exception):
+        await svc._generate_json_with_retries("x JSON", use_cache=False, max_attempts=1)
+    assert limited.calls == 1
+    assert await AIService._is_circuit_open(limited)
+
+    with pytest.raises(Exception):
+        await svc._generate_json_with_retries("x JSON", use_cache=False, max_attempts=1)
+    assert limited.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_scheduler_orders_waiters_by_priority_then_tier(monkeypatch):
+    import asyncio
+
+    from app.core.ai import scheduler as sched
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "AI_MODEL_CONCURRENCY", {"m": 1}, raising=False)
+    s = sched.LLMScheduler()
+    order: list[str] = []
+
+    async def job(name: str, priority: int, tier_rank: int):
+        sched.llm_tier_rank_ctx.set(tier_rank)
+        async with s.slot("m", priority=priority):
+            order.append(name)
+
+    await s.acquire("m", priority=sched.PRIORITY_LESSON)
+    tasks = [
+        asyncio.create_task(job("repair", sched.PRIORITY_BACKGROUND, 0)),
+        asyncio.create_task(job("lesson", sched.PRIORITY_LESSON, 2)),
+        asyncio.create_task(job("chat-free", sched.PRIORITY_INTERACTIVE, 2)),
+        asyncio.create_task(job("chat-pro", sched.PRIORITY_INTERACTIVE, 0)),
+    ]
+    cancelled = asyncio.create_task(job("gone", sched.PRIORITY_INTERACTIVE, 0))
+    await asyncio.sleep(0.01)
+    assert s.stats()["models"]["m"]["queue_depth"] == 5
+    cancelled.cancel()
+    await asyncio.sleep(0)
+
+    s.release("m")
+    await asyncio.gather(*tasks)
+
+    assert order == ["chat-pro", "chat-free", "lesson", "repair"]
+    stats = s.stats()
+    assert stats["models"]["m"] == {"limit": 1, "active": 0, "queue_depth": 0}
+    assert stats["priorities"]["interactive"]["waited"] == 2
+    assert stats["priorities"]["background"]["wait_seconds_max"] > 0
+
+
+def test_parse_rate_limit_reset_durations():
+    from app.core.ai.rate_budget import parse_reset_seconds
+
+    assert parse_reset_seconds("2m59.56s") == pytest.approx(179.56)
+    assert parse_reset_seconds("7.66s") == pytest.approx(7.66)
+    assert parse_reset_seconds("450ms") == pytest.approx(0.45)
+    assert parse_reset_seconds("12") == 12.0
+    assert parse_reset_seconds("") is None
+
+
+@pytest.mark.asyncio
+async def test_groq_provider_feeds_rate_budget_from_headers(monkeypatch):
+    import httpx
+
+    from app.core.ai.groq_provider import GroqProvider
+    from app.core.ai.rate_budget import RateBudgetExhausted, rate_budget
+    from app.core.config import settings
+
+    monkeypatch.setattr(settings, "GROQ_API_KEY", "test-key")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            200,
+            headers={
+                "x-ratelimit-limit-requests": "1000",
+                "x-ratelimit-remaining-requests": "999",
+                "x-ratelimit-reset-requests": "1m26.4s",
+                "x-ratelimit-limit-tokens": "6000",
+                "x-ratelimit-remaining-tokens": "10",
+                "x-ratelimit-reset-tokens": "59.9s",
+            },
+            json={
+                "id": "c1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "budget-model",
+                "choices": [
+                    {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "{\"ok\": true}"}}
+                ],
+            },
+        )
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    provider = GroqProvider(model="budget-model", http_client=client)
+
+    assert await provider.generate_json("give JSON") == {"ok": True}
+    assert rate_budget.delay_for("budget-model", 2000) > 5
+
+    with pytest.raises(RateBudgetExhausted):
+        await provider.generate_json("give JSON")
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_rate_budget_wait_does_not_hold_a_scheduler_slot(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    from app.core.ai.groq_provider import GroqProvider
+    from app.core.ai.rate_budget import rate_budget
+    from app.core.ai.scheduler import llm_scheduler
+
+    release = asyncio.Event()
+    waiting = asyncio.Event()
+
+    async def _slow_budget(model, tokens):
+        waiting.set()
+        await release.wait()
+
+    async def _fake_send(*, timeout, **kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+    monkeypatch.setattr(rate_budget, "wait", _slow_budget)
+    provider = GroqProvider(model="slot-model")
+    provider.api_key = "test"
+    monkeypatch.setattr(provider, "_send", _fake_send)
+
+    task = asyncio.create_task(provider.generate_text("waits on budget"))
+    await waiting.wait()
+    assert llm_scheduler.stats()["models"].get("slot-model", {"active": 0})["active"] == 0
+    release.set()
+    assert await task == "ok"
+
+
+@pytest.mark.asyncio
+async def test_spent_rate_budget_reroutes_to_next_model(monkeypatch):
+    from app.core.ai.rate_budget import rate_budget
+    from app.features.ai.ai_service import AIService
+
+    primary = _CountingProvider({"from": "primary"})
+    primary.model = "primary-model"
+    backup = _CountingProvider({"from": "backup"})
+    backup.model = "backup-model"
+    monkeypatch.setattr(AIService, "_provider_candidates", lambda self: [primary, backup])
+
+    rate_budget.observe(
+        "primary-model",
+        {"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "59s"},
+    )
+    result = await AIService(provider=primary)._generate_json_with_retries("route JSON", use_cache=False)
+
+    assert result == {"from": "backup"}
+    assert primary.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_run_stages_runs_independent_stages_concurrently():
+    import asyncio
+
+    from app.core.ai.pipeline import Stage, StageTimings, run_stages
+
+    running = 0
+    peak = 0
+
+    async def work(value):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return value
+
+    async def boom(_):
+        raise RuntimeError("optional stage failed")
+
+    timings = StageTimings()
+    results = await run_stages(
+        [
+            Stage("a", lambda _: work(1)),
+            Stage("b", lambda _: work(2)),
+            Stage("plan", boom, optional=True),
+            Stage("c", lambda inputs: work(inputs["a"] + inputs["b"] + (inputs["plan"] or 0)), deps=("a", "b", "plan")),
+        ],
+        timings,
+    )
+
+    assert results == {"a": 1, "b": 2, "plan": None, "c": 3}
+    assert peak == 2
+    assert set(timings) == {"a", "b", "plan", "c"}
+    assert timings["c"] >= 15
+
+
+@pytest.mark.asyncio
+async def test_strict_lesson_generates_exercise_sets_in_parallel(monkeypatch):
+    import asyncio
+
+    from app.features.ai.ai_service import AIService
+
+    svc = AIService(provider=_CountingProvider())
+    in_flight = 0
+    peak = 0
+
+    async def fake_core(**kwargs):
+        return {
+            "text": "Hola mundo.",
+            "vocabulary": [{"word": "hola", "translation": "привет"}],
+            "_meta": {"repair_count": 0, "validation_errors": [], "stage_timings_ms": {"text": 5, "vocab": 3}},
+        }
+
+    def fake_exercises(kind):
+        async def _gen(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            return {"exercises": [{"type": kind}]}
+
+        return _gen
+
+    async def fake_review(**kwargs):
+        return kwargs["exercises_container"], []
+
+    monkeypatch.setattr(svc, "generate_text_vocab_only", fake_core)
+    monkeypatch.setattr(svc, "generate_exercises_vocab_only", fake_exercises("quiz"))
+    monkeypatch.setattr(svc, "generate_exercises_text_only", fake_exercises("true_false"))
+    monkeypatch.setattr(svc, "_sanitize_exercises_container", lambda c: c)
+    monkeypatch.setattr(svc, "_validate_exercises", lambda *a, **k: [])
+    monkeypatch.setattr(svc, "_validate_exercise_traceability", lambda *a, **k: [])
+    monkeypatch.setattr(svc, "_validate_sentence_source", lambda *a, **k: [])
+    monkeypatch.setattr(svc, "_strict_review_and_fix_exercises", fake_review)
+
+    out = await svc.generate_lesson("greetings", "Spanish", "Russian", "A1", generation_mode="strict")
+
+    assert peak == 2
+    assert [e["type"] for e in out["exercises"]] == ["quiz", "true_false"]
+    timings = out["_meta"]["stage_timings_ms"]
+    assert {"text", "vocab", "exercises_vocab", "exercises_text", "exercises_repair", "exercises_review"} <= set(timings)
+
+
+@pytest.mark.asyncio
+async def test_exercise_repair_patches_only_the_broken_items():
+    from app.features.ai.ai_service import AIService
+
+    service = AIService(provider=_CountingProvider())
+
+    def _quiz(question, correct_index=0):
+        return {"type": "quiz", "question": question, "options": ["red", "green", "blue"], "correct_index": correct_index}
+
+    container = {"exercises": [_quiz("Which color is the sky?", 2), _quiz("Pick a color", 7), _quiz("Which color is grass?", 1)]}
+    patched = []
+
+    async def _fake_fix(*, invalid_json, errors, instruction, db=None, strict_multistep=False):
+        patched.append(invalid_json)
+        return {"exercise": {**invalid_json["exercise"], "correct_index": 0}}
+
+    service._fix_json_with_patch = _fake_fix
+
+    out, errors, attempts = await service._validate_and_repair_exercises(
+        container, target_language="English", max_repairs=2, db=None, sanitize=True
+    )
+
+    assert patched == [{"exercise": _quiz("Pick a color", 7)}]
+    assert [e["field"] for e in errors] == ["exercises[1].correct_index"]
+    assert attempts == 2
+    assert [ex["correct_index"] for ex in out["exercises"]] == [2, 0, 1]
+
+
+@pytest.mark.asyncio
+async def test_balanced_escalation_reuses_core_and_reruns_only_exercises(monkeypatch):
+    from app.features.ai.ai_service import AIService
+
+    svc = AIService(provider=_CountingProvider())
+    core_calls = []
+
+    async def fake_core(**kwargs):
+        core_calls.append(kwargs["generation_mode"])
+        return {
+            "text": "Hola mundo.",
+            "vocabulary": [{"word": "hola", "translation": "привет"}],
+            "_meta": {"repair_count": 0, "validation_errors": [], "stage_timings_ms": {"text_vocab": 7}},
+        }
+
+    async def broken_balanced_exercises(prompt, **kwargs):
+        return {"exercises": []}
+
+    async def failed_fix(**kwargs):
+        return {"exercises": []}
+
+    async def strict_exercises(**kwargs):
+        return {"exercises": [{"type": "quiz"}]}
+
+    async def fake_review(**kwargs):
+        return kwargs["exercises_container"], []
+
+    def fake_validate(exercises, **kwargs):
+        return [] if exercises else [{"code": "exercises_invalid", "field": "exercises", "reason": "missing_or_empty"}]
+
+    monkeypatch.setattr(svc, "generate_text_vocab_only", fake_core)
+    monkeypatch.setattr(svc, "_generate_json_with_retries", broken_balanced_exercises)
+    monkeypatch.setattr(svc, "_fix_json_with_patch", failed_fix)
+    monkeypatch.setattr(svc, "generate_exercises_vocab_only", strict_exercises)
+    monkeypatch.setattr(svc, "generate_exercises_text_only", strict_exercises)
+    monkeypatch.setattr(svc, "_validate_exercises", fake_validate)
+    monkeypatch.setattr(svc, "_validate_exercise_traceability", lambda *a, **k: [])
+    monkeypatch.setattr(svc, "_validate_sentence_source", lambda *a, **k: [])
+    monkeypatch.setattr(svc, "_strict_review_and_fix_exercises", fake_review)
+
+    out = await svc.generate_lesson("greetings", "Spanish", "Russian", "A1", generation_mode="balanced")
+
+    assert core_calls == ["balanced"]
+    assert out["text"] == "Hola mundo."
+    assert len(out["exercises"]) == 2
+    meta = out["_meta"]
+    # Only the exercises ran in strict mode; the core was not strict-reviewed.
+    assert meta["generation_mode"] == "balanced" and meta["quality_status"] == "ok"
+    assert meta["escalation"]["exercises_mode"] == "strict"
+    assert meta["escalation"]["reason"] == "needs_review"
+    assert meta["escalation"]["reused"] == ["text", "vocabulary"]
+    assert meta["escalation"]["rerun"] == ["exercises"]
+
+
+def test_minhash_similarity_tracks_jaccard():
+    from app.core.ai.prompt_fingerprint import MinHasher, estimate_similarity, shingles
+
+    hasher = MinHasher(num_perm=128)
+    base = " ".join(f"w{i}" for i in range(60))
+    near = base.replace("w30", "x30")
+    far = " ".join(f"z{i}" for i in range(60))
+
+    sig = hasher.signature(shingles(base))
+    assert estimate_similarity(sig, hasher.signature(shingles(base))) == 1.0
+    assert estimate_similarity(sig, hasher.signature(shingles(near))) > 0.8
+    assert estimate_similarity(sig, hasher.signature(shingles(far))) < 0.1
+
+
+@pytest.mark.asyncio
+async def test_course_path_near_duplicates_hit_semantic_cache():
+    from app.core.ai.prompt_fingerprint import semantic_cache
+    from app.features.ai.ai_service import AIService
+
+    provider = _CountingProvider({"sections": [{"order": 1, "title": "t", "units": []}]})
+    svc = AIService(provider=provider)
+
+    await svc.generate_course_path("English", "Russian", "A1", interests="Games, Music", theme="Mobile Legends")
+    # Whitespace, case and interest order differ: the exact prompt hash misses, the fingerprint does not.
+    out = await svc.generate_course_path("english", "Russian", "a1", interests="music,games", theme="  mobile   legends ")
+    assert provider.calls == 1
+    assert out["sections"][0]["title"] == "t"
+    assert semantic_cache.audit[-1]["operation"] == "course_path"
+    assert semantic_cache.audit[-1]["similarity"] == 1.0
+
+    # A different fixed field (target language) never matches.
+    await svc.generate_course_path("German", "Russian", "A1", interests="Games, Music", theme="Mobile Legends")
+    assert provider.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_rows_are_compressed_and_hits_flushed_in_batch(db, async_sessionmaker):
+    from sqlalchemy import select
+
+    from app.core.ai.cache import prompt_cache
+    from app.features.ai.ai_service import AIService
+    from app.features.ai.cache_maintenance import entry_prompt, llm_cache_hits
+    from app.features.ai.models import LLMCacheEntry
+
+    provider = _CountingProvider({"words": ["привет"] * 50})
+    svc = AIService(provider=provider)
+
+    await svc._generate_json_with_retries("compress me " * 40, db=db, use_cache=True)
+    await db.commit()
+    prompt_cache.clear()
+    again = await svc._generate_json_with_retries("compress me " * 40, db=db, use_cache=True)
+    again_mem = await svc._generate_json_with_retries("compress me " * 40, db=db, use_cache=True)
+
+    assert provider.calls == 1
+    assert again == again_mem == {"words": ["привет"] * 50}
+
+    row = (await db.execute(select(LLMCacheEntry))).scalar_one()
+    assert row.response_json is None and row.response_gz is not None
+    assert entry_prompt(row) == "compress me " * 40
+    assert row.size_bytes < len(("compress me " * 40).encode("utf-8"))
+    assert llm_cache_hits.pending() == 1
+
+    assert await llm_cache_hits.flush(async_sessionmaker) == 1
+    assert llm_cache_hits.pending() == 0
+    async with async_sessionmaker() as s:
+        fresh = (await s.execute(select(LLMCacheEntry))).scalar_one()
+    assert fresh.hit_count == 2
+    assert fresh.last_hit_at is not None
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_eviction_runs_in_chunks_by_ttl_then_lru(async_sessionmaker):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import func, select
+
+    from app.features.ai.cache_maintenance import evict_llm_cache
+    from app.features.ai.models import LLMCacheEntry
+
+    now = datetime.utcnow()
+    async with async_sessionmaker() as s:
+        for i in range(10):
+            s.add(
+                LLMCacheEntry(
+                    prompt_hash=f"h{i}",
+                    prompt="",
+                    response_json={"i": i},
+                    created_at=now - timedelta(days=60 if i < 3 else 1, minutes=i),
+                    # Entry 3 is old by creation but was just used, so LRU keeps it.
+                    last_hit_at=now if i == 3 else None,
+                )
+            )
+        await s.commit()
+
+    result = await evict_llm_cache(async_sessionmaker, ttl_seconds=30 * 86400, max_rows=5, chunk_size=2, max_chunks=10)
+
+    assert result == {"expired": 3, "over_capacity": 2, "chunks": 3}
+    async with async_sessionmaker() as s:
+        left = set((await s.execute(select(LLMCacheEntry.prompt_hash))).scalars().all())
+        assert (await s.execute(select(func.count()).select_from(LLMCacheEntry))).scalar() == 5
+    assert "h3" in left
+    assert not left & {"h0", "h1", "h2", "h8", "h9"}
+
+
+@pytest.mark.asyncio
+async def test_generation_events_are_buffered_and_written_in_batches(db, async_sessionmaker, monkeypatch):
+    from sqlalchemy import select
+
+    from app.core.config import settings
+    from app.features.ai.ai_service import AIService
+    from app.features.ai.models import AIGenerationEvent
+    from app.features.ai.telemetry import ai_event_buffer
+
+    monkeypatch.setattr(settings, "AI_TELEMETRY_BUFFER_MAX", 5, raising=False)
+    monkeypatch.setattr(settings, "AI_TELEMETRY_BATCH_SIZE", 2, raising=False)
+
+    svc = AIService(provider=_CountingProvider())
+    for _ in range(7):
+        await svc.generate_character_chat_turn(db=db, messages=[{"role": "user", "content": "hi"}])
+    await db.rollback()
+
+    assert ai_event_buffer.stats()["pending"] == 5
+    assert ai_event_buffer.stats()["dropped"] == 2
+
+    assert await ai_event_buffer.flush(async_sessionmaker) == 5
+    stats = ai_event_buffer.stats()
+    assert stats["batches"] == 3 and stats["pending"] == 0
+
+    async with async_sessionmaker() as s:
+        rows = (await s.execute(select(AIGenerationEvent))).scalars().all()
+    assert len(rows) == 5
+    assert {r.operation for r in rows} == {"chat_turn"}
+    assert {r.quality_status for r in rows} == {"ok"}
+    assert all(r.model == "fake-model" for r in rows)
+    assert all(r.created_at is not None for r in rows)
+
+
+@pytest.mark.asyncio
+async def test_recorded_cassette_replays_responses_and_scaled_latency(tmp_path):
+    import asyncio
+    import time
+
+    from app.core.ai.replay import CassetteMiss, RecordingProvider, ReplayedProviderError, ReplayProvider
+
+    class _Live(_CountingProvider):
+        async def generate_json(self, prompt, *, temperature=None):
+            self.calls += 1
+            await asyncio.sleep(0.1)
+            if prompt == "boom":
+                raise RuntimeError("503 service unavailable")
+            return {"n": self.calls}
+
+        async def stream_json(self, prompt, *, temperature=None):
+            for part in ('{"a":', " 1}"):
+                await asyncio.sleep(0.05)
+                yield part
+
+    cassette = str(tmp_path / "cassettes" / "run.jsonl")
+    recorder = RecordingProvider(_Live(), cassette)
+    assert await recorder.generate_json("p") == {"n": 1}
+    assert await recorder.generate_json("p") == {"n": 2}
+    with pytest.raises(RuntimeError):
+        await recorder.generate_json("boom")
+    assert [c async for c in recorder.stream_json("s")] == ['{"a":', " 1}"]
+    assert await recorder.generate_chat([{"role": "user", "content": "hi"}]) == "chat"
+
+    instant = ReplayProvider(cassette, latency_scale=0.0)
+    assert instant.model == "fake-model"
+    started = time.monotonic()
+    assert [await instant.generate_json("p") for _ in range(3)] == [{"n": 1}, {"n": 2}, {"n": 1}]
+    assert [c async for c in instant.stream_json("s")] == ['{"a":', " 1}"]
+    assert await instant.generate_chat([{"role": "user", "content": "hi"}]) == "chat"
+    assert time.monotonic() - started < 0.05
+    with pytest.raises(ReplayedProviderError, match="503"):
+        await instant.generate_json("boom")
+    with pytest.raises(CassetteMiss):
+        await instant.generate_json("never recorded")
+
+    halved = ReplayProvider(cassette, latency_scale=0.5)
+    started = time.monotonic()
+    await halved.generate_json("p")
+    assert 0.04 <= time.monotonic() - started < 0.1
+
+
+@pytest.mark.asyncio
+async def test_fault_injection_drives_retry_and_breaker(monkeypatch):
+    import asyncio
+    import json
+
+    from app.core.ai.faults import FaultInjectingProvider, FaultSchedule
+    from app.core.config import settings
+    from app.core.exceptions import ServiceException
+    from app.features.ai.ai_service import AIService
+
+    schedule = FaultSchedule.parse("429:0,503,ok")
+    assert [schedule.next().kind for _ in range(4)] == ["429", "503", "ok", "429"]
+    with pytest.raises(ValueError):
+        FaultSchedule.parse("teapot")
+
+    monkeypatch.setattr(settings, "AI_CIRCUIT_BREAKER_FAIL_THRESHOLD", 3, raising=False)
+    provider = FaultInjectingProvider(_CountingProvider({"ok": True}), "429:0*2,ok")
+    svc = AIService(provider=provider)
+
+    # A 429 carrying "try again in 0s" is retried right away; the third attempt succeeds.
+    assert await svc._generate_json_with_retries("p1", max_attempts=3, use_cache=False) == {"ok": True}
+    assert provider.stats() == {"ok": 1, "429": 2, "timeout": 0, "503": 0, "malformed": 0, "slow": 0}
+    with pytest.raises(asyncio.TimeoutError):
+        await FaultInjectingProvider(_CountingProvider(), "timeout").generate_json("p0")
+
+    # Malformed JSON is not transient: no retry, the call fails with the decoder's message.
+    broken = FaultInjectingProvider(_CountingProvider({"ok": True}), "malformed")
+    with pytest.raises(ServiceException):
+        await AIService(provider=broken)._generate_json_with_retries("p2", max_attempts=3, use_cache=False)
+    assert broken.stats()["malformed"] == 1
+    with pytest.raises(json.JSONDecodeError):
+        await broken.generate_json("p3")
+
+    # Three failures open the breaker; the next request fails fast without reaching the provider.
+    down = FaultInjectingProvider(_CountingProvider({"ok": True}), "429:0*3,ok")
+    svc_down = AIService(provider=down)
+    with pytest.raises(ServiceException):
+        await svc_down._generate_json_with_retries("p4", max_attempts=3, use_cache=False)
+    with pytest.raises(ServiceException):
+        await svc_down._generate_json_with_retries("p5", max_attempts=3, use_cache=False)
+    assert down.stats()["429"] == 3 and down.stats()["ok"] == 0
+
+
+@pytest.mark.asyncio
+async def test_turn_stream_is_aborted_on_shape_mismatch_and_retried():
+    from app.core.ai.json_stream import JsonShapeValidator, StreamSchemaError
+    from app.core.metrics import llm_stream_rejections
+    from app.features.ai.ai_service import ROOM_TURN_SHAPE, AIService
+
+    class _Streaming(_CountingProvider):
+        def __init__(self, outputs: list[list[str]]):
+            super().__init__()
+            self.outputs = outputs
+            self.read = 0
+            self.closed = 0
+
+        async def stream_json(self, prompt, *, temperature=None):
+            chunks = self.outputs[min(self.calls, len(self.outputs) - 1)]
+            self.calls += 1
+            try:
+                for chunk in chunks:
+                    self.read += 1
+                    yield chunk
+            finally:
+                self.closed += 1
+
+    bad = ['{"speaker": ', "42", ', "message": "', *(["padding "] * 50), '"}']
+    good = ['{"speaker": "Ann", ', '"message": "Hi"}', " trailing text"]
+    provider = _Streaming([bad, good])
+    before = llm_stream_rejections.value(operation="room_turn", reason="type")
+
+    data = await AIService(provider=provider).generate_room_chat_turn_json(
+        db=None, messages=[{"role": "user", "content": "hi"}]
+    )
+
+    assert data == {"speaker": "Ann", "message": "Hi"}
+    # The bad answer is dropped at the number, long before its 50 padding chunks.
+    assert provider.calls == 2 and provider.read == 2 + 2 and provider.closed == 2
+    assert llm_stream_rejections.value(operation="room_turn", reason="type") == before + 1
+
+    validator = JsonShapeValidator(ROOM_TURN_SHAPE)
+    validator.feed('{"speaker": "Ann", "message": "cut')
+    with pytest.raises(StreamSchemaError) as err:
+        validator.end()
+    assert err.value.reason == "truncated"
+
+
+@pytest.mark.asyncio
+async def test_generation_profile_caps_tokens_and_enforces_deadline(monkeypatch):
+    import time
+    from types import SimpleNamespace
+
+    from app.core.ai.groq_provider import GroqProvider
+    from app.core.ai.profiles import generation_profile, generation_profiles
+    from app.core.config import settings
+    from app.core.exceptions import ServiceException
+    from app.features.ai.ai_service import AIService
+
+    monkeypatch.setattr(
+        settings,
+        "AI_GENERATION_PROFILES",
+        {"room_turn": {"max_tokens": 123, "models": ["small-model"]}, "flaky_op": {"deadline_seconds": 0.5, "temperature": 0.7}},
+        raising=False,
+    )
+    room = generation_profiles.get("room_turn")
+    assert room.max_tokens == 123 and room.models == ("small-model",)
+    assert room.attempt_timeout_seconds == 15
+
+    sent: list[dict] = []
+
+    async def _fake_create(*, timeout, **kwargs):
+        sent.append({"timeout": timeout, **kwargs})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))])
+
+    provider = GroqProvider(model="m")
+    provider.api_key = "test"
+    monkeypatch.setattr(provider, "_create", _fake_create)
+
+    await provider.generate_text("no profile")
+    with generation_profile("room_turn"):
+        await provider.generate_text("short turn")
+    assert "max_tokens" not in sent[0] and sent[0]["timeout"] == settings.AI_REQUEST_TIMEOUT_SECONDS * 4
+    assert sent[1]["max_tokens"] == 123 and sent[1]["timeout"] <= 15
+
+    class _Unavailable(_CountingProvider):
+        def __init__(self):
+            super().__init__()
+            self.temperatures = []
+
+        async def generate_json(self, prompt, *, temperature=None):
+            self.calls += 1
+            self.temperatures.append(temperature)
+            raise RuntimeError("Error code: 503 - service unavailable")
+
+    flaky = _Unavailable()
+    started = time.monotonic()
+    with pytest.raises(ServiceException):
+        await AIService(provider=flaky)._generate_json_with_retries(
+            "deadline JSON", max_attempts=5, use_cache=False, operation="flaky_op"
+        )
+    # The first backoff (>= 1s) would outlive the 0.5s deadline, so no second attempt is made.
+    assert flaky.calls == 1 and flaky.temperatures == [0.7]
+    assert time.monotonic() - started < 0.5
+
+    # Hedged turns keep the caller's profile, not the generic "chat_turn" one.
+    from app.core.ai.profiles import current_profile
+    from app.features.ai.ai_service import ROOM_TURN_SHAPE
+
+    class _ProfileSpy(_CountingProvider):
+        def __init__(self):
+            super().__init__()
+            self.seen: list[str] = []
+
+        async def generate_json(self, prompt, *, temperature=None):
+            self.seen.append(current_profile().profile.operation)
+            return {"speaker": "A", "message": "hi"}
+
+    monkeypatch.setattr(settings, "AI_HEDGE_OPERATIONS", ["chat_turn"], raising=False)
+    spy = _ProfileSpy()
+    await AIService(provider=spy)._generate_turn_json(
+        "room turn JSON", temperature=None, shape=ROOM_TURN_SHAPE, operation="room_turn"
+    )
+    assert spy.seen == ["room_turn"]
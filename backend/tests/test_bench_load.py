@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+
+def test_latency_model_and_percentiles():
+    from bench.load import LatencyModel, percentile
+
+    assert LatencyModel.parse("fixed:50").sample_ms(random.Random(0)) == 50
+    uniform = LatencyModel.parse("uniform:30:10")
+    assert all(10 <= uniform.sample_ms(random.Random(i)) <= 30 for i in range(20))
+    with pytest.raises(ValueError):
+        LatencyModel.parse("lognormal:100")
+
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.05
+    assert percentile(values, 95) == 0.095
+    assert percentile(values, 99) == 0.099
+    assert percentile([], 99) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_load_run_reports_per_route_latency():
+    from bench.load import LatencyModel, SyntheticProvider, run_load
+    from app.features.ai.ai_service import ai_service
+
+    original = ai_service.provider
+    provider = SyntheticProvider(LatencyModel.parse("fixed:5"), seed=1)
+    summary = await run_load(
+        users=2,
+        duration=float("inf"),
+        iterations=4,
+        think_ms=0,
+        provider=provider,
+        weights={"chat_turn": 1, "memory_crud": 1},
+        seed=1,
+    )
+
+    assert ai_service.provider is original
+    assert summary["users"] == {"requested": 2, "ready": 2}
+    assert set(summary["setup"]["routes"]) == {
+        "POST /auth/register",
+        "POST /auth/login",
+        "POST /characters/me",
+        "POST /chat/sessions",
+    }
+    turn = summary["routes"]["POST /chat/sessions/{id}/turn"]
+    assert turn["errors"] == 0 and turn["count"] >= 1
+    assert turn["p50_ms"] <= turn["p95_ms"] <= turn["p99_ms"] <= turn["max_ms"]
+    assert provider.stats()["calls"] >= turn["count"]
+    assert sum(r["count"] for r in summary["routes"].values()) == summary["requests"]
+
+
+@pytest.mark.asyncio
+async def test_fault_scenario_reports_success_rate_and_retries():
+    from bench.faults import run_fault_scenario
+    from bench.load import LatencyModel
+
+    summary = await run_fault_scenario(
+        requests=12,
+        concurrency=3,
+        faults="ok*3,429:0,malformed",
+        latency=LatencyModel.parse("fixed:1"),
+        max_attempts=3,
+        breaker_threshold=100,
+    )
+
+    assert summary["injected"]["429"] >= 1 and summary["injected"]["malformed"] >= 1
+    assert summary["retries"]["rate_limit"] == summary["injected"]["429"]
+    # Malformed JSON is not retried, so each one costs exactly one failed request.
+    assert summary["requests"] - summary["succeeded"] == summary["injected"]["malformed"]
+    assert summary["success_rate"] == round(summary["succeeded"] / 12, 4)
+    assert summary["latency_all"]["count"] == 12
@@ -71,3 +71,163 @@ async def test_chat_character_session_and_turn_mocked(client, user_auth_headers,
     body = r3.json()
     assert body.get("session")
     assert body.get("assistant_turns")
+
+
+@pytest.mark.asyncio
+async def test_chat_character_turn_stream_mocked(client, user_auth_headers, monkeypatch):
+    import json
+
+    from app.features.ai import ai_service as ai_mod
+
+    class _ChunkedProvider:
+        model = "fake"
+
+        async def stream_json(self, prompt, *, temperature=None):
+            for chunk in ['{"action": "*wav', 'es*", "dia', 'logue": "Hel', 'lo \\u00e9"}']:
+                yield chunk
+
+    monkeypatch.setattr(ai_mod.ai_service, "provider", _ChunkedProvider(), raising=True)
+
+    r = await client.post(
+        "/api/v1/characters/me",
+        json={
+            "slug": "streamy",
+            "display_name": "Streamy",
+            "description": "d",
+            "system_prompt": "You are Streamy",
+            "is_public": False,
+            "is_nsfw": False,
+        },
+        headers=user_auth_headers,
+    )
+    assert r.status_code == 200, r.text
+    r2 = await client.post(
+        "/api/v1/chat/sessions",
+        json={"character_id": r.json()["id"], "room_id": None, "title": ""},
+        headers=user_auth_headers,
+    )
+    assert r2.status_code == 200, r2.text
+    sid = r2.json()["id"]
+
+    r3 = await client.post(
+        f"/api/v1/chat/sessions/{sid}/turn/stream",
+        json={"content": "hi"},
+        headers=user_auth_headers,
+    )
+    assert r3.status_code == 200, r3.text
+    assert r3.headers["content-type"].startswith("text/event-stream")
+
+    events: list[tuple[str, dict]] = []
+    for block in r3.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+
+    names = [e for e, _ in events]
+    assert names[0] == "user_turn"
+    assert names[-1] == "done"
+    streamed = {"action": "", "dialogue": ""}
+    for name, data in events:
+        if name == "delta":
+            streamed[data["kind"]] += data["text"]
+    assert streamed == {"action": "*waves*", "dialogue": "Hello é"}
+
+    done = events[-1][1]
+    assert [t["content"] for t in done["assistant_turns"]] == ["*waves*", "Hello é"]
+
+    r4 = await client.get(f"/api/v1/chat/sessions/{sid}", headers=user_auth_headers)
+    assert len(r4.json()["turns"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_chat_turn_is_cancelled_and_rolled_back_on_client_disconnect(app, client, user_auth_headers, monkeypatch):
+    import asyncio
+    import json
+
+    from app.core.metrics import chat_turns_discarded, client_disconnect_aborts
+    from app.features.ai import ai_service as ai_mod
+
+    class _HangingProvider:
+        model = "fake"
+
+        def __init__(self):
+            self.started = asyncio.Event()
+            self.cancelled = False
+
+        async def stream_json(self, prompt, *, temperature=None):
+            self.started.set()
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+            yield "{}"
+
+    provider = _HangingProvider()
+    monkeypatch.setattr(ai_mod.ai_service, "provider", provider, raising=True)
+
+    r = await client.post(
+        "/api/v1/characters/me",
+        json={
+            "slug": "leaver",
+            "display_name": "Leaver",
+            "description": "d",
+            "system_prompt": "You are Leaver",
+            "is_public": False,
+            "is_nsfw": False,
+        },
+        headers=user_auth_headers,
+    )
+    assert r.status_code == 200, r.text
+    r2 = await client.post(
+        "/api/v1/chat/sessions",
+        json={"character_id": r.json()["id"], "room_id": None, "title": ""},
+        headers=user_auth_headers,
+    )
+    assert r2.status_code == 200, r2.text
+    sid = r2.json()["id"]
+
+    aborts_before = client_disconnect_aborts.value(operation="chat_turn")
+    discarded_before = chat_turns_discarded.value()
+    body = json.dumps({"content": "hi"}).encode()
+    sent_body = False
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The user closes the app while the model is still generating.
+        await provider.started.wait()
+        return {"type": "http.disconnect"}
+
+    messages: list[dict] = []
+
+    async def send(message):
+        messages.append(message)
+
+    path = f"/api/v1/chat/sessions/{sid}/turn"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"test"), (b"content-type", b"application/json")]
+        + [(k.lower().encode(), v.encode()) for k, v in user_auth_headers.items()],
+        "client": ("127.0.0.1", 5000),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), timeout=10)
+
+    assert provider.cancelled
+    assert messages[0]["status"] == 499
+    assert client_disconnect_aborts.value(operation="chat_turn") == aborts_before + 1
+    assert chat_turns_discarded.value() == discarded_before + 1
+
+    detail = await client.get(f"/api/v1/chat/sessions/{sid}", headers=user_auth_headers)
+    assert detail.status_code == 200, detail.text
+    assert detail.json()["turns"] == []
@@ -0,0 +1,198 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_lesson_job_submit_run_and_poll(client, user_auth_headers, monkeypatch):
+    from app.features.ai import ai_service as ai_mod
+    from app.features.jobs.worker import job_worker_pool
+
+    calls = []
+
+    async def _fake_generate_lesson(**kwargs):
+        calls.append(kwargs)
+        return {"title": "Travel", "vocabulary": [], "exercises": []}
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_lesson", _fake_generate_lesson, raising=True)
+
+    r = await client.post(
+        "/api/v1/jobs/lesson",
+        json={
+            "topic": "Travel",
+            "target_language": "English",
+            "native_language": "Russian",
+            "level": "A1",
+            "prior_topics": ["Food"],
+            "opening_sentences": ["We eat bread."],
+        },
+        headers=user_auth_headers,
+    )
+    assert r.status_code == 202, r.text
+    job_id = r.json()["id"]
+    assert r.json()["status"] == "queued"
+
+    r = await client.get(f"/api/v1/jobs/{job_id}/result", headers=user_auth_headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["result"] is None
+
+    assert await job_worker_pool.run_pending_once() == 1
+    assert calls and calls[0]["topic"] == "Travel" and calls[0]["db"] is not None
+    assert calls[0]["prior_topics"] == ["Food"] and calls[0]["opening_sentences"] == ["We eat bread."]
+
+    r = await client.get(f"/api/v1/jobs/{job_id}", headers=user_auth_headers)
+    assert r.status_code == 200, r.text
+    assert r.json()["status"] == "succeeded"
+    assert r.json()["attempts"] == 1
+
+    r = await client.get(f"/api/v1/jobs/{job_id}/result", headers=user_auth_headers)
+    assert r.json()["result"]["title"] == "Travel"
+
+    # Nothing left to do; the job shows up in the owner's list.
+    assert await job_worker_pool.run_pending_once() == 0
+    r = await client.get("/api/v1/jobs/me", headers=user_auth_headers)
+    assert [j["id"] for j in r.json()] == [job_id]
+
+
+@pytest.mark.asyncio
+async def test_job_with_expired_lease_is_reclaimed_and_failure_recorded(client, user_auth_headers, db, monkeypatch):
+    from datetime import datetime, timedelta
+
+    from app.core.exceptions import ServiceException
+    from app.features.ai import ai_service as ai_mod
+    from app.features.jobs.models import GenerationJob
+    from app.features.jobs.worker import job_worker_pool
+
+    async def _failing_course_path(**kwargs):
+        raise ServiceException("AI Service is temporarily unavailable")
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_course_path", _failing_course_path, raising=True)
+
+    r = await client.post(
+        "/api/v1/jobs/course-path",
+        json={"target_language": "English", "native_language": "Russian", "level": "A1"},
+        headers=user_auth_headers,
+    )
+    job_id = r.json()["id"]
+
+    # Simulate a worker that claimed the job and then died.
+    job = await job_worker_pool.claim_next()
+    assert job is not None and str(job.id) == job_id
+    assert await job_worker_pool.claim_next() is None
+
+    row = await db.get(GenerationJob, job.id)
+    row.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    await db.commit()
+
+    assert await job_worker_pool.run_pending_once() == 1
+
+    r = await client.get(f"/api/v1/jobs/{job_id}/result", headers=user_auth_headers)
+    body = r.json()
+    assert body["status"] == "failed"
+    assert body["attempts"] == 2
+    assert "temporarily unavailable" in body["error"]
+
+
+@pytest.mark.asyncio
+async def test_lesson_library_serves_second_learner_with_personal_order(db, monkeypatch):
+    from app.features.ai import ai_service as ai_mod
+    from app.features.lesson_library.service import LessonLibraryService
+
+    calls = []
+
+    async def _fake_generate_lesson(**kwargs):
+        calls.append(kwargs)
+        return {
+            "text": "We travel by train.",
+            "vocabulary": [{"word": "train", "translation": "поезд"}, {"word": "ticket", "translation": "билет"}],
+            "exercises": [{"type": "quiz"}, {"type": "match"}],
+            "_meta": {"generation_mode": "balanced", "quality_status": "ok"},
+        }
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_lesson", _fake_generate_lesson, raising=True)
+
+    lib = LessonLibraryService(db)
+    first = await lib.get_or_generate(topic="Travel", target_language="English", native_language="Russian", level="A1")
+    assert first["_meta"]["library"] == {"hit": False, "stored": True}
+
+    # Same lesson key after normalization; personalization happens without the model.
+    second = await lib.get_or_generate(
+        topic="  travel!",
+        target_language="english",
+        native_language="Russian",
+        level="a1",
+        used_words=["Train"],
+        recent_exercise_types=["quiz"],
+    )
+    assert len(calls) == 1
+    assert second["_meta"]["library"]["hit"] is True
+    assert [v["word"] for v in second["vocabulary"]] == ["ticket", "train"]
+    assert [e["type"] for e in second["exercises"]] == ["match", "quiz"]
+
+    # A strict request is not served by a balanced variant.
+    await lib.get_or_generate(
+        topic="Travel", target_language="English", native_language="Russian", level="A1", generation_mode="strict"
+    )
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_lesson_library_ranks_variants_by_interests(db, monkeypatch):
+    from app.features.ai import ai_service as ai_mod
+    from app.features.lesson_library.service import LessonLibraryService
+
+    texts = iter(["We cook pasta at home.", "We play football on Sunday.", "We read a book."])
+    calls = []
+
+    async def _fake_generate_lesson(**kwargs):
+        calls.append(kwargs)
+        return {
+            "text": next(texts),
+            "vocabulary": [{"word": "home", "translation": "дом"}],
+            "exercises": [{"type": "quiz"}],
+            "_meta": {"generation_mode": "balanced", "quality_status": "ok"},
+        }
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_lesson", _fake_generate_lesson, raising=True)
+    lib = LessonLibraryService(db)
+    key = {"topic": "Weekend", "target_language": "English", "native_language": "Russian", "level": "A2"}
+
+    await lib.get_or_generate(**key, interests=["cooking"])
+    # No variant matches "sport" and there is room: a new variant is generated for these interests.
+    await lib.get_or_generate(**key, interests=["sport"])
+    assert [c["interests"] for c in calls] == [["cooking"], ["sport"]]
+
+    hit = await lib.get_or_generate(**key, interests=["Sport"])
+    assert len(calls) == 2
+    assert hit["text"] == "We play football on Sunday."
+    assert "library_interests" not in hit["_meta"]
+
+    # The text itself counts as a match.
+    hit = await lib.get_or_generate(**key, interests=["pasta"])
+    assert len(calls) == 2 and hit["text"] == "We cook pasta at home."
+
+
+@pytest.mark.asyncio
+async def test_course_path_job_commits_its_cache_writes(client, user_auth_headers, async_sessionmaker, monkeypatch):
+    from sqlalchemy import select
+
+    from app.features.ai import ai_service as ai_mod
+    from app.features.ai.models import LLMCacheEntry
+    from app.features.ai.repository import AIIOpsRepository
+    from app.features.jobs.worker import job_worker_pool
+
+    async def _caching_course_path(*, db, **kwargs):
+        await AIIOpsRepository(db).create_cache_entry(prompt_hash="job-path", prompt="p", response_json={"sections": []})
+        return {"sections": []}
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_course_path", _caching_course_path, raising=True)
+
+    r = await client.post(
+        "/api/v1/jobs/course-path",
+        json={"target_language": "English", "native_language": "Russian", "level": "A1"},
+        headers=user_auth_headers,
+    )
+    assert r.status_code == 202, r.text
+    assert await job_worker_pool.run_pending_once() == 1
+
+    async with async_sessionmaker() as s:
+        row = (await s.execute(select(LLMCacheEntry).where(LLMCacheEntry.prompt_hash == "job-path"))).scalars().first()
+    assert row is not None
@@ -0,0 +1,63 @@
+import pytest
+
+
+class _FlakyProvider:
+    model = "flaky-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_json(self, prompt, *, temperature=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("503 service unavailable, try again in 0s")
+        return {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_metrics_exposes_http_llm_and_cache_series(client, user_auth_headers, monkeypatch):
+    from app.core.ai.cache import prompt_cache
+    from app.core.ai.circuit_state import circuit_state
+    from app.core.config import settings
+    from app.core.metrics import metrics
+    from app.features.ai.ai_service import AIService
+
+    # Off by default; when enabled with a token, scrapes must present it.
+    assert (await client.get("/metrics")).status_code == 404
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True, raising=False)
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret", raising=False)
+    assert (await client.get("/metrics")).status_code == 401
+    assert (await client.get("/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+
+    metrics.clear()
+    prompt_cache.clear()
+    hits_before = prompt_cache.stats()["hits"]
+
+    r = await client.get("/api/v1/jobs/00000000-0000-0000-0000-000000000000", headers=user_auth_headers)
+    assert r.status_code == 404
+    await client.get("/definitely/not/here")
+
+    svc = AIService(provider=_FlakyProvider())
+    await svc._generate_json_with_retries("metrics prompt", use_cache=True, operation="lesson_plan")
+    await svc._generate_json_with_retries("metrics prompt", use_cache=True, operation="lesson_plan")
+
+    r = await client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    body = r.text
+
+    assert 'neurogloss_http_request_duration_seconds_count{method="GET",route="/api/v1/jobs/{job_id}",status="404"} 1' in body
+    assert 'route="unmatched",status="404"' in body
+    assert "00000000-0000" not in body
+    assert (
+        'neurogloss_llm_request_duration_seconds_count{provider="_FlakyProvider",model="flaky-model",'
+        'operation="lesson_plan",outcome="error"} 1'
+    ) in body
+    assert 'neurogloss_llm_retries_total{provider="_FlakyProvider",model="flaky-model",reason="transient"} 1' in body
+    assert 'neurogloss_llm_circuit_failures_total{key="_FlakyProvider:flaky-model"} 1' in body
+    assert f'neurogloss_prompt_cache_lookups_total{{result="hit"}} {hits_before + 1}' in body
+    assert 'neurogloss_db_pool_connections{state="checkedout"}' in body
+
+    circuit_state.clear()
+    AIService._circuit_seen_failures.clear()
+    prompt_cache.clear()
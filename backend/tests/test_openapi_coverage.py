@@ -30,10 +30,21 @@ COVERED_API_PATHS: set[str] = {
     "/api/v1/chat/sessions",
     "/api/v1/chat/sessions/{session_id}",
     "/api/v1/chat/sessions/{session_id}/turn",
+    "/api/v1/chat/sessions/{session_id}/turn/stream",
 
     "/api/v1/memory/me",
     "/api/v1/memory/me/{memory_id}",
 
+    "/api/v1/jobs/lesson",
+    "/api/v1/jobs/course-path",
+    "/api/v1/jobs/chat-learning-lesson",
+    "/api/v1/jobs/me",
+    "/api/v1/jobs/{job_id}",
+    "/api/v1/jobs/{job_id}/result",
+
+    "/api/v1/ai/admin/cache",
+    "/api/v1/ai/admin/cache/evict",
+
     "/api/v1/uploads/image",
     "/api/v1/uploads/presign",
 
@@ -32,6 +32,10 @@ async def test_openapi_full_run_executes_every_endpoint(
     async def _fake_generate_character_chat_turn_json(*, db, messages, temperature=None):
         return {"action": "*waves*", "dialogue": "Hello"}
 
+    async def _fake_stream_character_chat_turn_json(*, db, messages, temperature=None):
+        yield "delta", ("dialogue", "Hello")
+        yield "result", {"action": "*waves*", "dialogue": "Hello"}
+
     monkeypatch.setattr(uploads_service.UploadService, "upload_image_file", _fake_upload_image_file, raising=True)
     monkeypatch.setattr(
         ai_mod.ai_service,
@@ -39,6 +43,12 @@ async def test_openapi_full_run_executes_every_endpoint(
         _fake_generate_character_chat_turn_json,
         raising=True,
     )
+    monkeypatch.setattr(
+        ai_mod.ai_service,
+        "stream_character_chat_turn_json",
+        _fake_stream_character_chat_turn_json,
+        raising=True,
+    )
 
     # Discover OpenAPI endpoints.
     r = await client.get("/api/v1/openapi.json")
@@ -117,6 +127,20 @@ async def test_openapi_full_run_executes_every_endpoint(
         cache["chat_session_id"] = sid
         return sid
 
+    async def _ensure_job_id() -> str:
+        if "job_id" in cache:
+            return cache["job_id"]
+        rr = await client.post(
+            "/api/v1/jobs/course-path",
+            json={"target_language": "English", "native_language": "Russian", "level": "A1"},
+            headers=user_auth_headers,
+        )
+        assert rr.status_code == 202, rr.text
+        jid = rr.json().get("id")
+        assert jid
+        cache["job_id"] = jid
+        return jid
+
     async def _ensure_memory_id() -> str:
         if "memory_id" in cache:
             return cache["memory_id"]
@@ -456,6 +480,16 @@ async def test_openapi_full_run_executes_every_endpoint(
                 "expect": {200},
             }
 
+        if path == "/api/v1/chat/sessions/{session_id}/turn/stream" and method_u == "POST":
+            sid = await _ensure_chat_session_id()
+            return {
+                "method": method_u,
+                "url": f"/api/v1/chat/sessions/{sid}/turn/stream",
+                "json": {"content": "hi"},
+                "headers": user_auth_headers,
+                "expect": {200},
+            }
+
         if path == "/api/v1/memory/me" and method_u == "GET":
             return {"method": method_u, "url": path, "headers": user_auth_headers, "expect": {200}}
 
@@ -635,6 +669,51 @@ async def test_openapi_full_run_executes_every_endpoint(
                 "expect": {200, 400, 404},
             }
 
+        if path == "/api/v1/jobs/lesson" and method_u == "POST":
+            return {
+                "method": method_u,
+                "url": path,
+                "json": {"topic": "Travel", "target_language": "English", "native_language": "Russian", "level": "A1"},
+                "headers": user_auth_headers,
+                "expect": {202},
+            }
+
+        if path == "/api/v1/jobs/course-path" and method_u == "POST":
+            return {
+                "method": method_u,
+                "url": path,
+                "json": {"target_language": "English", "native_language": "Russian", "level": "A1"},
+                "headers": user_auth_headers,
+                "expect": {202},
+            }
+
+        if path == "/api/v1/jobs/chat-learning-lesson" and method_u == "POST":
+            sid = await _ensure_chat_session_id()
+            return {
+                "method": method_u,
+                "url": path,
+                "json": {"session_id": sid},
+                "headers": user_auth_headers,
+                "expect": {202, 400},
+            }
+
+        if path == "/api/v1/jobs/me" and method_u == "GET":
+            return {"method": method_u, "url": path, "headers": user_auth_headers, "expect": {200}}
+
+        if path == "/api/v1/jobs/{job_id}" and method_u == "GET":
+            jid = await _ensure_job_id()
+            return {"method": method_u, "url": f"/api/v1/jobs/{jid}", "headers": user_auth_headers, "expect": {200}}
+
+        if path == "/api/v1/jobs/{job_id}/result" and method_u == "GET":
+            jid = await _ensure_job_id()
+            return {"method": method_u, "url": f"/api/v1/jobs/{jid}/result", "headers": user_auth_headers, "expect": {200}}
+
+        if path == "/api/v1/ai/admin/cache" and method_u == "GET":
+            return {"method": method_u, "url": path, "headers": admin_auth_headers, "expect": {200}}
+
+        if path == "/api/v1/ai/admin/cache/evict" and method_u == "POST":
+            return {"method": method_u, "url": path, "headers": admin_auth_headers, "expect": {200}}
+
         raise AssertionError(f"No request mapping for {method_u} {path}")
 
     # Execute every OpenAPI operation.
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_pregenerate_is_bounded_and_resumable(tmp_path, async_sessionmaker, monkeypatch):
+    import asyncio
+
+    from app.cli.pregenerate import items_from_spec, run_pregeneration
+    from app.features.ai import ai_service as ai_mod
+    from app.features.ai.cache_maintenance import llm_cache_hits
+
+    state = {"active": 0, "peak": 0, "calls": 0}
+
+    async def _fake_generate_lesson(**kwargs):
+        state["calls"] += 1
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        await asyncio.sleep(0.01)
+        state["active"] -= 1
+        llm_cache_hits.record(f"hash-{kwargs['topic']}")
+        if kwargs["topic"] == "Broken":
+            raise RuntimeError("boom")
+        return {
+            "text": f"About {kwargs['topic']}.",
+            "vocabulary": [{"word": "w", "translation": "t"}],
+            "exercises": [{"type": "quiz"}],
+            "_meta": {"generation_mode": "balanced", "quality_status": "needs_review" if kwargs["topic"] == "Draft" else "ok"},
+        }
+
+    monkeypatch.setattr(ai_mod.ai_service, "generate_lesson", _fake_generate_lesson, raising=True)
+
+    spec = {
+        "sections": [
+            {"units": [{"topic": "Airport"}, {"topic": "Hotel"}, {"topic": "airport!"}]},
+            {"units": [{"topic": "Taxi"}, {"topic": "Broken"}, {"topic": "Draft"}]},
+        ]
+    }
+    items = items_from_spec(
+        spec, target_language="English", native_language="Russian", level="A1", generation_mode="balanced"
+    )
+    progress = tmp_path / "progress.jsonl"
+
+    summary = await run_pregeneration(items, concurrency=2, progress_path=progress, session_factory=async_sessionmaker)
+    assert summary == {"total": 5, "skipped": 0, "done": 3, "needs_review": 1, "not_stored": 0, "failed": 1}
+    assert state["peak"] <= 2
+    # Buffered cache hits are written before the run returns.
+    assert llm_cache_hits.pending() == 0
+
+    rows = [json.loads(line) for line in progress.read_text(encoding="utf-8").splitlines()]
+    from sqlalchemy import func, select
+
+    from app.features.lesson_library.models import LessonLibraryEntry
+
+    async with async_sessionmaker() as s:
+        assert (await s.execute(select(func.count()).select_from(LessonLibraryEntry))).scalar() == 3
+
+    statuses = {r["topic"]: r["status"] for r in rows}
+    assert statuses["Broken"] == "failed" and statuses["Draft"] == "needs_review"
+
+    # A rerun only retries what did not finish or was not stored in the library.
+    state["calls"] = 0
+    summary = await run_pregeneration(items, concurrency=2, progress_path=progress, session_factory=async_sessionmaker)
+    assert summary == {"total": 5, "skipped": 3, "done": 0, "needs_review": 1, "not_stored": 0, "failed": 1}
+    assert state["calls"] == 2